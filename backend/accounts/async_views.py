@@ -0,0 +1,108 @@
+# accounts/async_views.py
+#
+# Coroutine versions of the views in accounts/views.py, selected with the
+# API_ASYNC_VIEWS setting. Request parsing and response building are shared
+# with accounts/views.py, so responses are identical; only the I/O differs.
+from asgiref.sync import sync_to_async
+from rest_framework import status, permissions
+from livechat.async_views import AsyncAPIView
+from livechat.db_router import ReplicaReadsMixin
+from livechat.errors import RequestError
+from .utils import aconsume_otp, aissue_otp, name_from_email
+from .tasks import deliver_otp_emails
+from .models import User
+from .services.user_search_service import list_contacts, list_users
+from .views import (
+    check_otp_result,
+    otp_sent_response,
+    otp_throttled_response,
+    parse_login,
+    parse_user_list,
+    parse_verify,
+    user_list_response,
+    user_response,
+    verified_response,
+)
+
+
+class UserLoginView(AsyncAPIView):
+    """ View to handle user login via email base-OTP. """
+
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request):
+        email = parse_login(request)
+
+        # Rate limit check + store a new OTP + queue its email in one Redis round trip
+        code, retry_after = await aissue_otp(email)
+        if code is None:
+            return otp_throttled_response(retry_after)
+
+        # Check if user exists
+        user_exists = await User.objects.filter(email=email).aexists()
+
+        # issue_otp queued the email; wake an OTP worker to send it
+        await sync_to_async(deliver_otp_emails.delay)()
+
+        return otp_sent_response(user_exists)
+
+
+class UserVerifyView(AsyncAPIView):
+    """ View to handle email based OTP verification. """
+
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request):
+        email, otp = parse_verify(request)
+
+        # Check attempts, verify and consume the OTP in one atomic step
+        check_otp_result(await aconsume_otp(email, otp))
+
+        # Get or create user
+        user, created = await User.objects.aget_or_create(email=email, defaults={"name": name_from_email(email)})
+        return verified_response(user, created)
+
+
+class UserProfileView(AsyncAPIView):
+    """ View to retrieve user profile. """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        return user_response(request.user)
+
+
+class UserListView(ReplicaReadsMixin, AsyncAPIView):
+    """
+    View to list other users one page at a time, optionally by name/email prefix.
+
+    With `contacts=true` the first page also returns matching users the caller
+    already chats with, and those users are left out of every page.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request):
+        data, cursor = parse_user_list(request)
+
+        users, next_cursor = await sync_to_async(list_users)(
+            request.user, data["q"], cursor=cursor, limit=data["limit"], exclude_contacts=data["contacts"]
+        )
+        contacts = []
+        if data["contacts"] and cursor is None:
+            contacts = await sync_to_async(list_contacts)(request.user, data["q"])
+        return user_list_response(data, users, next_cursor, contacts)
+
+
+class UserRetrieveView(AsyncAPIView):
+    """ View to retrieve a user by ID. """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    async def get(self, request, id):
+        try:
+            user = await User.objects.aget(id=id)
+        except User.DoesNotExist:
+            raise RequestError("User not found", status.HTTP_404_NOT_FOUND)
+
+        return user_response(user)
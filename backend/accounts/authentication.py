@@ -0,0 +1,57 @@
+import copy
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .services.user_cache_service import aget_user, get_user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    SimpleJWT authentication that resolves the user through the user cache.
+
+    Tokens are validated exactly as before, and inactive, missing and
+    revoked users fail with the same errors; only the `accounts.User`
+    lookup is served from the process-local LRU and Redis, so warm
+    requests do not query the user table at all.
+    """
+
+    def get_user(self, validated_token):
+        return self.check_user(validated_token, get_user(self.get_user_id(validated_token)))
+
+    async def aauthenticate(self, request):
+        """ Async version of `authenticate`, used by `AsyncAPIView`. """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user = await aget_user(self.get_user_id(validated_token))
+        # Each request gets its own copy, as with `get_user`
+        user = copy.copy(user) if user is not None else None
+        return self.check_user(validated_token, user), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def check_user(self, validated_token, user):
+        """ Apply SimpleJWT's checks to a resolved user. """
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django_redis import get_redis_connection
+from accounts.services import otp_delivery_service
+from accounts.services.otp_delivery_service import build_otp_email, close_smtp_connection, deliver_pending
+
+BENCH_OUTBOX = "bench:otp:outbox"
+
+
+class StandInSMTPServer:
+    """
+    Just enough of an SMTP server to accept mail and throw it away.
+
+    Runs on its own event loop thread. `latency` seconds are added before
+    every reply, to stand in for the round trip to a real relay.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0), self.loop
+        ).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def reply(self, writer, line: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        await self.reply(writer, "220 bench.invalid ESMTP")
+        while line := await reader.readline():
+            command = line[:4].upper()
+            if command == b"EHLO":
+                await self.reply(writer, "250-bench.invalid\r\n250 8BITMIME")
+            elif command == b"DATA":
+                await self.reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                while await reader.readline() not in (b".\r\n", b""):
+                    pass
+                await self.reply(writer, "250 OK")
+            elif command == b"QUIT":
+                await self.reply(writer, "221 Bye")
+                break
+            else:
+                await self.reply(writer, "250 OK")
+        writer.close()
+
+
+class Command(BaseCommand):
+    help = "Measure OTP email throughput, one connection per email vs. pooled micro-batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--emails", type=int, default=500, help="Emails sent per mode.")
+        parser.add_argument(
+            "--latency", type=float, default=2.0, help="Milliseconds the stand-in server waits before each reply."
+        )
+
+    def handle(self, *args, **options):
+        total = options["emails"]
+        entries = [
+            {"email": f"bench{index}@bench.invalid", "code": "123456", "expires_at": time.time() + 3600}
+            for index in range(total)
+        ]
+        results = {}
+
+        with StandInSMTPServer(options["latency"] / 1000) as server, override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=server.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER="bench@bench.invalid",
+            EMAIL_HOST_PASSWORD="",
+        ):
+            # What send_otp_email_task used to do for every login
+            started = time.perf_counter()
+            for entry in entries:
+                message = build_otp_email(entry)
+                send_mail(message.subject, message.body, message.from_email, message.to)
+            results["per email"] = (time.perf_counter() - started, server.connections)
+
+            redis = get_redis_connection("default")
+            redis.delete(BENCH_OUTBOX)
+            server.connections = 0
+            try:
+                with mock.patch.object(otp_delivery_service, "OTP_OUTBOX_KEY", BENCH_OUTBOX):
+                    redis.rpush(BENCH_OUTBOX, *[json.dumps(entry) for entry in entries])
+                    started = time.perf_counter()
+                    while deliver_pending():
+                        pass
+                    results["pooled"] = (time.perf_counter() - started, server.connections)
+            finally:
+                close_smtp_connection()
+                redis.delete(BENCH_OUTBOX)
+
+        for mode, (seconds, connections) in results.items():
+            self.stdout.write(
+                f"{mode:>9}: {total} emails in {seconds:.2f}s over {connections} connection(s) "
+                f"({total / seconds:,.0f} emails/s)"
+            )
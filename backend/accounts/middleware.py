@@ -0,0 +1,75 @@
+from urllib.parse import parse_qs
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .services.user_cache_service import aget_user
+
+# Subprotocol that carries the token: new WebSocket(url, ["access_token", token])
+TOKEN_SUBPROTOCOL = "access_token"
+
+
+def get_token_from_scope(scope):
+    """
+    Extract a raw access token from a WebSocket scope.
+
+    The token is read from the `token` query parameter, or from the
+    subprotocol list sent by the client as `["access_token", <token>]`.
+
+    Args:
+        scope (dict): The ASGI connection scope.
+
+    Returns:
+        tuple: (token or None, accepted subprotocol or None)
+    """
+    query = parse_qs(scope.get("query_string", b"").decode())
+    if query.get("token"):
+        return query["token"][0], None
+
+    subprotocols = scope.get("subprotocols") or []
+    if TOKEN_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(TOKEN_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], TOKEN_SUBPROTOCOL
+
+    return None, None
+
+
+async def get_user_for_token(raw_token):
+    """
+    Validate a SimpleJWT access token and resolve its active user.
+
+    Token validation is purely cryptographic; the user itself is resolved
+    through the user cache, so most connections never touch the database.
+
+    Args:
+        raw_token (str | None): The raw access token.
+
+    Returns:
+        User | AnonymousUser: The authenticated user, or AnonymousUser.
+    """
+    if not raw_token:
+        return AnonymousUser()
+
+    try:
+        token = AccessToken(raw_token)
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return AnonymousUser()
+
+    user = await aget_user(user_id)
+    if user is None or not user.is_active:
+        return AnonymousUser()
+    return user
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """ Populate `scope["user"]` from the same access tokens the REST API accepts. """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token, subprotocol = get_token_from_scope(scope)
+        scope["user"] = await get_user_for_token(raw_token)
+        scope["auth_subprotocol"] = subprotocol
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 18:09
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_user_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('name'), models.F('id'), name='accounts_user_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('email'), models.F('id'), name='accounts_user_email_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 19:13
+
+import accounts.models
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='accounts_user_name_lower_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='accounts_user_email_lower_idx',
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(accounts.models.CodePointOrder(django.db.models.functions.text.Lower('name')), models.F('id'), name='accounts_user_name_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(accounts.models.CodePointOrder(django.db.models.functions.text.Lower('email')), models.F('id'), name='accounts_user_email_key_idx'),
+        ),
+    ]
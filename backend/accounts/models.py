@@ -1,6 +1,29 @@
 from django.db import models
+from django.db.models import F, Func
+from django.db.models.functions import Lower
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser
 
+
+class CodePointOrder(Func):
+    """
+    `expression` compared and sorted by code point, whatever the column's collation.
+
+    Prefix ranges like `[prefix, next prefix)` only hold in this order. It is
+    SQLite's default BINARY collation already; Postgres needs `COLLATE "C"`,
+    which also lets its btree indexes serve the range and LIKE prefixes.
+    """
+
+    template = "%(expressions)s"
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='%(expressions)s COLLATE "C"', **extra_context)
+
+
+def search_key(field):
+    """ The key users are prefix-searched and listed by: the lowercased `field`, in code point order. """
+    return CodePointOrder(Lower(field))
+
+
 # Custom User Manager
 class UserManager(BaseUserManager):
     def create_user(self, email, name, password=None):
@@ -55,6 +78,13 @@ class User(AbstractBaseUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["name"]
 
+    class Meta:
+        indexes = [
+            # Case-insensitive prefix search in the user picker, ordered by (key, id)
+            models.Index(search_key("name"), F("id"), name="accounts_user_name_key_idx"),
+            models.Index(search_key("email"), F("id"), name="accounts_user_email_key_idx"),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -12,4 +12,11 @@ class UserVerifySerializer(serializers.Serializer):
 class UserDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ["id", "name", "email", "created_at"]
\ No newline at end of file
+        fields = ["id", "name", "email", "created_at"]
+
+
+class UserListQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, allow_blank=True, max_length=255, default="")
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=100, default=50)
+    contacts = serializers.BooleanField(required=False, default=False)
@@ -0,0 +1,112 @@
+import json
+import smtplib
+import time
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django_redis import get_redis_connection
+from ..utils import OTP_OUTBOX_KEY, OTP_TTL_SECONDS
+
+# Limits
+BATCH_SIZE = 50      # Emails popped from the outbox per round trip
+MAX_BATCHES = 20     # Batches sent per run before yielding the worker
+
+# One SMTP connection per worker process, opened on first use and kept
+# open between runs, so a burst of logins pays for a single handshake.
+_connection = None
+
+
+def smtp_connection():
+    """
+    Return this worker's pooled SMTP connection, opening it if needed.
+
+    Returns:
+        BaseEmailBackend: An open connection of the configured `EMAIL_BACKEND`.
+    """
+    global _connection
+    if _connection is None:
+        _connection = get_connection(fail_silently=False)
+    _connection.open()
+    return _connection
+
+
+def close_smtp_connection() -> None:
+    """ Close the pooled connection; the next send opens a fresh one. """
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        finally:
+            _connection = None
+
+
+def build_otp_email(entry: dict) -> EmailMessage:
+    """ Build the email for one outbox entry. """
+    return EmailMessage(
+        subject="Your OTP code",
+        body=f"Your OTP is {entry['code']}. It expires in {OTP_TTL_SECONDS // 60} minutes.",
+        from_email=settings.EMAIL_HOST_USER,
+        to=[entry["email"]],
+    )
+
+
+def send_email(message: EmailMessage) -> None:
+    """
+    Send one email over the pooled connection.
+
+    A server that dropped the idle connection is reconnected to once
+    before giving up.
+    """
+    try:
+        smtp_connection().send_messages([message])
+    except smtplib.SMTPServerDisconnected:
+        close_smtp_connection()
+        smtp_connection().send_messages([message])
+
+
+def deliver_pending(batch_size: int = BATCH_SIZE, max_batches: int = MAX_BATCHES) -> int:
+    """
+    Send the OTP emails waiting in the outbox, in micro-batches.
+
+    Each batch is one LPOP from Redis, then one SMTP transaction per email
+    over the pooled connection. Entries whose code has already expired are
+    dropped unsent. When sending fails, the unsent rest of the batch goes
+    back to the head of the outbox, in order, and the error is raised so
+    the task can retry.
+
+    Args:
+        batch_size (int): Emails popped per batch.
+        max_batches (int): Batches sent before returning.
+
+    Raises:
+        smtplib.SMTPException | OSError: The mail server could not be reached
+            or refused the batch.
+
+    Returns:
+        int: The number of emails sent.
+    """
+    redis = get_redis_connection("default")
+    sent = 0
+    for _ in range(max_batches):
+        raw_entries = redis.lpop(OTP_OUTBOX_KEY, batch_size)
+        if not raw_entries:
+            break
+
+        now = time.time()
+        for index, raw_entry in enumerate(raw_entries):
+            entry = json.loads(raw_entry)
+            if entry["expires_at"] <= now:
+                continue
+            try:
+                send_email(build_otp_email(entry))
+            except smtplib.SMTPRecipientsRefused:
+                # A bad address never gets better, so don't retry it
+                continue
+            except (smtplib.SMTPException, OSError):
+                close_smtp_connection()
+                redis.lpush(OTP_OUTBOX_KEY, *reversed(raw_entries[index:]))
+                raise
+            sent += 1
+
+        if len(raw_entries) < batch_size:
+            break
+    return sent
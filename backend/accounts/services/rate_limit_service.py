@@ -1,57 +1,145 @@
-from django.core.cache import cache
+import uuid
+from collections import namedtuple
+from django_redis import get_redis_connection
+from livechat.async_redis import get_async_redis_connection
 
-# Limits
-OTP_PER_MINUTE = 1       # Max OTP requests per minute per email
-VERIFY_PER_CODE = 3      # Max verification attempts per OTP code
+# Algorithms
+SLIDING_WINDOW = "sliding_window"
+TOKEN_BUCKET = "token_bucket"
 
-# Time windows
-ONE_MINUTE = 60          # seconds
-OTP_TTL = 300            # seconds (5 minutes)
+# `limit` hits per `period` seconds. A sliding window allows at most `limit`
+# hits in any `period`; a token bucket holds `limit` tokens and refills
+# them evenly over `period`, so bursts are allowed up to `limit`.
+Policy = namedtuple("Policy", ["algorithm", "limit", "period"])
 
-def can_send_otp(email: str) -> bool:
+# Both scripts read the clock on the Redis server, so app servers with
+# skewed clocks share one timeline. They grant up to `count` hits and
+# return {hits granted, retry after ms}.
+
+# Lua helpers shared with scripts that rate limit as one of several steps.
+# Record up to `count` hits in the sorted-set log at `key`, as many as fit
+# under `limit` hits in the last `period` ms; return the number recorded and
+# the ms until one more would fit (0 when all were recorded).
+SLIDING_WINDOW_LUA = """
+local function sliding_window_hits(key, limit, period, hit_id, count)
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - period)
+    local granted = math.max(0, math.min(count, limit - redis.call('ZCARD', key)))
+    for i = 1, granted do
+        redis.call('ZADD', key, now, hit_id .. ':' .. i)
+    end
+    if granted > 0 then
+        redis.call('PEXPIRE', key, period)
+    end
+    if granted == count then
+        return granted, 0
+    end
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    return granted, tonumber(oldest[2]) + period - now
+end
+
+local function sliding_window_hit(key, limit, period, hit_id)
+    return sliding_window_hits(key, limit, period, hit_id, 1)
+end
+"""
+
+# KEYS: hit log (sorted set)  ARGV: limit, period ms, unique hit id, count
+SLIDING_WINDOW_SCRIPT = SLIDING_WINDOW_LUA + """
+local granted, retry_after = sliding_window_hits(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], tonumber(ARGV[4]))
+return {granted, retry_after}
+"""
+
+# KEYS: bucket (hash of tokens, updated_at)  ARGV: capacity, period ms, count
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local capacity = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local count = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * capacity / period)
+local granted = math.min(count, math.floor(tokens))
+local retry_after = 0
+tokens = tokens - granted
+if granted < count then
+    retry_after = math.ceil((1 - tokens) * period / capacity)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], period)
+return {granted, retry_after}
+"""
+
+
+def sliding_window(limit: int, period: float) -> Policy:
+    """ At most `limit` hits in any `period` seconds. """
+    return Policy(SLIDING_WINDOW, limit, period)
+
+
+def token_bucket(limit: int, period: float) -> Policy:
+    """ Bursts of up to `limit` hits, refilled evenly over `period` seconds. """
+    return Policy(TOKEN_BUCKET, limit, period)
+
+
+def _script_args(key: str, policy: Policy, count: int = 1) -> tuple:
+    """ The EVAL arguments that charge `count` hits to `key` under `policy`. """
+    period_ms = int(policy.period * 1000)
+    if policy.algorithm == SLIDING_WINDOW:
+        return SLIDING_WINDOW_SCRIPT, 1, key, policy.limit, period_ms, uuid.uuid4().hex, count
+    if policy.algorithm == TOKEN_BUCKET:
+        return TOKEN_BUCKET_SCRIPT, 1, key, policy.limit, period_ms, count
+    raise ValueError(f"Unknown rate limit algorithm: {policy.algorithm}")
+
+
+def hit(key: str, policy: Policy) -> tuple:
     """
-    Check if the user can request a new OTP based on rate limits.
+    Count one hit against `key`, unless that would break `policy`.
+
+    The check and the update are one Lua script, so concurrent hits can
+    never overshoot the limit, and each check is one Redis round trip.
+    Rejected hits are not counted.
 
     Args:
-        email (str): The user's email address.
+        key (str): What is limited, e.g. "ratelimit:send:otp:<email>".
+        policy (Policy): The limit to enforce.
 
     Returns:
-        bool: True if the OTP request is allowed, False if rate limits are exceeded.
+        tuple: (allowed, retry_after) where retry_after is the number of
+        seconds until a hit would be allowed, 0 when allowed.
     """
-    ratelimit_key = f"ratelimit:send:otp:{email}"
-
-    # Per-minute limit
-    if cache.get(ratelimit_key):
-        return False
+    granted, retry_after = hit_many(key, policy, 1)
+    return bool(granted), retry_after
 
-    # Update counters
-    cache.set(ratelimit_key, 1, timeout=ONE_MINUTE)
 
-        
-    return True
+async def ahit(key: str, policy: Policy) -> tuple:
+    """ Async version of `hit`, on the asyncio Redis client. """
+    granted, retry_after = await ahit_many(key, policy, 1)
+    return bool(granted), retry_after
 
 
-def can_verify_otp(email: str, otp: str) -> bool:
+def hit_many(key: str, policy: Policy, count: int) -> tuple:
     """
-    Check if the user can verify an OTP based on rate limits.
+    Count up to `count` hits against `key`, as many as `policy` allows.
+
+    For charging a batch per item in one round trip: the first `granted`
+    items go through and the rest are rejected, without being counted.
 
     Args:
-        email (str): The user's email address.
-        otp (str): The OTP code being verified.
-        
+        key (str): What is limited.
+        policy (Policy): The limit to enforce.
+        count (int): Hits asked for.
+
     Returns:
-        bool: True if the OTP verification is allowed, False if rate limits are exceeded.
+        tuple: (granted, retry_after) where retry_after is the number of
+        seconds until one more hit would be allowed, 0 when all were.
     """
-    ratelimit_key = f"ratelimit:verify:otp:{email}:{otp}"
-
-    code_attempts = cache.get(ratelimit_key)
-    if code_attempts is None:
-        
-        cache.set(ratelimit_key, 1, timeout=OTP_TTL)
-        return True
-
-    if code_attempts >= VERIFY_PER_CODE:
-        return False
-    
-    cache.incr(ratelimit_key)
-    return True
+    granted, retry_after = get_redis_connection("default").eval(*_script_args(key, policy, count))
+    return granted, retry_after / 1000
+
+
+async def ahit_many(key: str, policy: Policy, count: int) -> tuple:
+    """ Async version of `hit_many`, on the asyncio Redis client. """
+    granted, retry_after = await get_async_redis_connection().eval(*_script_args(key, policy, count))
+    return granted, retry_after / 1000
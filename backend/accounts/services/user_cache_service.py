@@ -0,0 +1,159 @@
+import asyncio
+import copy
+import random
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from accounts.models import User
+
+# Limits
+LOCAL_CACHE_SIZE = 10_000  # Users kept in process memory, least recently used dropped first
+
+# Time windows
+USER_CACHE_TTL = 60      # seconds a user stays in Redis
+LOCAL_CACHE_TTL = 5      # seconds a user stays in process memory
+
+# Process-local LRU tier: str(user_id) -> (expires_at, user), oldest use first.
+# Shared by the event loop and request threads, so guarded by a lock.
+_local_users = OrderedDict()
+_local_lock = threading.Lock()
+
+# Lookups currently in flight in this process: str(user_id) -> Future
+_pending_lookups = {}
+
+
+def user_cache_key(user_id) -> str:
+    """
+    Generate a cache key for storing a resolved user.
+
+    Args:
+        user_id (int | str): The user's ID.
+
+    Returns:
+        str: A string cache key in the format "user:<id>".
+    """
+    return f"user:{user_id}"
+
+
+def _get_local(user_id):
+    with _local_lock:
+        entry = _local_users.get(user_id)
+        if entry is None:
+            return None
+
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del _local_users[user_id]
+            return None
+        _local_users.move_to_end(user_id)
+        return user
+
+
+def _set_local(user_id, user) -> None:
+    with _local_lock:
+        _local_users[user_id] = (time.monotonic() + LOCAL_CACHE_TTL, user)
+        _local_users.move_to_end(user_id)
+        while len(_local_users) > LOCAL_CACHE_SIZE:
+            _local_users.popitem(last=False)
+
+
+def _load_user(user_id):
+    """
+    Load a user from Redis, falling back to the database on a miss.
+
+    The Redis TTL is jittered so that users cached together during a burst
+    do not all expire, and hit the database, at the same moment.
+    """
+    user = cache.get(user_cache_key(user_id))
+    if user is not None:
+        return user
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        timeout = USER_CACHE_TTL + random.randint(0, USER_CACHE_TTL // 4)
+        cache.set(user_cache_key(user_id), user, timeout=timeout)
+    return user
+
+
+async def aget_user(user_id):
+    """
+    Resolve a user by ID through the local, Redis and database tiers.
+
+    Concurrent lookups for the same user in one process share a single
+    Redis/database round trip, so a reconnect storm costs at most one
+    query per user per process instead of one per socket.
+
+    Args:
+        user_id (int | str): The user's ID.
+
+    Returns:
+        User | None: The user, or None if no such user exists.
+    """
+    user_id = str(user_id)
+    user = _get_local(user_id)
+    if user is not None:
+        return user
+
+    pending = _pending_lookups.get(user_id)
+    if pending is not None:
+        return await pending
+
+    future = asyncio.get_running_loop().create_future()
+    _pending_lookups[user_id] = future
+    try:
+        user = await sync_to_async(_load_user)(user_id)
+    except Exception as exc:
+        future.set_exception(exc)
+        # Mark retrieved so an unawaited future does not log a warning
+        future.exception()
+        raise
+    else:
+        if user is not None:
+            _set_local(user_id, user)
+        future.set_result(user)
+        return user
+    finally:
+        _pending_lookups.pop(user_id, None)
+
+
+def get_user(user_id):
+    """
+    Resolve a user by ID through the local, Redis and database tiers.
+
+    The synchronous counterpart of `aget_user`, for request threads. Each
+    call gets its own copy, so a request that changes its user cannot leak
+    the change into other requests through the shared cache.
+
+    Args:
+        user_id (int | str): The user's ID.
+
+    Returns:
+        User | None: The user, or None if no such user exists.
+    """
+    user_id = str(user_id)
+    user = _get_local(user_id)
+    if user is None:
+        user = _load_user(user_id)
+        if user is None:
+            return None
+        _set_local(user_id, user)
+    return copy.copy(user)
+
+
+def invalidate_user(user_id) -> None:
+    """
+    Drop a user from the Redis tier and from this process's local tier.
+
+    Other processes drop their local copy within `LOCAL_CACHE_TTL`.
+
+    Args:
+        user_id (int | str): The user's ID.
+
+    Returns:
+        None
+    """
+    with _local_lock:
+        _local_users.pop(str(user_id), None)
+    cache.delete(user_cache_key(user_id))
@@ -0,0 +1,148 @@
+import base64
+import json
+import sys
+from django.db.models import Q
+from accounts.models import User, search_key
+from chat.models import ConversationParticipant
+from chat.pagination import InvalidCursor
+
+# Limits
+CONTACTS_LIMIT = 20      # Boosted contacts returned on the first page
+
+# Fields matched by a prefix search, in the order their matches are listed
+SEARCH_FIELDS = ("name", "email")
+
+
+def encode_user_cursor(field: str, key, user_id: int) -> str:
+    """ Encode the (field, key, id) position of the last listed user. """
+    payload = json.dumps([field, key, user_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_user_cursor(cursor: str) -> tuple:
+    """
+    Decode a cursor produced by `encode_user_cursor`.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        field, key, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+    if field not in ("id", *SEARCH_FIELDS) or not isinstance(user_id, int):
+        raise InvalidCursor("Invalid cursor")
+    if field != "id" and not isinstance(key, str):
+        raise InvalidCursor("Invalid cursor")
+    return field, key, user_id
+
+
+def prefix_match(field: str, prefix: str) -> Q:
+    """
+    Match users whose `field` search key starts with `prefix`.
+
+    The keys are in code point order (see `search_key`), where the
+    half-open range below holds exactly those keys and is what the key
+    indexes scan.
+    """
+    lookups = {f"{field}_key__gte": prefix}
+    if ord(prefix[-1]) < sys.maxunicode:
+        lookups[f"{field}_key__lt"] = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    else:
+        lookups[f"{field}_key__startswith"] = prefix
+    return Q(**lookups)
+
+
+def contact_ids(user):
+    """ Subquery of the users sharing a conversation with `user`. """
+    return (
+        ConversationParticipant.objects
+        .filter(conversation__participants__user=user)
+        .exclude(user=user)
+        .values("user_id")
+    )
+
+
+def list_users(user, query: str = "", cursor=None, limit: int = 50, exclude_contacts: bool = False):
+    """
+    List one page of users for the new chat picker, excluding `user`.
+
+    Without a query users are listed by id. With a query, name matches
+    are listed first and email matches second, each in index order, so
+    every page is a bounded index range scan whatever the table size.
+
+    Args:
+        user (User): The requesting user.
+        query (str): Optional case-insensitive prefix of a name or email.
+        cursor (tuple | None): A decoded cursor to continue from.
+        limit (int): Page size.
+        exclude_contacts (bool): Leave out users returned by `list_contacts`.
+
+    Returns:
+        tuple: (users, next_cursor) where next_cursor is None on the last page.
+    """
+    prefix = query.strip().lower()
+    users = (
+        User.objects
+        .filter(is_active=True)
+        .exclude(id=user.id)
+        .annotate(name_key=search_key("name"), email_key=search_key("email"))
+    )
+    if exclude_contacts:
+        users = users.exclude(id__in=contact_ids(user))
+
+    if not prefix:
+        if cursor is not None:
+            users = users.filter(id__gt=cursor[2])
+        page = list(users.order_by("id")[:limit + 1])
+        next_cursor = encode_user_cursor("id", None, page[limit - 1].id) if len(page) > limit else None
+        return page[:limit], next_cursor
+
+    fields = SEARCH_FIELDS
+    if cursor is not None and cursor[0] in SEARCH_FIELDS:
+        fields = SEARCH_FIELDS[SEARCH_FIELDS.index(cursor[0]):]
+
+    page = []
+    for field in fields:
+        matches = users.filter(prefix_match(field, prefix))
+        # Users already listed in an earlier phase; NULL keys never matched
+        for earlier in SEARCH_FIELDS[:SEARCH_FIELDS.index(field)]:
+            matches = matches.exclude(prefix_match(earlier, prefix) & Q(**{f"{earlier}_key__isnull": False}))
+
+        if cursor is not None and cursor[0] == field:
+            _, key, user_id = cursor
+            matches = matches.filter(Q(**{f"{field}_key__gt": key}) | Q(**{f"{field}_key": key, "id__gt": user_id}))
+
+        rows = list(matches.order_by(f"{field}_key", "id")[:limit + 1 - len(page)])
+        page.extend((field, row) for row in rows)
+        if len(page) > limit:
+            break
+
+    next_cursor = None
+    if len(page) > limit:
+        field, last = page[limit - 1]
+        next_cursor = encode_user_cursor(field, getattr(last, f"{field}_key"), last.id)
+    return [row for _, row in page[:limit]], next_cursor
+
+
+def list_contacts(user, query: str = ""):
+    """
+    List the users sharing a conversation with `user`, for boosting.
+
+    Args:
+        user (User): The requesting user.
+        query (str): Optional case-insensitive prefix of a name or email.
+
+    Returns:
+        list: Up to `CONTACTS_LIMIT` users ordered by name.
+    """
+    prefix = query.strip().lower()
+    contacts = (
+        User.objects
+        .filter(is_active=True, id__in=contact_ids(user))
+        .annotate(name_key=search_key("name"), email_key=search_key("email"))
+    )
+    if prefix:
+        contacts = contacts.filter(prefix_match("name", prefix) | prefix_match("email", prefix))
+    return list(contacts.order_by("name_key", "id")[:CONTACTS_LIMIT])
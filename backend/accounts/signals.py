@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import User
+from .services.user_cache_service import invalidate_user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, created=False, **kwargs):
+    """
+    Keep the user cache in step with saves, deactivations and deletions.
+
+    Dropped right away, and again on commit in case a concurrent request
+    cached the old row before the change became visible. `QuerySet.update()`
+    sends no signal; call `invalidate_user` after bulk updates.
+    """
+    if created:
+        # Nothing can have cached a row that did not exist
+        return
+
+    user_id = instance.pk
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
@@ -1,34 +1,29 @@
 # users/tasks.py
-from django.core.mail import send_mail
+import smtplib
 from celery import shared_task
-from django.conf import settings
+from .services.otp_delivery_service import deliver_pending
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=30)
-def send_otp_email_task(self, email: str, code: str):
-    """
-    Send a one-time password (OTP) to a user's email address.
 
-    This Celery task sends an OTP email asynchronously to avoid blocking the main
-    request/response cycle. It retries up to `max_retries` times with a delay of 
-    `default_retry_delay` seconds in case of failures (e.g., SMTP errors).
+@shared_task(bind=True, ignore_result=True, max_retries=3, default_retry_delay=5)
+def deliver_otp_emails(self):
+    """
+    Send the one-time password (OTP) emails queued in the Redis outbox.
 
-    Args:
-        email (str): The recipient's email address.
-        code (str): The OTP code to send.
+    Logins push the email onto the outbox and queue this task as a kick on
+    the dedicated "otp" queue, so mail never waits behind other background
+    work. Whichever run gets there first drains everything queued so far
+    over the worker's pooled SMTP connection; runs that find the outbox
+    empty return at once. Celery beat also runs it every few seconds to
+    pick up emails put back after a failed send. Nothing reads a result,
+    so none is stored.
 
     Raises:
-        self.retry: Retries the task if email sending fails.
+        self.retry: Retries the task if the mail server fails.
 
     Returns:
         None
     """
     try:
-        send_mail(
-            subject="Your OTP code",
-            message=f"Your OTP is {code}. It expires in 5 minutes.",
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[email],
-            fail_silently=False,
-        )
-    except Exception as exc:
+        deliver_pending()
+    except (smtplib.SMTPException, OSError) as exc:
         raise self.retry(exc=exc)
@@ -1,3 +1,514 @@
-from django.test import TestCase
+import asyncio
+import json
+import smtplib
+import threading
+import time
+import uuid
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.db import connection
+from django_redis import get_redis_connection
+from django.test import TestCase, override_settings
+from django.urls import include, path
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from chat import async_views as chat_async_views
+from chat.models import Conversation, ConversationParticipant
+from chat.urls import api_urlpatterns as chat_urlpatterns
+from . import async_views
+from .middleware import JWTAuthMiddleware
+from .models import User, search_key
+from .services import otp_delivery_service
+from .services.otp_delivery_service import close_smtp_connection, deliver_pending
+from .services.rate_limit_service import hit, hit_many, sliding_window, token_bucket
+from .services.user_cache_service import invalidate_user
+from .throttles import RedisScopedThrottle
+from .urls import api_urlpatterns
+from .utils import (
+    OTP_INVALID, OTP_OUTBOX_KEY, OTP_VERIFIED, consume_otp, issue_otp, otp_key, otp_send_limit_key,
+)
 
-# Create your tests here.
+
+class JWTAuthMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.token = str(AccessToken.for_user(self.user))
+        invalidate_user(self.user.id)
+        self.addCleanup(invalidate_user, self.user.id)
+
+    async def resolve(self, query_string=b"", subprotocols=None):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        scope = {"type": "websocket", "query_string": query_string, "subprotocols": subprotocols or []}
+        await JWTAuthMiddleware(app)(scope, None, None)
+        return scopes[0]
+
+    async def test_token_from_query_string(self):
+        scope = await self.resolve(query_string=f"token={self.token}".encode())
+        self.assertEqual(scope["user"], self.user)
+        self.assertIsNone(scope["auth_subprotocol"])
+
+    async def test_token_from_subprotocol(self):
+        scope = await self.resolve(subprotocols=["access_token", self.token])
+        self.assertEqual(scope["user"], self.user)
+        self.assertEqual(scope["auth_subprotocol"], "access_token")
+
+    async def test_invalid_token_is_anonymous(self):
+        scope = await self.resolve(query_string=b"token=not-a-jwt")
+        self.assertFalse(scope["user"].is_authenticated)
+
+    async def test_missing_token_is_anonymous(self):
+        scope = await self.resolve()
+        self.assertFalse(scope["user"].is_authenticated)
+
+    async def test_inactive_user_is_anonymous(self):
+        self.user.is_active = False
+        await self.user.asave()
+        scope = await self.resolve(query_string=f"token={self.token}".encode())
+        self.assertFalse(scope["user"].is_authenticated)
+
+    def test_reconnect_storm_queries_the_user_once(self):
+        async def storm():
+            return await asyncio.gather(*[
+                self.resolve(query_string=f"token={self.token}".encode()) for _ in range(50)
+            ])
+
+        with CaptureQueriesContext(connection) as context:
+            scopes = async_to_sync(storm)()
+            scopes += async_to_sync(storm)()
+
+        self.assertTrue(all(scope["user"] == self.user for scope in scopes))
+        self.assertEqual(len(context.captured_queries), 1)
+
+
+class UserListViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="me@example.com", name="Me")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_users(self, *pairs):
+        return [User.objects.create_user(email=email, name=name) for name, email in pairs]
+
+    def fetch(self, **params):
+        response = self.client.get("/api/v1/accounts/users/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def fetch_all(self, **params):
+        data = self.fetch(**params)
+        users = list(data["results"])
+        while data["next_cursor"]:
+            data = self.fetch(cursor=data["next_cursor"], **params)
+            users += data["results"]
+        return [user["email"] for user in users]
+
+    def test_pages_cover_everyone_but_the_caller(self):
+        users = self.create_users(*[(f"User {index}", f"user{index}@example.com") for index in range(7)])
+
+        self.assertEqual(self.fetch_all(limit=3), [user.email for user in users])
+
+    def test_prefix_search_on_name_then_email(self):
+        self.create_users(
+            ("Anna", "zed@example.com"),
+            ("annabel", "annabel@example.com"),
+            ("Zoe", "ann.z@example.com"),
+            ("Bob", "bob@example.com"),
+            (None, "ANNIE@example.com"),
+        )
+
+        self.assertEqual(
+            self.fetch_all(q="ANN", limit=2),
+            ["zed@example.com", "annabel@example.com", "ann.z@example.com", "ANNIE@example.com"],
+        )
+
+    def test_prefix_ending_in_punctuation(self):
+        self.create_users(
+            ("Ann", "ann.z@example.com"),
+            ("Annie", "ann@example.com"),
+            ("Anna", "anna@example.com"),
+            ("X", "ann-x@example.com"),
+        )
+
+        self.assertEqual(self.fetch_all(q="ann."), ["ann.z@example.com"])
+        self.assertEqual(self.fetch_all(q="ann@"), ["ann@example.com"])
+
+    def test_search_key_ignores_the_postgres_collation(self):
+        # Prefix ranges assume code point order, which only "C" guarantees there
+        query = User.objects.annotate(key=search_key("name")).query
+        sql, _ = query.annotations["key"].as_postgresql(query.get_compiler(connection=connection), connection)
+        self.assertTrue(sql.endswith('COLLATE "C"'))
+
+    def test_contacts_are_boosted(self):
+        contact, stranger = self.create_users(("Sam Contact", "sam@example.com"), ("Sam Stranger", "sams@example.com"))
+        conversation = Conversation.objects.create()
+        ConversationParticipant.objects.create(conversation=conversation, user=self.user)
+        ConversationParticipant.objects.create(conversation=conversation, user=contact)
+
+        data = self.fetch(q="sam", contacts="true")
+
+        self.assertEqual([user["id"] for user in data["contacts"]], [contact.id])
+        self.assertEqual([user["id"] for user in data["results"]], [stranger.id])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/v1/accounts/users/", {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_prefix_search_uses_the_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Plan check is written for SQLite")
+
+        self.create_users(*[(f"User {index}", f"user{index}@example.com") for index in range(20)])
+        with CaptureQueriesContext(connection) as context:
+            self.fetch(q="user 1", limit=5)
+
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + context.captured_queries[-1]["sql"])
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn("accounts_user_name_key_idx", plan)
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+
+class AsyncURLConf:
+    """ The API routed to the coroutine views, as with API_ASYNC_VIEWS=True. """
+
+    urlpatterns = [
+        path("api/v1/accounts/", include(api_urlpatterns(async_views))),
+        path("api/v1/chat/", include(chat_urlpatterns(chat_async_views))),
+    ]
+
+
+def clear_rate_limits():
+    """ Forget the throttle state earlier requests left in Redis. """
+    redis = get_redis_connection("default")
+    keys = redis.keys("ratelimit:create_chat.*") + redis.keys("ratelimit:send_message.*")
+    if keys:
+        redis.delete(*keys)
+
+
+class RateLimiterTests(TestCase):
+
+    def setUp(self):
+        self.key = f"ratelimit:test:{uuid.uuid4().hex}"
+        self.addCleanup(get_redis_connection("default").delete, self.key)
+
+    def test_sliding_window(self):
+        policy = sliding_window(3, 60)
+        results = [hit(self.key, policy) for _ in range(4)]
+
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False])
+        self.assertEqual(results[0][1], 0)
+        self.assertGreater(results[-1][1], 59)
+
+    def test_token_bucket_refills(self):
+        policy = token_bucket(3, 0.3)
+        self.assertEqual([hit(self.key, policy)[0] for _ in range(4)], [True, True, True, False])
+
+        time.sleep(0.15)
+        self.assertTrue(hit(self.key, policy)[0])
+
+    def test_hit_many_grants_what_fits(self):
+        for policy in (sliding_window(5, 60), token_bucket(5, 3600)):
+            with self.subTest(algorithm=policy.algorithm):
+                get_redis_connection("default").delete(self.key)
+                self.assertEqual(hit_many(self.key, policy, 3), (3, 0))
+
+                granted, retry_after = hit_many(self.key, policy, 3)
+                self.assertEqual(granted, 2)
+                self.assertGreater(retry_after, 0)
+                self.assertFalse(hit(self.key, policy)[0])
+
+    def test_concurrent_hits_never_exceed_the_limit(self):
+        for policy in (sliding_window(10, 60), token_bucket(10, 3600)):
+            with self.subTest(algorithm=policy.algorithm):
+                get_redis_connection("default").delete(self.key)
+                workers = 16
+                barrier = threading.Barrier(workers)
+                allowed = []
+
+                def hammer():
+                    barrier.wait()
+                    allowed.extend(hit(self.key, policy)[0] for _ in range(5))
+
+                threads = [threading.Thread(target=hammer) for _ in range(workers)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                self.assertEqual(len(allowed), workers * 5)
+                self.assertEqual(allowed.count(True), 10)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.addCleanup(invalidate_user, self.user.id)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def profile(self):
+        return self.client.get("/api/v1/accounts/profile/")
+
+    def test_warm_requests_do_not_query_users(self):
+        self.assertEqual(self.profile().status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.profile()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["email"], self.user.email)
+        self.assertEqual([query["sql"] for query in queries if "accounts_user" in query["sql"]], [])
+
+    def test_saved_changes_are_seen_on_the_next_request(self):
+        self.profile()
+        self.user.name = "Alice Liddell"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        self.assertEqual(self.profile().data["name"], "Alice Liddell")
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.profile().status_code, 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        response = self.profile()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data["code"], "user_inactive")
+
+    def test_request_changes_do_not_leak_into_the_cache(self):
+        self.profile()
+        self.profile().wsgi_request.user.name = "Mallory"
+
+        self.assertEqual(self.profile().data["name"], "Alice")
+
+
+class OTPFlowTests(TestCase):
+
+    def setUp(self):
+        self.email = f"{uuid.uuid4().hex}@example.com"
+        keys = [otp_key(self.email), otp_send_limit_key(self.email), OTP_OUTBOX_KEY]
+        get_redis_connection("default").delete(OTP_OUTBOX_KEY)
+        self.addCleanup(get_redis_connection("default").delete, *keys)
+        self.client = APIClient()
+
+    def login(self):
+        with mock.patch("accounts.views.deliver_otp_emails") as task:
+            response = self.client.post("/api/v1/accounts/login/", {"email": self.email})
+        return response, task
+
+    def verify(self, code):
+        return self.client.post("/api/v1/accounts/verify/", {"email": self.email, "otp": code})
+
+    def issued_code(self):
+        return get_redis_connection("default").hget(otp_key(self.email), "code").decode()
+
+    def test_login_then_verify(self):
+        response, task = self.login()
+        self.assertEqual(response.status_code, 200)
+        task.delay.assert_called_once_with()
+        queued = json.loads(get_redis_connection("default").lindex(OTP_OUTBOX_KEY, 0))
+        self.assertEqual(queued["email"], self.email)
+        code = queued["code"]
+
+        response = self.verify(code)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["user"]["email"], self.email)
+
+    def assertOneRoundTrip(self, step):
+        redis_class = get_redis_connection("default").__class__
+        with mock.patch.object(
+            redis_class, "execute_command", autospec=True, side_effect=redis_class.execute_command
+        ) as execute:
+            result = step()
+        self.assertEqual(execute.call_count, 1)
+        return result
+
+    def test_each_step_is_one_redis_round_trip(self):
+        response, _ = self.assertOneRoundTrip(self.login)
+        self.assertEqual(response.status_code, 200)
+
+        code = self.issued_code()
+        response = self.assertOneRoundTrip(lambda: self.verify(code))
+        self.assertEqual(response.status_code, 201)
+
+    def test_login_is_rate_limited(self):
+        self.assertEqual(self.login()[0].status_code, 200)
+        response, task = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        task.delay.assert_not_called()
+        self.assertEqual(get_redis_connection("default").llen(OTP_OUTBOX_KEY), 1)
+
+    def test_code_is_locked_after_wrong_attempts(self):
+        self.login()
+        code = self.issued_code()
+        wrong = "000000" if code != "000000" else "111111"
+
+        self.assertEqual([self.verify(wrong).status_code for _ in range(3)], [400] * 3)
+        self.assertEqual(self.verify(code).status_code, 429)
+
+    def test_code_can_only_be_redeemed_once(self):
+        code, _ = issue_otp(self.email)
+        workers = 10
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def redeem():
+            barrier.wait()
+            results.append(consume_otp(self.email, code))
+
+        threads = [threading.Thread(target=redeem) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(OTP_VERIFIED), 1)
+        self.assertEqual(results.count(OTP_INVALID), workers - 1)
+
+
+class OTPDeliveryTests(TestCase):
+
+    def setUp(self):
+        self.redis = get_redis_connection("default")
+        self.emails = [f"{uuid.uuid4().hex}@example.com" for _ in range(3)]
+        keys = [key for email in self.emails for key in (otp_key(email), otp_send_limit_key(email))]
+        self.redis.delete(OTP_OUTBOX_KEY)
+        self.addCleanup(self.redis.delete, OTP_OUTBOX_KEY, *keys)
+        close_smtp_connection()
+        self.addCleanup(close_smtp_connection)
+
+    def issue_all(self):
+        return [issue_otp(email)[0] for email in self.emails]
+
+    def test_sends_queued_emails_over_one_connection(self):
+        codes = self.issue_all()
+        with mock.patch.object(
+            otp_delivery_service, "get_connection", wraps=otp_delivery_service.get_connection
+        ) as get_connection:
+            self.assertEqual(deliver_pending(batch_size=2), 3)
+            issue_otp(f"{uuid.uuid4().hex}@example.com")
+            self.assertEqual(deliver_pending(), 1)
+
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual([message.to for message in mail.outbox[:3]], [[email] for email in self.emails])
+        for message, code in zip(mail.outbox, codes):
+            self.assertIn(code, message.body)
+        self.assertEqual(self.redis.llen(OTP_OUTBOX_KEY), 0)
+
+    def test_expired_codes_are_not_sent(self):
+        entry = {"email": self.emails[0], "code": "123456", "expires_at": time.time() - 1}
+        self.redis.rpush(OTP_OUTBOX_KEY, json.dumps(entry))
+
+        self.assertEqual(deliver_pending(), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_failed_send_puts_the_rest_back_in_order(self):
+        self.issue_all()
+        failure = smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        with mock.patch.object(otp_delivery_service, "send_email", side_effect=[None, failure]):
+            with self.assertRaises(smtplib.SMTPServerDisconnected):
+                deliver_pending()
+
+        remaining = [json.loads(entry)["email"] for entry in self.redis.lrange(OTP_OUTBOX_KEY, 0, -1)]
+        self.assertEqual(remaining, self.emails[1:])
+
+        self.assertEqual(deliver_pending(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [[email] for email in self.emails[1:]])
+
+    def test_reconnects_once_when_the_server_dropped_the_connection(self):
+        self.issue_all()
+        stale = mock.Mock()
+        stale.send_messages.side_effect = smtplib.SMTPServerDisconnected("idle timeout")
+        fresh = mock.Mock()
+        with mock.patch.object(otp_delivery_service, "get_connection", side_effect=[stale, fresh]):
+            self.assertEqual(deliver_pending(), 3)
+
+        stale.close.assert_called_once_with()
+        self.assertEqual(fresh.send_messages.call_count, 3)
+
+
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        clear_rate_limits()
+        self.addCleanup(clear_rate_limits)
+
+    def create_chat(self):
+        return self.client.post("/api/v1/chat/create/", {"user_id": self.other_user.id})
+
+    def test_per_user_limit(self):
+        rates = {"create_chat.user": "2/min", "create_chat.ip": "100/min"}
+        with mock.patch.object(RedisScopedThrottle, "THROTTLE_RATES", rates):
+            responses = [self.create_chat() for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [201, 200, 429])
+        self.assertGreater(int(responses[-1]["Retry-After"]), 0)
+
+    def test_per_ip_limit_spans_users(self):
+        rates = {"create_chat.user": "100/min", "create_chat.ip": "2/min"}
+        with mock.patch.object(RedisScopedThrottle, "THROTTLE_RATES", rates):
+            self.create_chat()
+            self.client.force_authenticate(self.other_user)
+            self.create_chat()
+            self.assertEqual(self.create_chat().status_code, 429)
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncAccountsViewTests(TestCase):
+
+    def setUp(self):
+        self.email = f"{uuid.uuid4().hex}@example.com"
+        keys = [otp_key(self.email), otp_send_limit_key(self.email), OTP_OUTBOX_KEY]
+        self.addCleanup(get_redis_connection("default").delete, *keys)
+
+    async def test_login_then_verify(self):
+        with mock.patch("accounts.async_views.deliver_otp_emails") as task:
+            response = await self.async_client.post(
+                "/api/v1/accounts/login/", {"email": self.email}, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["is_new_user"])
+        task.delay.assert_called_once_with()
+
+        code = get_redis_connection("default").hget(otp_key(self.email), "code").decode()
+        response = await self.async_client.post(
+            "/api/v1/accounts/verify/", {"email": self.email, "otp": code}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+
+        headers = {"Authorization": f"Bearer {response.json()['tokens']['access']}"}
+        response = await self.async_client.get("/api/v1/accounts/profile/", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["email"], self.email)
+        user = await User.objects.aget(email=self.email)
+        invalidate_user(user.id)
+
+    async def test_inactive_user_is_rejected(self):
+        user = await User.objects.acreate(email=self.email, name="Alice")
+        self.addCleanup(invalidate_user, user.id)
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+        self.assertEqual((await self.async_client.get("/api/v1/accounts/profile/", headers=headers)).status_code, 200)
+
+        user.is_active = False
+        await user.asave()
+
+        response = await self.async_client.get("/api/v1/accounts/profile/", headers=headers)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["code"], "user_inactive")
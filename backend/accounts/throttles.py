@@ -0,0 +1,137 @@
+from rest_framework.throttling import ScopedRateThrottle
+from .services.rate_limit_service import SLIDING_WINDOW, TOKEN_BUCKET, Policy, ahit, ahit_many, hit, hit_many
+
+
+class RedisScopedThrottle(ScopedRateThrottle):
+    """
+    Scoped throttle enforced by the atomic Redis limiter.
+
+    Views opt in with `throttle_scope`. The rate is looked up in
+    `DEFAULT_THROTTLE_RATES` under "<throttle_scope>.<ident_kind>", in the
+    usual "<limit>/<period>" form, so one view can carry a per-user and a
+    per-IP limit at once.
+    """
+
+    algorithm = SLIDING_WINDOW
+    # "user" keys by the authenticated user (or IP when anonymous), "ip" by IP
+    ident_kind = "user"
+    retry_after = None
+
+    def allow_request(self, request, view):
+        if not self.prepare(request, view):
+            return True
+        allowed, self.retry_after = hit(self.key, self.policy)
+        return allowed
+
+    async def aallow_request(self, request, view):
+        """ Async version of `allow_request`, used by `AsyncAPIView`. """
+        if not self.prepare(request, view):
+            return True
+        allowed, self.retry_after = await ahit(self.key, self.policy)
+        return allowed
+
+    def allow_items(self, request, view, count) -> int:
+        """ Charge up to `count` hits at once; returns how many are allowed. """
+        if not count or not self.prepare(request, view):
+            return count
+        granted, self.retry_after = hit_many(self.key, self.policy, count)
+        return granted
+
+    async def aallow_items(self, request, view, count) -> int:
+        """ Async version of `allow_items`. """
+        if not count or not self.prepare(request, view):
+            return count
+        granted, self.retry_after = await ahit_many(self.key, self.policy, count)
+        return granted
+
+    def prepare(self, request, view) -> bool:
+        """ Resolve the scope, rate and key; False if the view is not throttled. """
+        self.retry_after = None
+        throttle_scope = getattr(view, self.scope_attr, None)
+        if not throttle_scope:
+            return False
+
+        self.scope = f"{throttle_scope}.{self.ident_kind}"
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.policy = Policy(self.algorithm, self.num_requests, self.duration)
+        self.key = self.get_cache_key(request, view)
+        return True
+
+    def get_cache_key(self, request, view):
+        if self.ident_kind == "user" and request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return f"ratelimit:{self.scope}:{ident}"
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserBurstThrottle(RedisScopedThrottle):
+    """ Per-user token bucket: short bursts are fine, sustained floods are not. """
+
+    algorithm = TOKEN_BUCKET
+    ident_kind = "user"
+
+
+class IPRateThrottle(RedisScopedThrottle):
+    """ Per-IP sliding window, a ceiling for everyone behind one address. """
+
+    algorithm = SLIDING_WINDOW
+    ident_kind = "ip"
+
+
+class PerItemThrottleMixin:
+    """
+    Charge a view's throttles once per item of a batch, not once per request.
+
+    The request itself is not charged; the handler calls `throttle_items`
+    (or `athrottle_items`) once it knows how many items it got. A batch of
+    n messages then costs what n single sends would. Works for both
+    `APIView` and `AsyncAPIView`.
+    """
+
+    def check_throttles(self, request):
+        pass
+
+    async def acheck_throttles(self, request):
+        pass
+
+    def throttle_items(self, request, count) -> tuple:
+        """
+        Let through as many of `count` items as every throttle allows.
+
+        Each throttle is only charged for what the ones before it let
+        through, so a single tight limit overcharges the others little.
+
+        Returns:
+            tuple: (granted, retry_after) where retry_after is the number of
+            seconds until the rejected items may be retried, None if none were.
+
+        Raises:
+            Throttled: If none of the items may go through.
+        """
+        throttles = self.get_throttles()
+        granted = count
+        for throttle in throttles:
+            granted = throttle.allow_items(request, self, granted)
+        return self.granted_items(request, throttles, count, granted)
+
+    async def athrottle_items(self, request, count) -> tuple:
+        """ Async version of `throttle_items`. """
+        throttles = self.get_throttles()
+        granted = count
+        for throttle in throttles:
+            granted = await throttle.aallow_items(request, self, granted)
+        return self.granted_items(request, throttles, count, granted)
+
+    def granted_items(self, request, throttles, count, granted) -> tuple:
+        if granted == count:
+            return granted, None
+        durations = [throttle.wait() for throttle in throttles if throttle.wait() is not None]
+        retry_after = max(durations, default=None)
+        if not granted:
+            self.throttled(request, retry_after)
+        return granted, retry_after
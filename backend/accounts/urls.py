@@ -1,11 +1,17 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 
-urlpatterns = [
-    path("login/", views.UserLoginView.as_view(), name="login"),
-    path("verify/", views.UserVerifyView.as_view(), name="verify"),
-    path("profile/", views.UserProfileView.as_view(), name="profile"),
-    path("users/", views.UserListView.as_view(), name="users"),
-    path("users/<int:id>/", views.UserRetrieveView.as_view(), name="user-detail"),
-]
\ No newline at end of file
+def api_urlpatterns(api):
+    """ The accounts endpoints, served by the views of module `api`. """
+    return [
+        path("login/", api.UserLoginView.as_view(), name="login"),
+        path("verify/", api.UserVerifyView.as_view(), name="verify"),
+        path("profile/", api.UserProfileView.as_view(), name="profile"),
+        path("users/", api.UserListView.as_view(), name="users"),
+        path("users/<int:id>/", api.UserRetrieveView.as_view(), name="user-detail"),
+    ]
+
+
+urlpatterns = api_urlpatterns(async_views if settings.API_ASYNC_VIEWS else views)
@@ -1,9 +1,60 @@
-import random
-from django.core.cache import cache
+import json
+import secrets
+import time
+import uuid
+from django_redis import get_redis_connection
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import AuthenticationFailed
-
-OTP_TTL_SECONDS = 300  # 5 minutes
+from livechat.async_redis import get_async_redis_connection
+from .services.rate_limit_service import SLIDING_WINDOW_LUA
+
+# Limits
+OTP_PER_MINUTE = 1       # Max OTP requests per minute per email
+VERIFY_PER_CODE = 3      # Max verification attempts per OTP code
+
+# Time windows
+ONE_MINUTE = 60          # seconds
+OTP_TTL_SECONDS = 300    # 5 minutes
+
+# Outcomes of `consume_otp`
+OTP_VERIFIED = "verified"
+OTP_INVALID = "invalid"
+OTP_LOCKED = "locked"
+
+# Emails waiting for delivery by `accounts.tasks.deliver_otp_emails`
+OTP_OUTBOX_KEY = "otp:outbox"
+
+# KEYS: otp, send limit log, outbox  ARGV: code, ttl ms, sends per window, window ms, hit id, outbox entry
+# Rate limits the request, stores a fresh code with zero attempts and queues its email.
+ISSUE_OTP_SCRIPT = SLIDING_WINDOW_LUA + """
+local allowed, retry_after = sliding_window_hit(KEYS[2], tonumber(ARGV[3]), tonumber(ARGV[4]), ARGV[5])
+if allowed == 0 then
+    return {0, retry_after}
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'attempts', 0)
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+redis.call('RPUSH', KEYS[3], ARGV[6])
+return {1, 0}
+"""
+
+# KEYS: otp  ARGV: submitted code, attempts per code
+# A match deletes the code in the same step, so it can be redeemed once.
+CONSUME_OTP_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'code', 'attempts')
+if not state[1] then
+    return 'invalid'
+end
+if tonumber(state[2]) >= tonumber(ARGV[2]) then
+    return 'locked'
+end
+if state[1] == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 'verified'
+end
+redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+return 'invalid'
+"""
 
 
 def generate_otp() -> str:
@@ -13,62 +64,90 @@ def generate_otp() -> str:
     Returns:
         str: A 6-digit OTP code as a string.
     """
-    return f"{random.randint(100000, 999999)}"
+    return f"{secrets.randbelow(900000) + 100000}"
 
 
-def otp_cache_key(email: str) -> str:
+def otp_key(email: str) -> str:
     """
-    Generate a cache key for storing OTPs based on the user's email.
+    Build the Redis key holding a user's current OTP and its attempt count.
 
     Args:
         email (str): The user's email address.
 
     Returns:
-        str: A string cache key in the format "otp:<email>".
+        str: A key in the format "otp:<email>".
     """
     return f"otp:{email}"
 
 
-def store_otp(email: str, code: str) -> None:
+def otp_send_limit_key(email: str) -> str:
+    return f"ratelimit:send:otp:{email}"
+
+
+def issue_otp(email: str) -> tuple:
     """
-    Store an OTP in the cache with a defined TTL (time-to-live).
+    Issue a new OTP for `email`, unless OTPs are requested too often.
+
+    The rate limit check, the store and queueing the email in the outbox
+    are one atomic script, so this is a single Redis round trip. A new
+    code replaces the previous one and resets its attempt count.
 
     Args:
         email (str): The user's email address.
-        code (str): The OTP code to store.
 
     Returns:
-        None
+        tuple: (code, 0) when issued, or (None, retry_after) with the
+        number of seconds until a new OTP may be requested.
     """
-    cache.set(otp_cache_key(email), code, timeout=OTP_TTL_SECONDS)
+    code = generate_otp()
+    issued, retry_after = get_redis_connection("default").eval(*_issue_args(email, code))
+    if not issued:
+        return None, retry_after / 1000
+    return code, 0
 
 
-def verify_otp(email: str, code: str) -> bool:
-    """
-    Verify if the provided OTP matches the one stored in cache.
+async def aissue_otp(email: str) -> tuple:
+    """ Async version of `issue_otp`, on the asyncio Redis client. """
+    code = generate_otp()
+    issued, retry_after = await get_async_redis_connection().eval(*_issue_args(email, code))
+    if not issued:
+        return None, retry_after / 1000
+    return code, 0
 
-    Args:
-        email (str): The user's email address.
-        code (str): The OTP code provided by the user.
 
-    Returns:
-        bool: True if OTP matches, False otherwise.
-    """
-    stored = cache.get(otp_cache_key(email))
-    return stored == code
+def _issue_args(email: str, code: str) -> tuple:
+    # Undelivered emails are dropped once their code has expired
+    entry = json.dumps({"email": email, "code": code, "expires_at": time.time() + OTP_TTL_SECONDS})
+    return (
+        ISSUE_OTP_SCRIPT, 3, otp_key(email), otp_send_limit_key(email), OTP_OUTBOX_KEY,
+        code, OTP_TTL_SECONDS * 1000, OTP_PER_MINUTE, ONE_MINUTE * 1000, uuid.uuid4().hex, entry,
+    )
 
 
-def clear_otp(email: str) -> None:
+def consume_otp(email: str, code: str) -> str:
     """
-    Remove an OTP from the cache after successful verification or expiration.
+    Redeem an OTP in one atomic step.
+
+    A wrong code counts an attempt; after `VERIFY_PER_CODE` wrong attempts
+    the code is locked until a new one is issued. The right code is
+    deleted as it is checked, so concurrent requests cannot redeem it twice.
 
     Args:
         email (str): The user's email address.
+        code (str): The OTP code provided by the user.
 
     Returns:
-        None
+        str: `OTP_VERIFIED`, `OTP_INVALID` (wrong, expired or never
+        issued) or `OTP_LOCKED`.
     """
-    cache.delete(otp_cache_key(email))
+    result = get_redis_connection("default").eval(CONSUME_OTP_SCRIPT, 1, otp_key(email), code, VERIFY_PER_CODE)
+    return result.decode()
+
+
+async def aconsume_otp(email: str, code: str) -> str:
+    """ Async version of `consume_otp`, on the asyncio Redis client. """
+    result = await get_async_redis_connection().eval(CONSUME_OTP_SCRIPT, 1, otp_key(email), code, VERIFY_PER_CODE)
+    return result.decode()
 
 
 def name_from_email(email: str) -> str:
@@ -1,131 +1,181 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from .serializers import UserLoginSerializer, UserVerifySerializer, UserDetailSerializer
-from .utils import generate_otp, store_otp, verify_otp, clear_otp, name_from_email, get_tokens_for_user
-from .tasks import send_otp_email_task
+from chat.pagination import InvalidCursor
+from livechat.db_router import ReplicaReadsMixin
+from livechat.errors import RequestError
+from .serializers import UserLoginSerializer, UserVerifySerializer, UserDetailSerializer, UserListQuerySerializer
+from .utils import OTP_LOCKED, OTP_VERIFIED, consume_otp, issue_otp, name_from_email, get_tokens_for_user
+from .tasks import deliver_otp_emails
 from .models import User
-from .services.rate_limit_service import can_send_otp, can_verify_otp
+from .services.user_search_service import decode_user_cursor, list_contacts, list_users
+
+
+# Request parsing and response building, shared with accounts/async_views.py;
+# the views themselves only do the I/O in between.
+
+def parse_login(request):
+    """ The email to send an OTP to. """
+    serializer = UserLoginSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data["email"]
+
+
+def otp_throttled_response(retry_after):
+    return Response(
+        {"message": "Too many OTP requests, Please try again later"},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(max(1, round(retry_after)))},
+    )
+
+
+def otp_sent_response(user_exists):
+    return Response(
+        {"message": "OTP sent to email", "is_new_user": not user_exists},
+        status=status.HTTP_200_OK
+    )
+
+
+def parse_verify(request):
+    """ The email and OTP to verify. """
+    serializer = UserVerifySerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    if not data["email"] or not data["otp"]:
+        raise RequestError("email and code are required")
+
+    return data["email"], data["otp"]
+
+
+def check_otp_result(result):
+    if result == OTP_LOCKED:
+        raise RequestError("Too many verification attempts", status.HTTP_429_TOO_MANY_REQUESTS)
+
+    if result != OTP_VERIFIED:
+        raise RequestError("Invalid OTP")
+
+
+def verified_response(user, created):
+    user_data = UserDetailSerializer(user)
+
+    # Generate JWT tokens
+    tokens = get_tokens_for_user(user)
+
+    return Response(
+        {"message": "OTP verified successfully", "is_new_user": created, "user": user_data.data, "tokens": tokens},
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+    )
+
+
+def user_response(user):
+    serializer = UserDetailSerializer(user)
+    return Response(
+        serializer.data,
+        status=status.HTTP_200_OK
+    )
+
+
+def parse_user_list(request):
+    """ The validated query of a user list page, and its decoded cursor. """
+    serializer = UserListQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    try:
+        cursor = decode_user_cursor(data["cursor"]) if data.get("cursor") else None
+    except InvalidCursor:
+        raise RequestError("Invalid cursor")
+
+    return data, cursor
+
+
+def user_list_response(data, users, next_cursor, contacts):
+    response = {
+        "results": UserDetailSerializer(users, many=True).data,
+        "next_cursor": next_cursor,
+    }
+    if data["contacts"]:
+        response["contacts"] = UserDetailSerializer(contacts, many=True).data
+
+    return Response(
+        response,
+        status=status.HTTP_200_OK
+    )
+
 
 class UserLoginView(APIView):
     """ View to handle user login via email base-OTP. """
-    
+
     permission_classes = [permissions.AllowAny]
-    
+
     def post(self, request):
-        serializer = UserLoginSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        data = serializer.validated_data
-        
-        # Rate limit check
-        if not can_send_otp(data["email"]):
-            return Response(
-                {"message": "Too many OTP requests, Please try again later"}, 
-                status=status.HTTP_429_TOO_MANY_REQUESTS
-            )
-        
-        # Generate + store OTP in Redis
-        code = generate_otp()
-        store_otp(data["email"], code)
-        
+        email = parse_login(request)
+
+        # Rate limit check + store a new OTP + queue its email in one Redis round trip
+        code, retry_after = issue_otp(email)
+        if code is None:
+            return otp_throttled_response(retry_after)
+
         # Check if user exists
-        user_exists = User.objects.filter(email=data["email"]).exists()
-        
-        # push email task to RebbitMQ via Celery
-        send_otp_email_task.delay(data["email"], code)
-        
-        
-        return Response(
-            {"message": "OTP sent to email", "is_new_user": not user_exists}, 
-            status=status.HTTP_200_OK
-        )
-        
+        user_exists = User.objects.filter(email=email).exists()
+
+        # issue_otp queued the email; wake an OTP worker to send it
+        deliver_otp_emails.delay()
+
+        return otp_sent_response(user_exists)
+
 class UserVerifyView(APIView):
     """ View to handle email based OTP verification. """
-    
+
     permission_classes = [permissions.AllowAny]
-    
+
     def post(self, request):
-        serializer = UserVerifySerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        data = serializer.validated_data
-        
-        if not data["email"] or not data["otp"]:
-            return Response(
-                {"error": "email and code are required"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
-        # Rate limit check
-        if not can_verify_otp(data["email"], data["otp"]):
-            return Response({"error": "Too many verification attempts"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
-        
-        # Verify OTP
-        if not verify_otp(data["email"], data["otp"]):
-            return Response(
-                {"error": "Invalid OTP"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Clear OTP from Redis
-        clear_otp(data["email"])
-        
-        name = name_from_email(data["email"])
+        email, otp = parse_verify(request)
+
+        # Check attempts, verify and consume the OTP in one atomic step
+        check_otp_result(consume_otp(email, otp))
+
         # Get or create user
-        user, created = User.objects.get_or_create(email=data["email"], defaults={"name": name})
-        
-        user_data = UserDetailSerializer(user)
-        
-        # Generate JWT tokens
-        tokens = get_tokens_for_user(user)
-        
-        return Response(
-            {"message": "OTP verified successfully", "is_new_user": created, "user": user_data.data, "tokens": tokens}, 
-            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
-        )
-        
+        user, created = User.objects.get_or_create(email=email, defaults={"name": name_from_email(email)})
+        return verified_response(user, created)
+
 class UserProfileView(APIView):
     """ View to retrieve user profile. """
-    
+
     permission_classes = [permissions.IsAuthenticated]
-    
+
     def get(self, request):
-        user = request.user
-        serializer = UserDetailSerializer(user)
-        return Response(
-            serializer.data, 
-            status=status.HTTP_200_OK
-        )
-    
-class UserListView(APIView):
-    """ View to list all users. """
-    
+        return user_response(request.user)
+
+class UserListView(ReplicaReadsMixin, APIView):
+    """
+    View to list other users one page at a time, optionally by name/email prefix.
+
+    With `contacts=true` the first page also returns matching users the caller
+    already chats with, and those users are left out of every page.
+    """
+
     permission_classes = [permissions.IsAuthenticated]
-    
+
     def get(self, request):
-        users = User.objects.all()
-        serializer = UserDetailSerializer(users, many=True)
-        return Response(
-            serializer.data, 
-            status=status.HTTP_200_OK
+        data, cursor = parse_user_list(request)
+
+        users, next_cursor = list_users(
+            request.user, data["q"], cursor=cursor, limit=data["limit"], exclude_contacts=data["contacts"]
         )
-        
+        contacts = list_contacts(request.user, data["q"]) if data["contacts"] and cursor is None else []
+        return user_list_response(data, users, next_cursor, contacts)
+
 class UserRetrieveView(APIView):
     """ View to retrieve a user by ID. """
-    
+
     permission_classes = [permissions.IsAuthenticated]
-    
+
     def get(self, request, id):
         try:
             user = User.objects.get(id=id)
         except User.DoesNotExist:
-            return Response(
-                {"error": "User not found"}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
-        serializer = UserDetailSerializer(user)
-        return Response(
-            serializer.data, 
-            status=status.HTTP_200_OK
-        )
\ No newline at end of file
+            raise RequestError("User not found", status.HTTP_404_NOT_FOUND)
+
+        return user_response(user)
@@ -0,0 +1,289 @@
+# chat/async_views.py
+#
+# Coroutine versions of the views in chat/views.py, selected with the
+# API_ASYNC_VIEWS setting. Request parsing and response building are shared
+# with chat/views.py, so responses are identical; only the I/O differs. Redis
+# is awaited on the asyncio client and the database through Django's async
+# ORM. Writes and other multi-statement transactions still run in a worker
+# thread, since `transaction.atomic` has no async form.
+from asgiref.sync import sync_to_async
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework import status
+from django.shortcuts import aget_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.contrib.auth import get_user_model
+from accounts.throttles import IPRateThrottle, PerItemThrottleMixin, UserBurstThrottle
+from livechat.async_views import AsyncAPIView
+from livechat.conditional import async_etag
+from livechat.db_router import ReplicaReadsMixin, read_from_primary
+from livechat.errors import RequestError
+from .models import Conversation, ConversationParticipant, Message
+from .fast_serializers import message_rows, user_rows
+from .renderers import ORJSONRenderer
+from .services.conversation_service import get_or_create_direct_conversation
+from .services.message_cache_service import TAIL_SIZE, afill_tail, aread_tail, readers_key
+from .services.presence_service import aget_presence, contact_ids
+from .services.search_service import search_messages
+from .services.sync_service import get_changes
+from .services.version_service import aget_member_version, aget_version, conversation_version_key, make_etag, user_version_key
+from .services.ingestion_service import aenqueue_message, is_stream_mode
+from .services.message_service import advance_read_watermark, create_message
+from .views import (
+    NOT_A_PARTICIPANT,
+    build_chat_list,
+    chat_list_queryset,
+    check_participant,
+    conversation_response,
+    create_message_batch,
+    drop_throttled_drafts,
+    etag_conversation_id,
+    is_tail_page,
+    message_batch_response,
+    message_list_etag_for,
+    message_page,
+    message_page_response,
+    message_querysets,
+    message_response,
+    parse_chat_partner,
+    parse_message,
+    parse_message_batch,
+    parse_message_page,
+    parse_presence_query,
+    parse_read,
+    parse_search,
+    parse_sync,
+    presence_response,
+    read_receipt_response,
+    search_response,
+    stream_receiver_id,
+    tail_page,
+)
+
+User = get_user_model()
+
+
+async def achat_list_etag(request):
+    """ Async version of `chat_list_etag`. """
+    return make_etag("chat-list", request.user.id, await aget_version(user_version_key(request.user.id)))
+
+
+async def amessage_list_etag(request):
+    """ Async version of `message_list_etag`. """
+    conversation_id = etag_conversation_id(request)
+    if conversation_id is None:
+        return None
+
+    version, is_participant = await aget_member_version(
+        conversation_version_key(conversation_id), readers_key(conversation_id), request.user.id
+    )
+    if is_participant is None:
+        is_participant = await ConversationParticipant.objects.filter(
+            conversation_id=conversation_id, user=request.user
+        ).aexists()
+    if not is_participant:
+        return None
+
+    return message_list_etag_for(request, version)
+
+
+class CreateOrGetChatView(AsyncAPIView):
+    """ View to create or get a one-on-one chat conversation between two users. """
+
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserBurstThrottle, IPRateThrottle]
+    throttle_scope = "create_chat"
+
+    async def post(self, request):
+        other_user_id = parse_chat_partner(request)
+
+        try:
+            other_user = await User.objects.aget(id=other_user_id)
+        except User.DoesNotExist:
+            raise RequestError("User not found", status.HTTP_404_NOT_FOUND)
+
+        conversation, created = await sync_to_async(get_or_create_direct_conversation)(request.user, other_user)
+        return conversation_response(conversation, created)
+
+
+class GetAllChatsView(ReplicaReadsMixin, AsyncAPIView):
+    """ View to get all chat conversations for the authenticated user."""
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(async_etag(achat_list_etag))
+    async def get(self, request):
+        conversations = [convo async for convo in chat_list_queryset(request.user)]
+
+        # Bulk load the related users and messages as plain rows
+        user_ids = {convo["other_user_id"] for convo in conversations if convo["other_user_id"]}
+        message_ids = {convo["latest_message_id"] for convo in conversations if convo["latest_message_id"]}
+        users = {row.id: row async for row in user_rows(User.objects.filter(id__in=user_ids))}
+        latest_messages = {row.id: row async for row in message_rows(Message.objects.filter(id__in=message_ids))}
+
+        presence = await aget_presence(users.keys())
+        return Response(build_chat_list(conversations, users, latest_messages, presence))
+
+
+class SendMessageView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserBurstThrottle, IPRateThrottle]
+    throttle_scope = "send_message"
+
+    async def post(self, request):
+        conversation_id, content = parse_message(request.data)
+        sender = request.user
+
+        if is_stream_mode():
+            return await self.accept_to_stream(conversation_id, sender, content)
+
+        # Get conversation
+        conversation = await aget_object_or_404(Conversation, id=conversation_id)
+
+        # Check sender is participant
+        if not await ConversationParticipant.objects.filter(
+            conversation=conversation,
+            user=sender
+        ).aexists():
+            raise RequestError(NOT_A_PARTICIPANT, status.HTTP_403_FORBIDDEN)
+
+        # Create message and push it to the conversation's subscribers
+        message = await sync_to_async(create_message)(conversation, sender, content)
+        return message_response(message, status.HTTP_201_CREATED)
+
+    async def accept_to_stream(self, conversation_id, sender, content):
+        """ Write-behind path: one membership read and one XADD, persisted and broadcast later by Celery. """
+        user_ids = [
+            user_id async for user_id in
+            ConversationParticipant.objects
+            .filter(conversation_id=conversation_id)
+            .values_list("user_id", flat=True)
+        ]
+        receiver_id = stream_receiver_id(user_ids, sender)
+
+        message = await aenqueue_message(conversation_id, sender, receiver_id, content)
+        return message_response(message, status.HTTP_202_ACCEPTED)
+
+
+class SendMessageBatchView(PerItemThrottleMixin, AsyncAPIView):
+    """ View to send many messages at once, e.g. when replaying an offline queue. """
+
+    permission_classes = [IsAuthenticated]
+    # Each message is charged like a single send
+    throttle_classes = [UserBurstThrottle, IPRateThrottle]
+    throttle_scope = "send_message"
+
+    async def post(self, request):
+        results, drafts = parse_message_batch(request.data)
+        granted, retry_after = await self.athrottle_items(request, len(drafts))
+        drafts = drop_throttled_drafts(results, drafts, granted, retry_after)
+        messages = await sync_to_async(create_message_batch)(request.user, drafts)
+        return message_batch_response(results, drafts, messages)
+
+
+class GetMessagesView(ReplicaReadsMixin, AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(async_etag(amessage_list_etag))
+    async def get(self, request):
+        conversation_id, before, after, limit = parse_message_page(request)
+        user = request.user
+
+        # The newest page of an active conversation is served from the tail cache
+        generation = None
+        if is_tail_page(before, after, limit):
+            cached, generation = await aread_tail(conversation_id, user.id, limit)
+            if cached is not None:
+                return Response(cached, status=status.HTTP_200_OK)
+            # A replica may be behind the generation just read, and the
+            # tail it fills would be served with a gap until it expires
+            read_from_primary()
+
+        # Get conversation
+        conversation = await aget_object_or_404(Conversation, id=conversation_id)
+
+        # Check participation and collect read watermarks
+        participants = [participant async for participant in ConversationParticipant.objects.filter(conversation=conversation)]
+        check_participant(participants, user)
+
+        messages_queryset, archive_queryset = message_querysets(conversation)
+        if generation is not None:
+            # Cache miss: load the whole tail once, serve the page from it
+            tail = [row async for row in messages_queryset.order_by("-seq")[:TAIL_SIZE + 1]][::-1]
+            page, cacheable = tail_page(tail, limit, archive_queryset)
+            if cacheable:
+                await afill_tail(conversation.id, tail, participants, generation)
+        else:
+            page = await sync_to_async(message_page)(messages_queryset, archive_queryset, before, after, limit)
+
+        return message_page_response(conversation, participants, page)
+
+
+class SearchMessagesView(AsyncAPIView):
+    """ View to full-text search the messages of the authenticated user's conversations. """
+
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        query, after, limit = parse_search(request)
+        results = await sync_to_async(search_messages)(request.user, query, after=after, limit=limit + 1)
+        return search_response(results, limit)
+
+
+class SyncView(AsyncAPIView):
+    """ View to fetch the authenticated user's changes since a sequence number. """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    async def get(self, request):
+        changes = await sync_to_async(get_changes)(request.user, parse_sync(request))
+        return Response(changes, status=status.HTTP_200_OK)
+
+
+class ReadMessagesView(AsyncAPIView):
+    """ View to advance the authenticated user's read watermark in a conversation. """
+
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        conversation_id, message_id = parse_read(request)
+
+        # Check participation
+        participant = await (
+            ConversationParticipant.objects
+            .filter(conversation_id=conversation_id, user=request.user)
+            .afirst()
+        )
+        if participant is None:
+            raise RequestError(NOT_A_PARTICIPANT, status.HTTP_403_FORBIDDEN)
+
+        # Defaults to the latest message of the conversation
+        messages = Message.objects.filter(conversation_id=conversation_id)
+        if message_id:
+            message = await aget_object_or_404(messages, id=message_id)
+        else:
+            message = await messages.order_by("-seq").afirst()
+
+        if message:
+            await sync_to_async(advance_read_watermark)(participant, message)
+
+        return read_receipt_response(conversation_id, participant)
+
+
+class PresenceView(AsyncAPIView):
+    """ View to look up the presence of many of the caller's contacts at once. """
+
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        # Users the caller shares no conversation with are left out
+        user_ids = await sync_to_async(contact_ids)(request.user, parse_presence_query(request))
+        presence = await aget_presence(user_ids)
+        return presence_response(presence)
@@ -1,16 +1,148 @@
-import json
-from channels.generic.websocket import WebsocketConsumer
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .models import Conversation, ConversationParticipant
+from .serializers import SendMessageSerializer
+from .services.message_service import conversation_group_name, create_message
+from .services.presence_service import broadcast_presence, mark_offline, mark_online
+from .services.typing_service import TypingIndicator
 
 
-class MyConsumer(WebsocketConsumer):
-    def connect(self):
-        self.accept()
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Consumer that streams a single conversation to one of its participants.
 
-    def disconnect(self, close_code):
-        pass
+    Every socket joins the conversation's channel layer group, so messages
+    published from any ASGI process (REST or WebSocket) reach all of them.
+    Open sockets also keep their user online; clients send a
+    "presence.heartbeat" event every `HEARTBEAT_INTERVAL` seconds.
 
-    def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json["message"]
+    "typing" events may be sent on every keystroke; they are coalesced by a
+    `TypingIndicator` and never persisted.
+    """
 
-        self.send(text_data=json.dumps({"message": message}))
\ No newline at end of file
+    async def connect(self):
+        self.user = self.scope.get("user")
+        self.conversation_id = self.scope["url_route"]["kwargs"]["conversation_id"]
+        self.group_name = None
+        self.typing = None
+
+        if not self.user or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        if not await self.is_participant():
+            await self.close(code=4403)
+            return
+
+        self.group_name = conversation_group_name(self.conversation_id)
+        self.typing = TypingIndicator(self.conversation_id, self.user.id, self.publish_typing)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(subprotocol=self.scope.get("auth_subprotocol"))
+        await self.update_presence(online=True)
+
+    async def disconnect(self, close_code):
+        if self.typing:
+            await self.typing.stop()
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            await self.update_presence(online=False)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get("type") == "presence.heartbeat":
+            await self.update_presence(online=True)
+            return
+
+        if content.get("type") == "typing":
+            await self.typing.keystroke()
+            return
+
+        if content.get("type") == "typing.stop":
+            await self.typing.stop()
+            return
+
+        if content.get("type") != "message.send":
+            await self.send_json({"type": "error", "error": "Unsupported event type"})
+            return
+
+        serializer = SendMessageSerializer(data={
+            "conversation_id": self.conversation_id,
+            "content": content.get("content"),
+        })
+        if not serializer.is_valid():
+            await self.send_json({"type": "error", "error": serializer.errors})
+            return
+
+        await self.typing.stop()
+        await self.save_message(serializer.validated_data["content"])
+
+    async def chat_message(self, event):
+        """ Forward a message published to the conversation group. """
+        await self.send_json({
+            "type": "message",
+            "conversation_id": event["conversation_id"],
+            "message": event["message"],
+        })
+
+    async def chat_read(self, event):
+        """ Forward a read watermark published to the conversation group. """
+        await self.send_json({
+            "type": "read",
+            "conversation_id": event["conversation_id"],
+            "user_id": event["user_id"],
+            "last_read_message_id": event["last_read_message_id"],
+            "last_read_at": event["last_read_at"],
+        })
+
+    async def chat_presence(self, event):
+        """ Forward a contact's presence change published to the conversation group. """
+        if event["user_id"] == self.user.id:
+            return
+
+        await self.send_json({
+            "type": "presence",
+            "conversation_id": event["conversation_id"],
+            "user_id": event["user_id"],
+            "online": event["online"],
+            "last_seen": event["last_seen"],
+        })
+
+    async def chat_typing(self, event):
+        """ Forward a participant's typing state published to the conversation group. """
+        if event["user_id"] == self.user.id:
+            return
+
+        await self.send_json({
+            "type": "typing",
+            "conversation_id": event["conversation_id"],
+            "user_id": event["user_id"],
+            "typing": event["typing"],
+        })
+
+    async def publish_typing(self, typing):
+        await self.channel_layer.group_send(self.group_name, {
+            "type": "chat.typing",
+            "conversation_id": str(self.conversation_id),
+            "user_id": self.user.id,
+            "typing": typing,
+        })
+
+    @database_sync_to_async
+    def update_presence(self, online):
+        if online:
+            changed = mark_online(self.user.id, self.channel_name)
+        else:
+            changed = mark_offline(self.user.id, self.channel_name)
+        if changed:
+            broadcast_presence(self.user.id, online)
+
+    @database_sync_to_async
+    def is_participant(self):
+        return ConversationParticipant.objects.filter(
+            conversation_id=self.conversation_id,
+            user=self.user,
+        ).exists()
+
+    @database_sync_to_async
+    def save_message(self, content):
+        conversation = Conversation.objects.get(id=self.conversation_id)
+        return create_message(conversation, self.user, content)
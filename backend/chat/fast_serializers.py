@@ -0,0 +1,109 @@
+"""
+Serialization straight from `.values_list(named=True)` rows.
+
+These produce exactly the JSON shapes of the DRF serializers in
+`chat.serializers`, which remain the reference implementation (see the
+equality tests), without per-field introspection on every object.
+"""
+from collections import namedtuple
+from django.utils import timezone
+
+# Columns every message row carries
+MESSAGE_FIELDS = (
+    "id", "seq", "content", "timestamp", "receiver_id", "sender_id", "sender__name", "sender__email",
+)
+
+# Columns every user row carries
+USER_FIELDS = ("id", "name", "email")
+
+
+MessageRow = namedtuple("MessageRow", MESSAGE_FIELDS)
+
+
+def message_rows(queryset):
+    """ Turn a message queryset into named rows with `MESSAGE_FIELDS`. """
+    return queryset.values_list(*MESSAGE_FIELDS, named=True)
+
+
+def message_row(message):
+    """ Build the row of an already loaded message, e.g. one just created. """
+    return MessageRow(
+        message.id, message.seq, message.content, message.timestamp, message.receiver_id,
+        message.sender_id, message.sender.name, message.sender.email,
+    )
+
+
+def user_rows(queryset):
+    """ Turn a user queryset into named rows with `USER_FIELDS`. """
+    return queryset.values_list(*USER_FIELDS, named=True)
+
+
+def datetime_formatter():
+    """
+    Build a formatter matching DRF's `DateTimeField` output.
+
+    Values are converted to the current time zone once resolved here, and
+    a UTC offset is written as "Z", as DRF does.
+    """
+    current_timezone = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if value is None:
+            return None
+        value = value.astimezone(current_timezone).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+    return format_datetime
+
+
+def message_mapper(read_watermarks=None):
+    """
+    Build a row -> dict mapper for `MessageListSerializer` output.
+
+    Args:
+        read_watermarks (dict | None): {user_id: last_read_seq} used for
+            `is_read`, as in the serializer's context.
+
+    Returns:
+        Callable: Maps a message row to its JSON-ready dict.
+    """
+    format_datetime = datetime_formatter()
+    read_watermarks = read_watermarks or {}
+
+    def to_dict(row):
+        watermark = read_watermarks.get(row.receiver_id)
+        return {
+            "id": str(row.id),
+            "content": row.content,
+            "sender": {"id": row.sender_id, "name": row.sender__name, "email": row.sender__email},
+            "is_read": watermark is not None and row.seq <= watermark,
+            "timestamp": format_datetime(row.timestamp),
+        }
+
+    return to_dict
+
+
+def latest_message_mapper():
+    """ Build a row -> dict mapper for `LatestMessageSerializer` output. """
+    format_datetime = datetime_formatter()
+
+    def to_dict(row):
+        return {
+            "id": str(row.id),
+            "content": row.content,
+            "sender": {"id": row.sender_id, "name": row.sender__name, "email": row.sender__email},
+            "timestamp": format_datetime(row.timestamp),
+        }
+
+    return to_dict
+
+
+def user_mapper():
+    """ Build a row -> dict mapper for `ChatUserSerializer` output. """
+
+    def to_dict(row):
+        return {"id": row.id, "name": row.name, "email": row.email}
+
+    return to_dict
@@ -0,0 +1,83 @@
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+from django.db import transaction
+from django.urls import include, path
+from accounts import async_views as accounts_async_views, views as accounts_views
+from accounts.models import User
+from accounts.urls import api_urlpatterns as accounts_urlpatterns
+from chat import async_views, views
+from chat.models import Conversation, ConversationParticipant
+from chat.urls import api_urlpatterns
+
+
+class Rollback(Exception):
+    """ Raised to discard everything a benchmark wrote. """
+
+
+@contextmanager
+def sandbox():
+    """
+    Run a benchmark inside a transaction that is always rolled back.
+
+    Nothing the benchmark writes survives, and `on_commit` hooks such as
+    WebSocket broadcasts never fire.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+@contextmanager
+def unthrottled(*views):
+    """ Turn the throttles of the given view classes off, so rate limits do not reject bench traffic. """
+    with ExitStack() as stack:
+        for view in views:
+            stack.enter_context(mock.patch.object(view, "throttle_classes", []))
+        yield
+
+
+def check_status(response, *expected):
+    """ Fail the benchmark loudly instead of timing rejected requests. """
+    if response.status_code not in expected:
+        raise AssertionError(f"Unexpected {response.status_code} response: {getattr(response, 'data', None)}")
+    return response
+
+
+def create_users(count: int, prefix: str = "bench"):
+    """ Create `count` throwaway users. """
+    return [
+        User.objects.create_user(email=f"{prefix}{index}@bench.invalid", name=f"Bench {index}")
+        for index in range(count)
+    ]
+
+
+def create_direct_chat(user, other_user):
+    """ Create a one-on-one conversation between two throwaway users. """
+    conversation = Conversation.objects.create(direct_key=Conversation.build_direct_key(user.id, other_user.id))
+    ConversationParticipant.objects.bulk_create([
+        ConversationParticipant(conversation=conversation, user=user),
+        ConversationParticipant(conversation=conversation, user=other_user),
+    ])
+    return conversation
+
+
+@contextmanager
+def timer(results: dict, name: str):
+    """ Store the wall-clock seconds spent in the block under `results[name]`. """
+    started = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - started
+
+
+def api_urlconf(use_async: bool):
+    """ A `ROOT_URLCONF` serving the API with the coroutine or the thread-pool views. """
+    class URLConf:
+        urlpatterns = [
+            path("api/v1/accounts/", include(accounts_urlpatterns(accounts_async_views if use_async else accounts_views))),
+            path("api/v1/chat/", include(api_urlpatterns(async_views if use_async else views))),
+        ]
+    return URLConf
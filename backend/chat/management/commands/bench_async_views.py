@@ -0,0 +1,106 @@
+import asyncio
+import statistics
+import time
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from chat.models import Conversation, Message
+from ._bench import api_urlconf, create_direct_chat, create_users
+
+
+async def asgi_get(app, path: str, query: str, token: str) -> int:
+    """ Send one GET straight into the ASGI application, as daphne would, and return its status. """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(b"host", b"testserver"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client never disconnects early
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+class Command(BaseCommand):
+    help = "Compare request latency of the thread-pool and the coroutine API views under many concurrent clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=1000, help="Concurrent clients.")
+        parser.add_argument("--requests", type=int, default=5, help="Requests per client per mode.")
+
+    def handle(self, *args, **options):
+        # Requests run on their own threads and connections, so the data is
+        # committed for the run and deleted afterwards instead of sandboxed
+        sender, receiver = create_users(2, prefix="bench-async")
+        conversation = create_direct_chat(sender, receiver)
+        try:
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender=receiver, receiver=sender, content=f"message {index}")
+                for index in range(100)
+            ])
+            token = str(AccessToken.for_user(sender))
+            # Served from the tail cache, and one plain database read
+            requests = [
+                ("/api/v1/chat/message/list/", f"conversation_id={conversation.id}"),
+                ("/api/v1/chat/list/all/", ""),
+            ]
+
+            for mode, use_async in (("sync", False), ("async", True)):
+                with override_settings(ROOT_URLCONF=api_urlconf(use_async), ALLOWED_HOSTS=["testserver"]):
+                    latencies, seconds = asyncio.run(self.run_clients(ASGIHandler(), requests, token, options))
+                self.report(mode, latencies, seconds)
+        finally:
+            sender.delete()
+            receiver.delete()
+            Conversation.objects.filter(id=conversation.id).delete()
+
+    async def run_clients(self, app, requests, token, options):
+        # Warm the user cache, tail cache and ETag versions outside the numbers
+        for path, query in requests:
+            await asgi_get(app, path, query, token)
+
+        latencies = []
+
+        async def run_client(offset):
+            for index in range(options["requests"]):
+                path, query = requests[(offset + index) % len(requests)]
+                started = time.perf_counter()
+                status = await asgi_get(app, path, query, token)
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    raise RuntimeError(f"{path} answered {status}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_client(offset) for offset in range(options["clients"])))
+        return latencies, time.perf_counter() - started
+
+    def report(self, mode, latencies, seconds):
+        cuts = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{mode:>5}: {len(latencies)} requests in {seconds:.2f}s ({len(latencies) / seconds:,.0f} req/s)  "
+            f"p50 {cuts[49] * 1000:.0f} ms  p95 {cuts[94] * 1000:.0f} ms  p99 {cuts[98] * 1000:.0f} ms  "
+            f"max {max(latencies) * 1000:.0f} ms"
+        )
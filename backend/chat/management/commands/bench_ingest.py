@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django_redis import get_redis_connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+from chat.services.ingestion_service import drain_stream
+from chat.views import SendMessageView
+from ._bench import check_status, create_direct_chat, create_users, sandbox, timer, unthrottled
+
+BENCH_STREAM = "bench:chat:ingest"
+
+
+class Command(BaseCommand):
+    help = "Measure sustained message throughput of the sync and stream ingestion modes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=5000, help="Messages sent per mode.")
+
+    def handle(self, *args, **options):
+        total = options["messages"]
+        factory = APIRequestFactory()
+        view = SendMessageView.as_view()
+        results = {}
+
+        def send_all(sender, conversation):
+            payload = {"conversation_id": str(conversation.id), "content": "benchmark message"}
+            for _ in range(total):
+                request = factory.post("/api/v1/chat/message/send/", payload, format="json")
+                force_authenticate(request, user=sender)
+                check_status(view(request), 201, 202)
+
+        # Broadcasting is identical in both modes, so leave it out of the numbers,
+        # and measure ingestion, not the send_message rate limit
+        with override_settings(CHANNEL_LAYERS={}), unthrottled(SendMessageView), sandbox():
+            sender, receiver = create_users(2)
+            conversation = create_direct_chat(sender, receiver)
+
+            with override_settings(CHAT_INGESTION_MODE="sync"), timer(results, "sync"):
+                send_all(sender, conversation)
+
+            redis = get_redis_connection("default")
+            redis.delete(BENCH_STREAM)
+            try:
+                with override_settings(CHAT_INGESTION_MODE="stream", CHAT_INGESTION_STREAM=BENCH_STREAM):
+                    with timer(results, "stream accept"):
+                        send_all(sender, conversation)
+                    drained = 0
+                    with timer(results, "stream drain"):
+                        while count := drain_stream("bench"):
+                            drained += count
+                    if drained != total:
+                        raise AssertionError(f"Drained {drained} of {total} accepted messages")
+            finally:
+                redis.delete(BENCH_STREAM)
+
+        for mode, seconds in results.items():
+            self.stdout.write(f"{mode:>13}: {total} messages in {seconds:.2f}s ({total / seconds:,.0f} msg/s)")
+        end_to_end = results["stream accept"] + results["stream drain"]
+        self.stdout.write(f"{'stream total':>13}: {total / end_to_end:,.0f} msg/s")
@@ -0,0 +1,56 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from chat.models import Message
+from chat.services.search_service import search_messages
+from ._bench import create_direct_chat, create_users, sandbox, timer
+
+WORDS = [
+    "meeting", "lunch", "deploy", "invoice", "weekend", "flight", "review", "budget", "coffee", "report",
+    "train", "pizza", "project", "deadline", "birthday", "gym", "movie", "hotel", "ticket", "release",
+]
+
+
+class Command(BaseCommand):
+    help = "Measure full-text message search latency over a synthetic corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=200_000, help="Messages in the corpus.")
+        parser.add_argument("--conversations", type=int, default=100, help="Conversations of the searching user.")
+        parser.add_argument("--queries", type=int, default=200, help="Searches to time.")
+
+    def handle(self, *args, **options):
+        total = options["messages"]
+        results = {}
+        latencies = []
+
+        with sandbox():
+            user, *others = create_users(options["conversations"] + 1)
+            conversations = [create_direct_chat(user, other) for other in others]
+            vocabulary = WORDS + [f"word{index}" for index in range(5000)]
+
+            with timer(results, "index"):
+                for start in range(0, total, 5000):
+                    Message.objects.bulk_create([
+                        Message(
+                            conversation=conversation,
+                            sender=user,
+                            receiver=other,
+                            content=" ".join(random.choices(vocabulary, k=12)),
+                        )
+                        for conversation, other in (
+                            random.choice(list(zip(conversations, others)))
+                            for _ in range(min(5000, total - start))
+                        )
+                    ])
+
+            for _ in range(options["queries"]):
+                query = " ".join(random.sample(WORDS, 2))
+                started = time.perf_counter()
+                search_messages(user, query, limit=20)
+                latencies.append(time.perf_counter() - started)
+
+        latencies.sort()
+        self.stdout.write(f"indexed {total} messages in {results['index']:.1f}s")
+        for label, quantile in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            self.stdout.write(f"{label}: {latencies[int(quantile * (len(latencies) - 1))] * 1000:.1f} ms")
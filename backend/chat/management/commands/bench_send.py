@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+from chat.views import SendMessageBatchView, SendMessageView
+from ._bench import check_status, create_direct_chat, create_users, sandbox, timer, unthrottled
+
+
+class Command(BaseCommand):
+    help = "Compare message throughput of the single and batch send endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000, help="Messages sent per mode.")
+        parser.add_argument("--batch-size", type=int, default=500, help="Messages per batch request.")
+
+    def handle(self, *args, **options):
+        total = options["messages"]
+        batch_size = options["batch_size"]
+        factory = APIRequestFactory()
+        single_view = SendMessageView.as_view()
+        batch_view = SendMessageBatchView.as_view()
+        results = {}
+
+        # Measure the endpoints, not the send_message rate limit
+        with unthrottled(SendMessageView, SendMessageBatchView), sandbox():
+            sender, receiver = create_users(2)
+            conversation = create_direct_chat(sender, receiver)
+            payload = {"conversation_id": str(conversation.id), "content": "benchmark message"}
+
+            with timer(results, "single"):
+                for _ in range(total):
+                    request = factory.post("/api/v1/chat/message/send/", payload, format="json")
+                    force_authenticate(request, user=sender)
+                    check_status(single_view(request), 201)
+
+            with timer(results, "batch"):
+                for start in range(0, total, batch_size):
+                    messages = [payload] * min(batch_size, total - start)
+                    request = factory.post("/api/v1/chat/message/send/batch/", {"messages": messages}, format="json")
+                    force_authenticate(request, user=sender)
+                    response = check_status(batch_view(request), 207)
+                    statuses = {result["status"] for result in response.data["results"]}
+                    if statuses != {201}:
+                        raise AssertionError(f"Batch items answered with {sorted(statuses)}")
+
+        for mode, seconds in results.items():
+            self.stdout.write(f"{mode:>6}: {total} messages in {seconds:.2f}s ({total / seconds:,.0f} msg/s)")
+        self.stdout.write(f"speedup: {results['single'] / results['batch']:.1f}x")
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from chat.fast_serializers import message_mapper, message_rows
+from chat.models import Message
+from chat.renderers import ORJSONRenderer
+from chat.serializers import MessageListSerializer
+from ._bench import create_direct_chat, create_users, sandbox, timer
+
+
+class Command(BaseCommand):
+    help = "Compare serialization time of message pages through DRF serializers and row mappers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10_000, help="Messages serialized per run.")
+        parser.add_argument("--runs", type=int, default=5, help="Runs per mode; the fastest is reported.")
+
+    def handle(self, *args, **options):
+        total = options["messages"]
+        timings = {"serializer": [], "mapper": []}
+
+        with sandbox():
+            sender, receiver = create_users(2)
+            conversation = create_direct_chat(sender, receiver)
+            Message.objects.bulk_create([
+                Message(conversation=conversation, sender=sender, receiver=receiver, content=f"message {index}")
+                for index in range(total)
+            ])
+            watermarks = {receiver.id: None, sender.id: None}
+            queryset = Message.objects.filter(conversation=conversation).order_by("seq")
+
+            for _ in range(options["runs"]):
+                results = {}
+                with timer(results, "serializer"):
+                    messages = list(queryset.select_related("sender"))
+                    data = MessageListSerializer(messages, many=True, context={"read_watermarks": watermarks}).data
+                    JSONRenderer().render(data)
+                with timer(results, "mapper"):
+                    to_dict = message_mapper(watermarks)
+                    data = [to_dict(row) for row in message_rows(queryset)]
+                    ORJSONRenderer().render(data)
+                for mode, seconds in results.items():
+                    timings[mode].append(seconds)
+
+        best = {mode: min(seconds) for mode, seconds in timings.items()}
+        for mode, seconds in best.items():
+            self.stdout.write(f"{mode:>10}: {seconds * 1000 * 10_000 / total:.1f} ms per 10k messages (query + render)")
+        self.stdout.write(f"speedup: {best['serializer'] / best['mapper']:.1f}x")
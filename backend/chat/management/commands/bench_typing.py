@@ -0,0 +1,46 @@
+import asyncio
+import random
+import uuid
+from django.core.management.base import BaseCommand
+from chat.services.typing_service import TYPING_THROTTLE, TYPING_TIMEOUT, TypingIndicator
+
+
+class Command(BaseCommand):
+    help = "Measure the channel layer event rate produced by many users typing at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000, help="Users typing concurrently.")
+        parser.add_argument("--rate", type=float, default=8, help="Keystrokes per second while typing.")
+        parser.add_argument("--seconds", type=float, default=10, help="Length of the run.")
+
+    def handle(self, *args, **options):
+        users = options["users"]
+        seconds = options["seconds"]
+        counts = {"keystrokes": 0, "published": 0}
+
+        async def publish(typing):
+            counts["published"] += 1
+
+        async def type_in_bursts(indicator, until):
+            loop = asyncio.get_running_loop()
+            while loop.time() < until:
+                burst_ends = loop.time() + random.uniform(1, 4)
+                while loop.time() < min(burst_ends, until):
+                    await indicator.keystroke()
+                    counts["keystrokes"] += 1
+                    await asyncio.sleep(random.expovariate(options["rate"]))
+                await asyncio.sleep(random.uniform(0, 2 * TYPING_TIMEOUT))
+            await indicator.stop()
+
+        async def run():
+            until = asyncio.get_running_loop().time() + seconds
+            await asyncio.gather(*[
+                type_in_bursts(TypingIndicator(uuid.uuid4(), index, publish), until)
+                for index in range(users)
+            ])
+
+        asyncio.run(run())
+
+        bound = users / TYPING_THROTTLE * 2
+        self.stdout.write(f"keystrokes: {counts['keystrokes'] / seconds:,.0f}/s")
+        self.stdout.write(f" published: {counts['published'] / seconds:,.0f}/s (bound {bound:,.0f}/s)")
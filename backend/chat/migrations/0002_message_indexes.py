@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_participants(apps, schema_editor):
+    """ Keep only the oldest row for each (user, conversation) pair. """
+    ConversationParticipant = apps.get_model('chat', 'ConversationParticipant')
+    duplicates = (
+        ConversationParticipant.objects
+        .values('user', 'conversation')
+        .annotate(first_id=Min('id'), rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        ConversationParticipant.objects.filter(
+            user=duplicate['user'],
+            conversation=duplicate['conversation'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_participants, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'timestamp', 'id'], name='chat_msg_conv_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver', 'conversation'], name='chat_msg_unread_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationparticipant',
+            constraint=models.UniqueConstraint(fields=('user', 'conversation'), name='chat_participant_user_conv_uniq'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0 on 2026-10-18 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    """
+    Derive each participant's watermark from the per-message is_read flags.
+
+    The watermark is the last message before the participant's oldest
+    unread message, or the latest message when nothing is unread.
+    """
+    ConversationParticipant = apps.get_model('chat', 'ConversationParticipant')
+    Message = apps.get_model('chat', 'Message')
+
+    participants = ConversationParticipant.objects.all()
+    for participant in participants.iterator(chunk_size=1000):
+        messages = Message.objects.filter(conversation_id=participant.conversation_id)
+        first_unread = (
+            messages
+            .filter(receiver_id=participant.user_id, is_read=False)
+            .order_by('timestamp', 'id')
+            .first()
+        )
+        if first_unread:
+            messages = messages.filter(timestamp__lt=first_unread.timestamp)
+
+        last_read = messages.order_by('-timestamp', '-id').first()
+        if last_read:
+            ConversationParticipant.objects.filter(pk=participant.pk).update(
+                last_read_message=last_read,
+                last_read_at=last_read.timestamp,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='message',
+            name='chat_msg_unread_idx',
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+def backfill_direct_keys(apps, schema_editor):
+    """
+    Key every existing two-person conversation by its sorted user-id pair.
+
+    When a pair already has several conversations only the oldest one is
+    keyed, so lookups keep returning the chat with the most history.
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationParticipant = apps.get_model('chat', 'ConversationParticipant')
+
+    members = {}
+    participants = (
+        ConversationParticipant.objects
+        .order_by('conversation__created_at', 'conversation_id')
+        .values_list('conversation_id', 'user_id')
+    )
+    for conversation_id, user_id in participants.iterator(chunk_size=2000):
+        members.setdefault(conversation_id, []).append(user_id)
+
+    seen = set()
+    for conversation_id, user_ids in members.items():
+        if len(user_ids) != 2:
+            continue
+        low, high = sorted(user_ids)
+        key = f"{low}:{high}"
+        if key in seen:
+            continue
+        seen.add(key)
+        Conversation.objects.filter(pk=conversation_id).update(direct_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_read_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='direct_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_direct_keys, migrations.RunPython.noop),
+    ]
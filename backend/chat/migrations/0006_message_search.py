@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# SQLite (development and tests): an FTS5 table kept in sync by triggers.
+# Rows share the message's rowid so deletes and edits are point lookups.
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE chat_message_fts USING fts5(content, message_id UNINDEXED)",
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, content, message_id) VALUES (new.rowid, new.content, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF content ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.rowid;
+        INSERT INTO chat_message_fts(rowid, content, message_id) VALUES (new.rowid, new.content, new.id);
+    END
+    """,
+    "INSERT INTO chat_message_fts(rowid, content, message_id) SELECT rowid, content, id FROM chat_message",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TABLE IF EXISTS chat_message_fts",
+]
+
+# PostgreSQL (production): a generated tsvector column maintained by the
+# database itself on every insert and update, with a GIN index.
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE chat_message ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED
+    """,
+    "CREATE INDEX chat_msg_search_idx ON chat_message USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS chat_msg_search_idx",
+    "ALTER TABLE chat_message DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-18 18:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_prefix_indexes'),
+        ('chat', '0006_message_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSyncState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_seq', models.BigIntegerField(default=0)),
+                ('compacted_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('seq', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('message', 'New message'), ('read', 'Read state'), ('conversation', 'New conversation')], max_length=16)),
+                ('conversation_id', models.UUIDField()),
+                ('message_id', models.UUIDField(blank=True, null=True)),
+                ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='chat_changelog_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'seq'), name='chat_changelog_user_seq_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        # Nullable until backfilled, so SQLite adds the column in place
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 6.0 on 2026-10-18 18:41
+
+from django.db import migrations, transaction
+
+# Conversations numbered per transaction, and rows written per UPDATE batch
+CONVERSATION_CHUNK_SIZE = 500
+MESSAGE_BATCH_SIZE = 2000
+
+
+def backfill_message_seqs(apps, schema_editor):
+    """
+    Number existing messages 1..n per conversation in (timestamp, id) order.
+
+    Conversations are handled in chunks, each in its own transaction, so a
+    large table is never locked or held in memory as a whole. Counters and
+    read watermarks are carried over in the same transaction as the
+    messages they refer to.
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationParticipant = apps.get_model('chat', 'ConversationParticipant')
+    Message = apps.get_model('chat', 'Message')
+
+    conversation_ids = list(Conversation.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(conversation_ids), CONVERSATION_CHUNK_SIZE):
+        chunk = conversation_ids[start:start + CONVERSATION_CHUNK_SIZE]
+        with transaction.atomic():
+            last_seqs = {}
+            batch = []
+            messages = (
+                Message.objects
+                .filter(conversation_id__in=chunk)
+                .order_by('conversation_id', 'timestamp', 'id')
+                .only('id', 'conversation_id')
+            )
+            for message in messages.iterator(chunk_size=MESSAGE_BATCH_SIZE):
+                message.seq = last_seqs.get(message.conversation_id, 0) + 1
+                last_seqs[message.conversation_id] = message.seq
+                batch.append(message)
+                if len(batch) >= MESSAGE_BATCH_SIZE:
+                    Message.objects.bulk_update(batch, ['seq'])
+                    batch = []
+            Message.objects.bulk_update(batch, ['seq'])
+
+            for conversation_id, last_seq in last_seqs.items():
+                Conversation.objects.filter(pk=conversation_id).update(last_seq=last_seq)
+
+            participants = (
+                ConversationParticipant.objects
+                .filter(conversation_id__in=chunk, last_read_message__isnull=False)
+                .values_list('pk', 'last_read_message__seq')
+            )
+            for pk, last_read_seq in participants:
+                ConversationParticipant.objects.filter(pk=pk).update(last_read_seq=last_read_seq)
+
+
+class Migration(migrations.Migration):
+
+    # Each chunk commits on its own
+    atomic = False
+
+    dependencies = [
+        ('chat', '0008_message_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_message_seqs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 18:42
+
+from django.db import migrations, models
+
+# SQLite rebuilds chat_message to make `seq` NOT NULL and unique, which
+# drops the full-text triggers from 0006 and renumbers rowids. Recreate
+# the triggers and reindex whenever the table has been rebuilt.
+SQLITE_RESTORE_SEARCH = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, content, message_id) VALUES (new.rowid, new.content, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF content ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.rowid;
+        INSERT INTO chat_message_fts(rowid, content, message_id) VALUES (new.rowid, new.content, new.id);
+    END
+    """,
+    "DELETE FROM chat_message_fts",
+    "INSERT INTO chat_message_fts(rowid, content, message_id) SELECT rowid, content, id FROM chat_message",
+]
+
+
+def restore_search(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in SQLITE_RESTORE_SEARCH:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_backfill_message_seq'),
+    ]
+
+    operations = [
+        # Runs last when migrating backwards, after the table is rebuilt again
+        migrations.RunPython(migrations.RunPython.noop, restore_search),
+        migrations.AlterField(
+            model_name='message',
+            name='seq',
+            field=models.BigIntegerField(editable=False),
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='chat_msg_conv_ts_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('conversation', 'seq'), name='chat_msg_conv_seq_uniq'),
+        ),
+        migrations.RunPython(restore_search, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+from django.db import migrations
+
+# The SQLite triggers from 0006/0010 find a message's FTS row by the
+# message's implicit rowid, which VACUUM and table rebuilds may renumber,
+# after which deletes and edits hit the wrong row or none. FTS5 cannot index
+# message_id, so a small key table maps each message id to its FTS rowid;
+# the FTS table's own rowids are explicit and never renumbered.
+SQLITE_FORWARD = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    """
+    CREATE TABLE chat_message_fts_key (
+        message_id char(32) NOT NULL PRIMARY KEY,
+        fts_rowid integer NOT NULL
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(content, message_id) VALUES (new.content, new.id);
+        INSERT INTO chat_message_fts_key(message_id, fts_rowid) VALUES (new.id, last_insert_rowid());
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        DELETE FROM chat_message_fts
+        WHERE rowid = (SELECT fts_rowid FROM chat_message_fts_key WHERE message_id = old.id);
+        DELETE FROM chat_message_fts_key WHERE message_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF content ON chat_message BEGIN
+        DELETE FROM chat_message_fts
+        WHERE rowid = (SELECT fts_rowid FROM chat_message_fts_key WHERE message_id = old.id);
+        DELETE FROM chat_message_fts_key WHERE message_id = old.id;
+        INSERT INTO chat_message_fts(content, message_id) VALUES (new.content, new.id);
+        INSERT INTO chat_message_fts_key(message_id, fts_rowid) VALUES (new.id, last_insert_rowid());
+    END
+    """,
+    "DELETE FROM chat_message_fts",
+    "INSERT INTO chat_message_fts(content, message_id) SELECT content, id FROM chat_message",
+    "INSERT INTO chat_message_fts_key(message_id, fts_rowid) SELECT message_id, rowid FROM chat_message_fts",
+]
+
+
+# Backwards: the rowid triggers of 0010
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_update",
+    "DROP TRIGGER IF EXISTS chat_message_fts_delete",
+    "DROP TRIGGER IF EXISTS chat_message_fts_insert",
+    "DROP TABLE IF EXISTS chat_message_fts_key",
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, content, message_id) VALUES (new.rowid, new.content, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.rowid;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF content ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = old.rowid;
+        INSERT INTO chat_message_fts(rowid, content, message_id) VALUES (new.rowid, new.content, new.id);
+    END
+    """,
+    "DELETE FROM chat_message_fts",
+    "INSERT INTO chat_message_fts(rowid, content, message_id) SELECT rowid, content, id FROM chat_message",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_message_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(SQLITE_FORWARD), run(SQLITE_BACKWARD)),
+    ]
@@ -1,31 +1,206 @@
-from django.db import models
+from django.db import models, transaction
 import uuid
+import zlib
+from collections import Counter
 from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
 
 class Conversation(models.Model):
     id = models.UUIDField(primary_key=True,default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=128, null=True, blank=True)
+    # Sorted "<user_id>:<user_id>" pair, set only for one-on-one chats
+    direct_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # `seq` of the newest message; bumped in the inserting transaction
+    last_seq = models.BigIntegerField(default=0, editable=False)
+    # Messages up to and including this `seq` live in `ArchivedMessage`
+    archived_seq = models.BigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return str(self.id) + '->' + str(self.name)
 
+    @staticmethod
+    def build_direct_key(user_id, other_user_id) -> str:
+        """ Canonical key of the one-on-one chat between two users. """
+        low, high = sorted((int(user_id), int(other_user_id)))
+        return f"{low}:{high}"
+
 
 class ConversationParticipant(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE , related_name='participants')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     joined_at = models.DateTimeField(auto_now_add=True)
-    
-    
+    # Read watermark: everything up to and including this message has been read.
+    # Unconstrained, since the message may since have moved to the archive.
+    last_read_message = models.ForeignKey(
+        'Message', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    # `seq` of that message, 0 while nothing has been read
+    last_read_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "conversation"], name="chat_participant_user_conv_uniq"),
+        ]
+
+
+def assign_seqs(messages) -> None:
+    """
+    Give unsaved messages the next sequence numbers of their conversations.
+
+    Each conversation's counter is bumped with one UPDATE, which holds the
+    row lock until the surrounding transaction ends: concurrent inserts
+    into the same conversation queue up behind it, and a rollback returns
+    the numbers, so sequences stay gap-free. Conversations are locked in
+    id order so multi-conversation batches cannot deadlock.
+
+    Must run inside the transaction that inserts the messages.
+
+    Args:
+        messages (list): Messages in the order they should be numbered.
+
+    Returns:
+        None
+    """
+    counts = Counter(message.conversation_id for message in messages if message.seq is None)
+    if not counts:
+        return
+
+    for conversation_id in sorted(counts):
+        Conversation.objects.filter(pk=conversation_id).update(last_seq=F("last_seq") + counts[conversation_id])
+    last_seqs = dict(Conversation.objects.filter(pk__in=counts).values_list("id", "last_seq"))
+
+    next_seqs = {conversation_id: last_seqs[conversation_id] - count + 1 for conversation_id, count in counts.items()}
+    for message in messages:
+        if message.seq is None:
+            message.seq = next_seqs[message.conversation_id]
+            next_seqs[message.conversation_id] += 1
+
+
+class MessageQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """ Insert messages, numbering the ones without a `seq` first. """
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            assign_seqs(objs)
+            return super().bulk_create(objs, *args, **kwargs)
+
+
 class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField()
-    is_read = models.BooleanField(default=False)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: write-behind ingestion assigns it when the message is accepted
+    timestamp = models.DateTimeField(default=timezone.now)
+    # Gap-free position within the conversation, assigned on insert
+    seq = models.BigIntegerField(editable=False)
+
+    objects = MessageQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Latest message lookup, history pagination and unread counts
+            models.UniqueConstraint(fields=["conversation", "seq"], name="chat_msg_conv_seq_uniq"),
+        ]
     
     def __str__(self):
         return self.content
-    
\ No newline at end of file
+
+    def save(self, *args, **kwargs):
+        if self.seq is not None:
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get("using")):
+            assign_seqs([self])
+            return super().save(*args, **kwargs)
+    
+
+class UserSyncState(models.Model):
+    """ Per-user position in the change log used by delta sync. """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    # Sequence number of the user's latest change
+    last_seq = models.BigIntegerField(default=0)
+    # Changes up to and including this sequence number have been compacted away
+    compacted_seq = models.BigIntegerField(default=0)
+
+
+class ChangeLogEntry(models.Model):
+    """ One change a user's client has to apply when it syncs. """
+    MESSAGE = 'message'
+    READ = 'read'
+    CONVERSATION = 'conversation'
+    KIND_CHOICES = [
+        (MESSAGE, 'New message'),
+        (READ, 'Read state'),
+        (CONVERSATION, 'New conversation'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # Plain references, so deleting a message or conversation never touches the log
+    conversation_id = models.UUIDField()
+    message_id = models.UUIDField(null=True, blank=True)
+    # The sender, the reader, or the other participant of a new conversation
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            # Serves the `seq > since` range scan of sync
+            models.UniqueConstraint(fields=["user", "seq"], name="chat_changelog_user_seq_uniq"),
+        ]
+        indexes = [
+            # Compaction scans by age
+            models.Index(fields=["created_at"], name="chat_changelog_created_idx"),
+        ]
+
+
+class CompressedTextField(models.BinaryField):
+    """ Text stored zlib-compressed; reads and writes see plain strings. """
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return zlib.decompress(value).decode()
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = zlib.compress(value.encode())
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def to_python(self, value):
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+class ArchivedMessage(models.Model):
+    """
+    A message moved out of `Message` by the archival job.
+
+    Rows keep their id and `seq`, so cursors and read watermarks stay
+    valid. Only the (conversation, seq) index used by history pages is
+    kept; sender and receiver are not indexed.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='+', db_index=False)
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', db_index=False)
+    receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', db_index=False)
+    content = CompressedTextField()
+    timestamp = models.DateTimeField()
+    seq = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["conversation", "seq"], name="chat_archived_conv_seq_uniq"),
+        ]
+
+    def __str__(self):
+        return self.content
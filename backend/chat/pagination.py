@@ -0,0 +1,171 @@
+import base64
+import json
+import math
+import uuid
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(Exception):
+    """ Raised when a pagination cursor cannot be decoded. """
+
+
+def encode_cursor(message) -> str:
+    """
+    Encode the keyset position of a message into an opaque cursor.
+
+    Args:
+        message (Message): The message the cursor points at.
+
+    Returns:
+        str: A URL-safe base64 cursor.
+    """
+    payload = json.dumps([message.seq])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Decode an opaque cursor back into its `seq` keyset position.
+
+    Args:
+        cursor (str): A cursor produced by `encode_cursor`.
+
+    Returns:
+        int: The message's sequence number.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        seq, = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        raise InvalidCursor("Invalid cursor")
+
+    return seq
+
+
+def parse_limit(value) -> int:
+    """
+    Parse the requested page size, clamped to `MAX_PAGE_SIZE`.
+
+    Args:
+        value (str | None): The raw `limit` query parameter.
+
+    Returns:
+        int: The page size to use.
+    """
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate_messages(queryset, before=None, after=None, limit=DEFAULT_PAGE_SIZE, archive=None):
+    """
+    Fetch one page of messages by keyset on `seq`.
+
+    Without a cursor the newest `limit` messages are returned. `before`
+    returns the page immediately older than the cursor and `after` the page
+    immediately newer. Each page costs a single range scan of the unique
+    (conversation, seq) index, no matter how deep the client has scrolled.
+
+    Archived messages all come before hot ones, so `archive` is only read
+    once a page runs past the oldest hot message, or when `after` points
+    into the archive.
+
+    `prev_cursor` is only set while older messages remain. `next_cursor`
+    always points at the newest message seen so clients can keep polling
+    for new messages with `after`.
+
+    Args:
+        queryset (QuerySet): Messages of a single conversation.
+        before (str | None): Cursor to page backwards from.
+        after (str | None): Cursor to page forwards from.
+        limit (int): Page size.
+        archive (QuerySet | None): Archived messages of the same
+            conversation, with the same columns, if it has any.
+
+    Returns:
+        tuple: (messages in chronological order, prev_cursor, next_cursor)
+
+    Raises:
+        InvalidCursor: If a cursor is malformed.
+    """
+    if after:
+        seq = decode_cursor(after)
+        messages = []
+        if archive is not None:
+            messages = list(archive.filter(seq__gt=seq).order_by("seq")[:limit])
+        messages += list(queryset.filter(seq__gt=seq).order_by("seq")[:limit - len(messages)])
+        has_older = True
+    else:
+        if before:
+            seq = decode_cursor(before)
+            queryset = queryset.filter(seq__lt=seq)
+            archive = archive.filter(seq__lt=seq) if archive is not None else None
+        rows = list(queryset.order_by("-seq")[:limit + 1])
+        if archive is not None and len(rows) <= limit:
+            rows += list(archive.order_by("-seq")[:limit + 1 - len(rows)])
+        messages = rows[:limit][::-1]
+        has_older = len(rows) > limit
+
+    prev_cursor = encode_cursor(messages[0]) if messages and has_older else None
+    next_cursor = encode_cursor(messages[-1]) if messages else after
+
+    return messages, prev_cursor, next_cursor
+
+
+def encode_rank_cursor(rank: float, message_id) -> str:
+    """
+    Encode the position of a ranked search result into an opaque cursor.
+
+    Args:
+        rank (float): The result's rank, lower is better.
+        message_id (UUID): The result's message ID.
+
+    Returns:
+        str: A URL-safe base64 cursor.
+    """
+    payload = json.dumps([rank, str(message_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_rank_cursor(cursor: str) -> tuple:
+    """
+    Decode an opaque search cursor back into its (rank, id) position.
+
+    Args:
+        cursor (str): A cursor produced by `encode_rank_cursor`.
+
+    Returns:
+        tuple: The (rank, id) pair.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        rank, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+    if not isinstance(rank, (int, float)) or isinstance(rank, bool) or not math.isfinite(rank):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(message_id, str):
+        raise InvalidCursor("Invalid cursor")
+
+    try:
+        message_id = uuid.UUID(message_id)
+    except ValueError:
+        raise InvalidCursor("Invalid cursor")
+
+    return float(rank), message_id
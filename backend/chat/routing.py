@@ -2,5 +2,5 @@ from django.urls import path
 from . import consumers
 
 websocket_urlpatterns = [
-    path("ws/sc/", consumers.MyConsumer.as_asgi()),
+    path("ws/chat/<uuid:conversation_id>/", consumers.ChatConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -4,6 +4,9 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Largest id a 64-bit primary key can hold; larger ones overflow the database driver
+MAX_ID = 2**63 - 1
+
 class ConversationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Conversation
@@ -28,9 +31,15 @@ class ConversationMetaSerializer(serializers.Serializer):
     unread_count = serializers.IntegerField()
 
 
+class PresenceSerializer(serializers.Serializer):
+    online = serializers.BooleanField()
+    last_seen = serializers.DateTimeField(allow_null=True)
+
+
 class ChatListSerializer(serializers.Serializer):
     conversation_id = serializers.UUIDField()
     user = ChatUserSerializer()
+    presence = PresenceSerializer()
     conversation = ConversationMetaSerializer()
     
     
@@ -39,6 +48,13 @@ class SendMessageSerializer(serializers.Serializer):
     content = serializers.CharField(max_length=2000)
 
 
+class SendMessageBatchSerializer(serializers.Serializer):
+    # Items are validated one by one so a bad item does not fail the batch
+    messages = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=500
+    )
+
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = ChatUserSerializer()
 
@@ -47,7 +63,14 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ["id", "content", "sender", "timestamp"]
         
 class MessageListSerializer(serializers.ModelSerializer):
+    """
+    Serializes a message of a conversation history.
+
+    `is_read` is derived from the receiver's read watermark, passed in the
+    `read_watermarks` context as a {user_id: last_read_seq} mapping.
+    """
     sender = ChatUserSerializer()
+    is_read = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
@@ -59,7 +82,57 @@ class MessageListSerializer(serializers.ModelSerializer):
             "timestamp"
         ]
 
+    def get_is_read(self, message):
+        watermark = self.context.get("read_watermarks", {}).get(message.receiver_id)
+        return watermark is not None and message.seq <= watermark
+
 
 class ConversationMessagesSerializer(serializers.Serializer):
     conversation_id = serializers.UUIDField()
     messages = MessageListSerializer(many=True)
+    prev_cursor = serializers.CharField(allow_null=True)
+    next_cursor = serializers.CharField(allow_null=True)
+
+
+class ReadMessagesSerializer(serializers.Serializer):
+    conversation_id = serializers.UUIDField()
+    message_id = serializers.UUIDField(required=False)
+
+
+class ReadReceiptSerializer(serializers.Serializer):
+    conversation_id = serializers.UUIDField()
+    last_read_message_id = serializers.UUIDField(allow_null=True)
+    last_read_at = serializers.DateTimeField(allow_null=True)
+
+
+class PresenceQuerySerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID), allow_empty=False, max_length=500
+    )
+
+
+class UserPresenceSerializer(PresenceSerializer):
+    user_id = serializers.IntegerField()
+
+
+class SearchMessagesSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    cursor = serializers.CharField(required=False)
+
+
+class SearchResultSerializer(serializers.ModelSerializer):
+    conversation_id = serializers.UUIDField(read_only=True)
+    sender = ChatUserSerializer()
+
+    class Meta:
+        model = Message
+        fields = ["id", "conversation_id", "content", "sender", "timestamp"]
+
+
+class SearchResultsSerializer(serializers.Serializer):
+    results = SearchResultSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0)
@@ -0,0 +1,139 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+from ..models import ArchivedMessage, Conversation, ConversationParticipant, Message
+from .message_cache_service import TAIL_SIZE, invalidate_tail
+from .version_service import bump_versions
+
+# Limits
+ARCHIVE_BATCH_SIZE = 500              # Messages moved per transaction
+ARCHIVE_MAX_BATCHES = 200             # Batches moved per job run
+ARCHIVE_KEEP_RECENT = TAIL_SIZE + 1   # Newest messages of a conversation that always stay hot
+
+
+def archive_cutoff():
+    """ Messages stamped before this are cold. """
+    return timezone.now() - timedelta(days=settings.CHAT_ARCHIVE_AFTER_DAYS)
+
+
+def archive_conversation(conversation_id, cutoff, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move one batch of a conversation's oldest cold messages to the archive.
+
+    Messages move in `seq` order and stop at the first one newer than
+    `cutoff`, so everything up to `Conversation.archived_seq` is archived
+    and everything after it is hot. The newest `ARCHIVE_KEEP_RECENT`
+    messages never move, so chat list previews and the first history
+    page never read the archive, and neither do messages some participant
+    has not read yet, so unread counts only ever count hot messages. The
+    batch is one short transaction that locks only the conversation row
+    and the rows it moves.
+
+    Args:
+        conversation_id (UUID): The conversation to archive.
+        cutoff (datetime): Messages stamped before this are cold.
+        batch_size (int): Upper bound on messages moved.
+
+    Returns:
+        int: The number of messages moved.
+    """
+    with transaction.atomic():
+        conversation = (
+            Conversation.objects
+            .select_for_update()
+            .only("id", "last_seq", "archived_seq")
+            .get(pk=conversation_id)
+        )
+        read_by_everyone = (
+            ConversationParticipant.objects
+            .filter(conversation_id=conversation_id)
+            .aggregate(seq=Min("last_read_seq"))["seq"]
+        ) or 0
+        last_archivable = min(conversation.last_seq - ARCHIVE_KEEP_RECENT, read_by_everyone)
+        messages = list(
+            Message.objects
+            .filter(conversation_id=conversation_id, seq__gt=conversation.archived_seq, seq__lte=last_archivable)
+            .order_by("seq")[:batch_size]
+        )
+
+        cold = []
+        for message in messages:
+            if message.timestamp >= cutoff:
+                break
+            cold.append(message)
+        if not cold:
+            return 0
+
+        ArchivedMessage.objects.bulk_create([
+            ArchivedMessage(
+                id=message.id,
+                conversation_id=message.conversation_id,
+                sender_id=message.sender_id,
+                receiver_id=message.receiver_id,
+                content=message.content,
+                timestamp=message.timestamp,
+                seq=message.seq,
+            )
+            for message in cold
+        ])
+        # A plain DELETE skips the per-row post_delete signal; the tail and
+        # ETags are invalidated once for the whole batch below
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(Message._meta.db_table)} WHERE conversation_id = %s AND seq <= %s",
+                [Message._meta.get_field("conversation").get_db_prep_value(conversation_id, connection), cold[-1].seq],
+            )
+        Conversation.objects.filter(pk=conversation_id).update(archived_seq=cold[-1].seq)
+
+        user_ids = {user_id for message in cold for user_id in (message.sender_id, message.receiver_id)}
+        transaction.on_commit(lambda: invalidate_tail(conversation_id))
+        transaction.on_commit(lambda: bump_versions([conversation_id], user_ids))
+    return len(cold)
+
+
+def archive_messages(max_batches: int = ARCHIVE_MAX_BATCHES, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move cold messages of every conversation to the archive, batch by batch.
+
+    Only conversations created before the cutoff with more than
+    `ARCHIVE_KEEP_RECENT` hot messages, some of them read by every
+    participant, can have anything to move. Batches that find nothing
+    cold do not count towards `max_batches`.
+
+    Args:
+        max_batches (int): Upper bound on batches moved in one call.
+        batch_size (int): Upper bound on messages moved per batch.
+
+    Returns:
+        int: The number of messages moved.
+    """
+    cutoff = archive_cutoff()
+    candidates = (
+        Conversation.objects
+        .alias(read_by_everyone=Min("participants__last_read_seq"))
+        .filter(
+            created_at__lt=cutoff,
+            archived_seq__lt=F("last_seq") - ARCHIVE_KEEP_RECENT,
+            read_by_everyone__gt=F("archived_seq"),
+        )
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+    moved = 0
+    batches = 0
+    for conversation_id in candidates.iterator(chunk_size=1000):
+        while batches < max_batches:
+            count = archive_conversation(conversation_id, cutoff, batch_size)
+            if not count:
+                break
+            batches += 1
+            moved += count
+            if count < batch_size:
+                break
+        if batches >= max_batches:
+            break
+    return moved
@@ -0,0 +1,41 @@
+from django.db import IntegrityError, transaction
+from ..models import Conversation, ConversationParticipant
+from .sync_service import record_conversation_change
+from .version_service import bump_versions
+
+
+def get_or_create_direct_conversation(user, other_user):
+    """
+    Return the one-on-one conversation between two users, creating it once.
+
+    The lookup is a single read on the unique `direct_key` index. Creation
+    runs in one transaction and relies on that unique index to settle races:
+    when a parallel request wins, the IntegrityError is swallowed and its
+    conversation returned instead of a duplicate.
+
+    Args:
+        user (User): The requesting user.
+        other_user (User): The user to chat with.
+
+    Returns:
+        tuple: (Conversation, created)
+    """
+    direct_key = Conversation.build_direct_key(user.id, other_user.id)
+
+    conversation = Conversation.objects.filter(direct_key=direct_key).first()
+    if conversation:
+        return conversation, False
+
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(direct_key=direct_key)
+            ConversationParticipant.objects.bulk_create([
+                ConversationParticipant(conversation=conversation, user=user),
+                ConversationParticipant(conversation=conversation, user=other_user),
+            ])
+            record_conversation_change(conversation, user, other_user)
+    except IntegrityError:
+        return Conversation.objects.get(direct_key=direct_key), False
+
+    transaction.on_commit(lambda: bump_versions(user_ids=[user.id, other_user.id]))
+    return conversation, True
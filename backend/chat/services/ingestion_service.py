@@ -0,0 +1,242 @@
+import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+from livechat.async_redis import get_async_redis_connection
+from ..models import Conversation, ConversationParticipant, Message
+from .message_cache_service import invalidate_tail
+from .message_service import broadcast_messages, bump_message_versions
+from .sync_service import record_message_changes
+
+User = get_user_model()
+
+CONSUMER_GROUP = "chat-ingest"
+BATCH_SIZE = 500           # Entries read and inserted per round trip
+CLAIM_IDLE_MS = 60_000     # Pending entries idle this long belong to a dead worker
+
+
+def stream_key() -> str:
+    """
+    Return the Redis Stream that accepted messages are appended to.
+
+    Returns:
+        str: The stream key, configurable via `CHAT_INGESTION_STREAM`.
+    """
+    return getattr(settings, "CHAT_INGESTION_STREAM", "chat:ingest")
+
+
+def is_stream_mode() -> bool:
+    """
+    Check whether messages are written behind through the Redis Stream.
+
+    Returns:
+        bool: True when `CHAT_INGESTION_MODE` is "stream".
+    """
+    return getattr(settings, "CHAT_INGESTION_MODE", "sync") == "stream"
+
+
+def enqueue_message(conversation_id, sender, receiver_id, content: str) -> Message:
+    """
+    Accept a message by appending it to the ingestion stream.
+
+    The id and timestamp are assigned here, so the client gets its final
+    identity immediately and a later replay of the entry is idempotent.
+    Subscribers are only sent the message once the drain persisted it, so
+    they never see one that ends up dead-lettered.
+
+    Args:
+        conversation_id (UUID): The conversation to post into.
+        sender (User): The user sending the message.
+        receiver_id (int): The receiving participant's user ID.
+        content (str): The message body.
+
+    Returns:
+        Message: The accepted, not yet persisted, message.
+    """
+    message = _accepted_message(conversation_id, sender, receiver_id, content)
+    # No MAXLEN: trimming could drop entries that were already answered with 202
+    get_redis_connection("default").xadd(stream_key(), _stream_fields(message))
+    return message
+
+
+async def aenqueue_message(conversation_id, sender, receiver_id, content: str) -> Message:
+    """ Async version of `enqueue_message`, on the asyncio Redis client. """
+    message = _accepted_message(conversation_id, sender, receiver_id, content)
+    await get_async_redis_connection().xadd(stream_key(), _stream_fields(message))
+    return message
+
+
+def _accepted_message(conversation_id, sender, receiver_id, content: str) -> Message:
+    return Message(
+        id=uuid.uuid4(),
+        conversation_id=conversation_id,
+        sender=sender,
+        receiver_id=receiver_id,
+        content=content,
+        timestamp=timezone.now(),
+    )
+
+
+def _stream_fields(message: Message) -> dict:
+    return {
+        "id": str(message.id),
+        "conversation_id": str(message.conversation_id),
+        "sender_id": str(message.sender_id),
+        "receiver_id": str(message.receiver_id),
+        "content": message.content,
+        "timestamp": message.timestamp.isoformat(),
+    }
+
+
+def ensure_consumer_group(redis) -> None:
+    """ Create the consumer group (and the stream) if it does not exist yet. """
+    try:
+        redis.xgroup_create(stream_key(), CONSUMER_GROUP, id="0", mkstream=True)
+    except ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+
+
+def dead_letter_key() -> str:
+    """ Return the stream that entries which can no longer be persisted are moved to. """
+    return f"{stream_key()}:dead"
+
+
+def _parse_entry(fields) -> Message:
+    fields = {key.decode(): value.decode() for key, value in fields.items()}
+    return Message(
+        id=uuid.UUID(fields["id"]),
+        conversation_id=uuid.UUID(fields["conversation_id"]),
+        sender_id=int(fields["sender_id"]),
+        receiver_id=int(fields["receiver_id"]),
+        content=fields["content"],
+        timestamp=parse_datetime(fields["timestamp"]),
+    )
+
+
+def _persist_entries(redis, entries) -> int:
+    """
+    Insert a batch of stream entries, then acknowledge and delete them.
+
+    Entries redelivered after a crash between INSERT and XACK are skipped,
+    so each message is written, numbered and logged for delta sync exactly
+    once. Entries that can no longer be inserted, because their
+    conversation or one of its participants was deleted after the 202, or
+    that do not parse, are moved to the dead-letter stream on their own,
+    so they never hold back the rest of the batch.
+
+    Returns:
+        int: The number of messages inserted, which leaves out redelivered
+        and dead-lettered entries.
+    """
+    if not entries:
+        return 0
+
+    messages = {}
+    dead = {}
+    for entry_id, fields in entries:
+        try:
+            messages[entry_id] = _parse_entry(fields)
+        except (KeyError, ValueError, TypeError, UnicodeDecodeError):
+            dead[entry_id] = (fields, "malformed")
+
+    with transaction.atomic():
+        # Lock the conversations first, so the redelivery check and the
+        # numbering below cannot race another worker on the same entries
+        conversation_ids = sorted({message.conversation_id for message in messages.values()})
+        list(Conversation.objects.select_for_update().filter(id__in=conversation_ids).order_by("id").values_list("id"))
+        participants = set(
+            ConversationParticipant.objects
+            .filter(conversation_id__in=conversation_ids)
+            .values_list("conversation_id", "user_id")
+        )
+        fields_by_id = dict(entries)
+        for entry_id, message in list(messages.items()):
+            sender = (message.conversation_id, message.sender_id)
+            receiver = (message.conversation_id, message.receiver_id)
+            if sender not in participants or receiver not in participants:
+                dead[entry_id] = (fields_by_id[entry_id], "not a participant")
+                del messages[entry_id]
+
+        message_ids = [message.id for message in messages.values()]
+        existing = set(Message.objects.filter(id__in=message_ids).values_list("id", flat=True))
+        new_messages = [message for message in messages.values() if message.id not in existing]
+        Message.objects.bulk_create(new_messages)
+        record_message_changes(new_messages)
+    # Entries carry no sender details to render, so affected tails are refilled on read
+    invalidate_tail(*{message.conversation_id for message in new_messages})
+    bump_message_versions(new_messages)
+    # Only now that the messages are committed are they pushed to subscribers
+    senders = User.objects.in_bulk({message.sender_id for message in new_messages})
+    for message in new_messages:
+        message.sender = senders[message.sender_id]
+    broadcast_messages(new_messages)
+
+    # Acknowledged entries are deleted, so the stream only holds work that is left
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipe = redis.pipeline()
+    for entry_id, (fields, reason) in dead.items():
+        pipe.xadd(dead_letter_key(), {**fields, "entry_id": entry_id, "reason": reason})
+    pipe.xack(stream_key(), CONSUMER_GROUP, *entry_ids)
+    pipe.xdel(stream_key(), *entry_ids)
+    pipe.execute()
+    return len(new_messages)
+
+
+def drain_stream(consumer: str, max_batches: int = 20) -> int:
+    """
+    Persist new stream entries in batches until the stream is caught up.
+
+    Args:
+        consumer (str): This worker's consumer name within the group.
+        max_batches (int): Upper bound on batches handled in one call.
+
+    Returns:
+        int: The number of messages inserted.
+    """
+    redis = get_redis_connection("default")
+    ensure_consumer_group(redis)
+
+    persisted = 0
+    for _ in range(max_batches):
+        response = redis.xreadgroup(CONSUMER_GROUP, consumer, {stream_key(): ">"}, count=BATCH_SIZE)
+        entries = response[0][1] if response else []
+        persisted += _persist_entries(redis, entries)
+        if len(entries) < BATCH_SIZE:
+            break
+    return persisted
+
+
+def recover_pending(consumer: str, min_idle_ms: int = CLAIM_IDLE_MS, max_batches: int = 20) -> int:
+    """
+    Claim and persist entries a crashed worker read but never acknowledged.
+
+    Args:
+        consumer (str): The consumer name that takes over the entries.
+        min_idle_ms (int): Only claim entries pending for at least this long.
+        max_batches (int): Upper bound on batches handled in one call.
+
+    Returns:
+        int: The number of messages inserted.
+    """
+    redis = get_redis_connection("default")
+    ensure_consumer_group(redis)
+
+    persisted = 0
+    start_id = "0-0"
+    for _ in range(max_batches):
+        start_id, entries, *_ = redis.xautoclaim(
+            stream_key(), CONSUMER_GROUP, consumer, min_idle_ms, start_id=start_id, count=BATCH_SIZE
+        )
+        # Entries deleted from the stream by hand come back empty and cannot be recovered
+        trimmed = [entry_id for entry_id, fields in entries if not fields]
+        if trimmed:
+            redis.xack(stream_key(), CONSUMER_GROUP, *trimmed)
+        persisted += _persist_entries(redis, [entry for entry in entries if entry[1]])
+        if start_id in (b"0-0", "0-0"):
+            break
+    return persisted
@@ -0,0 +1,306 @@
+import json
+from django_redis import get_redis_connection
+from livechat.async_redis import get_async_redis_connection
+from ..fast_serializers import message_mapper, message_row
+from ..pagination import encode_cursor
+
+# Limits
+TAIL_SIZE = 50           # Newest messages served from the cache per conversation
+
+# Time windows
+TAIL_TTL = 600           # seconds an idle conversation's tail is kept
+
+STATS_HITS_KEY = "chat:tail:stats:hits"
+STATS_MISSES_KEY = "chat:tail:stats:misses"
+
+# KEYS: readers, generation  ARGV: user id, watermark, ttl
+# Moves a cached watermark forward only; a missing hash is left for the next fill.
+RECORD_READ_SCRIPT = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]))
+if current and current >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS: tail, readers, hits, misses, generation  ARGV: rows to read
+# Returns {rows, readers} on a hit, or {false, generation} on a miss.
+READ_TAIL_SCRIPT = """
+local rows = redis.call('LRANGE', KEYS[1], -tonumber(ARGV[1]), -1)
+local readers = {}
+if #rows > 0 then
+    readers = redis.call('HGETALL', KEYS[2])
+end
+if #rows == 0 or #readers == 0 then
+    redis.call('INCR', KEYS[4])
+    return {false, redis.call('GET', KEYS[5]) or '0'}
+end
+redis.call('INCR', KEYS[3])
+return {rows, readers}
+"""
+
+# KEYS: tail, readers, generation  ARGV: expected generation, ttl, reader count, readers..., rows...
+# Only fills when no write happened since the generation was read.
+FILL_TAIL_SCRIPT = """
+if (redis.call('GET', KEYS[3]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+local reader_count = tonumber(ARGV[3])
+for i = 4, 3 + reader_count * 2, 2 do
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+end
+for i = 4 + reader_count * 2, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+# KEYS: tail, readers, generation  ARGV: ttl, max length, first seq, entries...
+# Appends only when the entries continue the cached tail without a gap;
+# commits whose on_commit pushes run out of order drop the tail instead.
+PUSH_TAIL_SCRIPT = """
+redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], tonumber(ARGV[1]) * 2)
+local last = redis.call('LINDEX', KEYS[1], -1)
+if not last then
+    return 0
+end
+if cjson.decode(last)['seq'] + 1 ~= tonumber(ARGV[3]) then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 0
+end
+for i = 4, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+def tail_key(conversation_id) -> str:
+    return f"chat:tail:{conversation_id}"
+
+
+def readers_key(conversation_id) -> str:
+    return f"chat:tail:{conversation_id}:readers"
+
+
+def generation_key(conversation_id) -> str:
+    return f"chat:tail:{conversation_id}:gen"
+
+
+def _entry(message, to_dict) -> str:
+    """ Serialize a message row for the tail; `is_read` is filled in per read. """
+    return json.dumps({
+        "message": to_dict(message),
+        "receiver_id": message.receiver_id,
+        "seq": message.seq,
+        "cursor": encode_cursor(message),
+    })
+
+
+def read_tail(conversation_id, user_id, limit: int):
+    """
+    Serve the newest `limit` messages of a conversation from the tail cache.
+
+    One Redis round trip returns the cached messages and the participants'
+    read watermarks, so a hit does not touch the database at all.
+
+    Args:
+        conversation_id (UUID | str): The conversation's ID.
+        user_id (int): The requesting user's ID.
+        limit (int): Page size, at most `TAIL_SIZE`.
+
+    Returns:
+        tuple: (payload, None) on a hit, or (None, generation) on a miss,
+        where `generation` must be passed back to `fill_tail`.
+    """
+    result = get_redis_connection("default").eval(*_read_tail_args(conversation_id, limit))
+    return _tail_page(conversation_id, user_id, limit, result)
+
+
+async def aread_tail(conversation_id, user_id, limit: int):
+    """ Async version of `read_tail`, on the asyncio Redis client. """
+    result = await get_async_redis_connection().eval(*_read_tail_args(conversation_id, limit))
+    return _tail_page(conversation_id, user_id, limit, result)
+
+
+def _read_tail_args(conversation_id, limit: int) -> tuple:
+    return (
+        READ_TAIL_SCRIPT, 5,
+        tail_key(conversation_id), readers_key(conversation_id),
+        STATS_HITS_KEY, STATS_MISSES_KEY, generation_key(conversation_id),
+        limit + 1,
+    )
+
+
+def _tail_page(conversation_id, user_id, limit: int, result):
+    """ Turn a `READ_TAIL_SCRIPT` reply into the `read_tail` result. """
+    rows, readers = result
+    if not rows:
+        return None, readers
+
+    readers = dict(zip(readers[::2], readers[1::2]))
+    if str(user_id).encode() not in readers:
+        # Let the database path answer with the proper error
+        return None, None
+
+    watermarks = {int(reader): int(watermark) for reader, watermark in readers.items()}
+    entries = [json.loads(row) for row in rows]
+    page = entries[-limit:]
+
+    messages = []
+    for entry in page:
+        watermark = watermarks.get(entry["receiver_id"])
+        messages.append({
+            **entry["message"],
+            "is_read": watermark is not None and entry["seq"] <= watermark,
+        })
+
+    return {
+        "conversation_id": str(conversation_id),
+        "messages": messages,
+        "prev_cursor": page[0]["cursor"] if page and len(entries) > limit else None,
+        "next_cursor": page[-1]["cursor"] if page else None,
+    }, None
+
+
+def fill_tail(conversation_id, messages, participants, generation) -> bool:
+    """
+    Populate a conversation's tail after a cache miss.
+
+    Args:
+        conversation_id (UUID): The conversation's ID.
+        messages (list): Up to `TAIL_SIZE + 1` newest message rows, oldest first.
+        participants (list): The conversation's participant rows.
+        generation (bytes | str): The generation returned by `read_tail`.
+
+    Returns:
+        bool: False if a concurrent write made the snapshot stale.
+    """
+    if not messages:
+        return False
+    return bool(get_redis_connection("default").eval(*_fill_tail_args(conversation_id, messages, participants, generation)))
+
+
+async def afill_tail(conversation_id, messages, participants, generation) -> bool:
+    """ Async version of `fill_tail`, on the asyncio Redis client. """
+    if not messages:
+        return False
+    return bool(await get_async_redis_connection().eval(
+        *_fill_tail_args(conversation_id, messages, participants, generation)
+    ))
+
+
+def _fill_tail_args(conversation_id, messages, participants, generation) -> tuple:
+    readers = []
+    for participant in participants:
+        readers.extend([participant.user_id, participant.last_read_seq])
+
+    to_dict = message_mapper()
+    return (
+        FILL_TAIL_SCRIPT, 3,
+        tail_key(conversation_id), readers_key(conversation_id), generation_key(conversation_id),
+        generation, TAIL_TTL, len(participants), *readers, *[_entry(message, to_dict) for message in messages],
+    )
+
+
+def push_to_tail(messages) -> None:
+    """
+    Append newly written messages to the tails that are currently cached.
+
+    Tails that are not cached stay absent, and the generation bump stops
+    any fill that read the database before these writes. Concurrent
+    writers' on_commit callbacks can run in another order than their
+    commits, so a push that does not continue the cached tail's seqs drops
+    the tail rather than leave a gap. Every push refreshes the TTL.
+
+    Args:
+        messages (list): Newly persisted messages, oldest first.
+
+    Returns:
+        None
+    """
+    by_conversation = {}
+    for message in messages:
+        by_conversation.setdefault(message.conversation_id, []).append(message)
+
+    to_dict = message_mapper()
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for conversation_id, conversation_messages in by_conversation.items():
+        conversation_messages.sort(key=lambda message: message.seq)
+        first_seq = conversation_messages[0].seq
+        if conversation_messages[-1].seq - first_seq + 1 != len(conversation_messages):
+            first_seq = -1    # not contiguous: never matches, so the tail is dropped
+        entries = [_entry(message_row(message), to_dict) for message in conversation_messages]
+        pipeline.eval(
+            PUSH_TAIL_SCRIPT, 3,
+            tail_key(conversation_id), readers_key(conversation_id), generation_key(conversation_id),
+            TAIL_TTL, TAIL_SIZE + 1, first_seq, *entries,
+        )
+    pipeline.execute()
+
+
+def invalidate_tail(*conversation_ids) -> None:
+    """
+    Drop cached tails, e.g. after messages were deleted or written elsewhere.
+
+    Args:
+        *conversation_ids (UUID): The conversations to drop.
+
+    Returns:
+        None
+    """
+    if not conversation_ids:
+        return
+
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for conversation_id in conversation_ids:
+        pipeline.incr(generation_key(conversation_id))
+        pipeline.expire(generation_key(conversation_id), TAIL_TTL * 2)
+        pipeline.delete(tail_key(conversation_id), readers_key(conversation_id))
+    pipeline.execute()
+
+
+def record_read(participant) -> None:
+    """
+    Apply a participant's new read watermark to the cached read state.
+
+    The cached watermark only ever moves forward, so out-of-order commits
+    cannot regress it, and the generation bump stops a concurrent fill
+    from writing back the watermark it read before this change.
+
+    Args:
+        participant (ConversationParticipant): The participant that read.
+
+    Returns:
+        None
+    """
+    get_redis_connection("default").eval(
+        RECORD_READ_SCRIPT, 2,
+        readers_key(participant.conversation_id), generation_key(participant.conversation_id),
+        participant.user_id, participant.last_read_seq, TAIL_TTL * 2,
+    )
+
+
+def tail_cache_stats() -> dict:
+    """
+    Return the tail cache's hit and miss counters.
+
+    Returns:
+        dict: {"hits": int, "misses": int}
+    """
+    hits, misses = get_redis_connection("default").mget(STATS_HITS_KEY, STATS_MISSES_KEY)
+    return {"hits": int(hits or 0), "misses": int(misses or 0)}
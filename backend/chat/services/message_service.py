@@ -0,0 +1,242 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+from ..models import ConversationParticipant, Message
+from ..serializers import MessageSerializer
+from .message_cache_service import push_to_tail, record_read
+from .sync_service import record_message_changes, record_read_change
+from .version_service import bump_versions
+
+
+def conversation_group_name(conversation_id) -> str:
+    """
+    Build the channel layer group name for a conversation.
+
+    Args:
+        conversation_id (UUID | str): The conversation's ID.
+
+    Returns:
+        str: A group name in the format "chat.conversation.<id>".
+    """
+    return f"chat.conversation.{conversation_id}"
+
+
+def create_message(conversation, sender, content: str) -> Message:
+    """
+    Persist a message from `sender` and push it to the conversation's group.
+
+    The sender must already be known to be a participant. The push is
+    deferred until the surrounding transaction commits, so subscribers never
+    receive a message that was rolled back.
+
+    Args:
+        conversation (Conversation): The conversation to post into.
+        sender (User): The user sending the message.
+        content (str): The message body.
+
+    Returns:
+        Message: The created message.
+    """
+    receiver = (
+        ConversationParticipant.objects
+        .filter(conversation=conversation)
+        .exclude(user=sender)
+        .select_related("user")
+        .first()
+        .user
+    )
+
+    with transaction.atomic():
+        message = Message.objects.create(
+            conversation=conversation,
+            sender=sender,
+            receiver=receiver,
+            content=content,
+        )
+        record_message_changes([message])
+
+    transaction.on_commit(lambda: push_to_tail([message]))
+    transaction.on_commit(lambda: bump_message_versions([message]))
+    transaction.on_commit(lambda: broadcast_message(message))
+    return message
+
+
+def create_messages(sender, drafts):
+    """
+    Persist many messages from `sender`, possibly across several conversations.
+
+    Membership of every referenced conversation is checked with a single
+    query, and all accepted messages are written with one `bulk_create`.
+
+    Args:
+        sender (User): The user sending the messages.
+        drafts (list): (conversation_id, content) pairs, in request order.
+
+    Returns:
+        list: One entry per draft, either the created Message or None when
+        the sender is not a participant of that conversation.
+    """
+    conversation_ids = {conversation_id for conversation_id, _ in drafts}
+    members = {}
+    participants = (
+        ConversationParticipant.objects
+        .filter(conversation_id__in=conversation_ids)
+        .values_list("conversation_id", "user_id")
+    )
+    for conversation_id, user_id in participants:
+        members.setdefault(conversation_id, []).append(user_id)
+
+    results = []
+    for conversation_id, content in drafts:
+        user_ids = members.get(conversation_id, [])
+        receiver_ids = [user_id for user_id in user_ids if user_id != sender.id]
+        if sender.id not in user_ids or not receiver_ids:
+            results.append(None)
+            continue
+
+        results.append(Message(
+            conversation_id=conversation_id,
+            sender=sender,
+            receiver_id=receiver_ids[0],
+            content=content,
+        ))
+
+    messages = [message for message in results if message is not None]
+    Message.objects.bulk_create(messages)
+    record_message_changes(messages)
+
+    transaction.on_commit(lambda: push_to_tail(messages))
+    transaction.on_commit(lambda: bump_message_versions(messages))
+    for message in messages:
+        transaction.on_commit(lambda message=message: broadcast_message(message))
+    return results
+
+
+def bump_message_versions(messages) -> None:
+    """
+    Invalidate the ETags that new messages change.
+
+    That is the history of each conversation and the chat lists of the
+    senders and receivers.
+
+    Args:
+        messages (list): Newly persisted messages.
+
+    Returns:
+        None
+    """
+    bump_versions(
+        [message.conversation_id for message in messages],
+        [user_id for message in messages for user_id in (message.sender_id, message.receiver_id)],
+    )
+
+
+def broadcast_message(message: Message) -> None:
+    """
+    Publish a persisted message to every socket subscribed to its conversation.
+
+    Args:
+        message (Message): The message to publish.
+
+    Returns:
+        None
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async_to_sync(channel_layer.group_send)(conversation_group_name(message.conversation_id), _message_event(message))
+
+
+def broadcast_messages(messages) -> None:
+    """
+    Publish many persisted messages, in order, with one trip onto the event loop.
+
+    Args:
+        messages (list): The messages to publish, with their senders loaded.
+
+    Returns:
+        None
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not messages:
+        return
+
+    async def send_all():
+        for message in messages:
+            await channel_layer.group_send(conversation_group_name(message.conversation_id), _message_event(message))
+
+    async_to_sync(send_all)()
+
+
+def _message_event(message: Message) -> dict:
+    return {
+        "type": "chat.message",
+        "conversation_id": str(message.conversation_id),
+        "message": dict(MessageSerializer(message).data),
+    }
+
+
+def advance_read_watermark(participant, message) -> bool:
+    """
+    Mark everything up to `message` as read for a participant.
+
+    This is a single-row conditional UPDATE no matter how many messages it
+    covers, and it never moves the watermark backwards. `last_read_at` is
+    when the read happened, not when `message` was sent. A forward move is
+    logged for every participant's delta sync.
+
+    Args:
+        participant (ConversationParticipant): The reader's participant row.
+        message (Message): The newest message the reader has seen.
+
+    Returns:
+        bool: True if the watermark moved forward.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        advanced = (
+            ConversationParticipant.objects
+            .filter(pk=participant.pk)
+            .filter(last_read_seq__lt=message.seq)
+            .update(last_read_message=message, last_read_at=now, last_read_seq=message.seq)
+        )
+        if not advanced:
+            return False
+
+        participant.last_read_message = message
+        participant.last_read_at = now
+        participant.last_read_seq = message.seq
+        record_read_change(participant)
+
+    transaction.on_commit(lambda: record_read(participant))
+    transaction.on_commit(lambda: bump_versions([participant.conversation_id], [participant.user_id]))
+    transaction.on_commit(lambda: broadcast_read(participant))
+    return True
+
+
+def broadcast_read(participant) -> None:
+    """
+    Publish a participant's new read watermark to the conversation's group.
+
+    Args:
+        participant (ConversationParticipant): The participant that read.
+
+    Returns:
+        None
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async_to_sync(channel_layer.group_send)(
+        conversation_group_name(participant.conversation_id),
+        {
+            "type": "chat.read",
+            "conversation_id": str(participant.conversation_id),
+            "user_id": participant.user_id,
+            "last_read_message_id": str(participant.last_read_message_id),
+            "last_read_at": participant.last_read_at.isoformat(),
+        },
+    )
@@ -0,0 +1,261 @@
+import time
+from datetime import datetime, timezone
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django_redis import get_redis_connection
+from livechat.async_redis import get_async_redis_connection
+from ..models import ConversationParticipant
+from .message_service import conversation_group_name
+from .version_service import bump_versions
+
+# Time windows
+PRESENCE_TTL = 60                     # seconds a socket stays online without a heartbeat
+HEARTBEAT_INTERVAL = 25               # seconds between client heartbeats
+LAST_SEEN_TTL = 30 * 24 * 60 * 60     # seconds "last seen" is remembered
+
+# Limits
+SWEEP_BATCH_SIZE = 500                # users checked per sweep round trip
+
+# Users with live sockets, scored by the deadline of their latest socket (ms)
+DEADLINES_KEY = "presence:deadlines"
+
+# KEYS: online, sockets, last seen, deadlines
+# ARGV: channel name, now (ms), ttl, last seen ttl, user id
+# Registers or refreshes one socket; returns 1 if the user just came online.
+TOUCH_SCRIPT = """
+local deadline = tonumber(ARGV[2]) + tonumber(ARGV[3]) * 1000
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+redis.call('ZADD', KEYS[2], deadline, ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('ZADD', KEYS[4], deadline, ARGV[5])
+local was_online = redis.call('EXISTS', KEYS[1])
+redis.call('SET', KEYS[1], '1', 'EX', ARGV[3])
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[4])
+return 1 - was_online
+"""
+
+# Same keys and arguments; returns 1 if the user's last live socket just left.
+# Also 1 when the online key had already expired but no sweep announced it yet.
+LEAVE_SCRIPT = """
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[4])
+local latest = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+if #latest > 0 then
+    redis.call('ZADD', KEYS[4], latest[2], ARGV[5])
+    return 0
+end
+local tracked = redis.call('ZREM', KEYS[4], ARGV[5])
+local online = redis.call('DEL', KEYS[1])
+if tracked + online > 0 then
+    return 1
+end
+return 0
+"""
+
+# KEYS: deadlines, then online and sockets of each user  ARGV: now (ms), user ids
+# Takes users whose every socket missed its heartbeat offline; returns their ids.
+SWEEP_SCRIPT = """
+local expired = {}
+for index = 2, #ARGV do
+    local online, sockets = KEYS[index * 2 - 2], KEYS[index * 2 - 1]
+    redis.call('ZREMRANGEBYSCORE', sockets, '-inf', ARGV[1])
+    local latest = redis.call('ZRANGE', sockets, -1, -1, 'WITHSCORES')
+    if #latest > 0 then
+        redis.call('ZADD', KEYS[1], latest[2], ARGV[index])
+    else
+        redis.call('ZREM', KEYS[1], ARGV[index])
+        redis.call('DEL', online)
+        table.insert(expired, ARGV[index])
+    end
+end
+return expired
+"""
+
+
+def online_key(user_id) -> str:
+    return f"presence:{user_id}"
+
+
+def sockets_key(user_id) -> str:
+    return f"presence:{user_id}:sockets"
+
+
+def last_seen_key(user_id) -> str:
+    return f"presence:{user_id}:seen"
+
+
+def _run(script: str, user_id, channel_name: str) -> bool:
+    return bool(get_redis_connection("default").eval(
+        script, 4,
+        online_key(user_id), sockets_key(user_id), last_seen_key(user_id), DEADLINES_KEY,
+        channel_name, int(time.time() * 1000), PRESENCE_TTL, LAST_SEEN_TTL, user_id,
+    ))
+
+
+def mark_online(user_id, channel_name: str) -> bool:
+    """
+    Register a socket of a user, or refresh it on a heartbeat.
+
+    Each socket is tracked with its own deadline, so a user with several
+    open sockets stays online until the last of them leaves or times out.
+
+    Args:
+        user_id (int): The user's ID.
+        channel_name (str): The socket's channel layer name.
+
+    Returns:
+        bool: True if the user was offline before this call.
+    """
+    return _run(TOUCH_SCRIPT, user_id, channel_name)
+
+
+def mark_offline(user_id, channel_name: str) -> bool:
+    """
+    Unregister a socket of a user.
+
+    Args:
+        user_id (int): The user's ID.
+        channel_name (str): The socket's channel layer name.
+
+    Returns:
+        bool: True if this was the user's last live socket.
+    """
+    return _run(LEAVE_SCRIPT, user_id, channel_name)
+
+
+def get_presence(user_ids) -> dict:
+    """
+    Look up the presence of many users in a single MGET.
+
+    Args:
+        user_ids (Iterable[int]): The users to look up.
+
+    Returns:
+        dict: {user_id: {"online": bool, "last_seen": datetime | None}}
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    return _presence_from_values(user_ids, get_redis_connection("default").mget(_presence_keys(user_ids)))
+
+
+async def aget_presence(user_ids) -> dict:
+    """ Async version of `get_presence`, on the asyncio Redis client. """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+    return _presence_from_values(user_ids, await get_async_redis_connection().mget(_presence_keys(user_ids)))
+
+
+def _presence_keys(user_ids) -> list:
+    return [online_key(user_id) for user_id in user_ids] + [last_seen_key(user_id) for user_id in user_ids]
+
+
+def _presence_from_values(user_ids, values) -> dict:
+    online, last_seen = values[:len(user_ids)], values[len(user_ids):]
+
+    return {
+        user_id: {
+            "online": is_online is not None,
+            "last_seen": (
+                datetime.fromtimestamp(int(seen) / 1000, tz=timezone.utc)
+                if seen is not None else None
+            ),
+        }
+        for user_id, is_online, seen in zip(user_ids, online, last_seen)
+    }
+
+
+def broadcast_presence(user_id, online: bool) -> None:
+    """
+    Publish a presence change to the conversations the user takes part in.
+
+    Only sockets of those conversations receive it, so presence never leaks
+    to users who do not share a conversation with `user_id`. The chat list
+    ETags of those users are invalidated as well.
+
+    Args:
+        user_id (int): The user whose presence changed.
+        online (bool): Whether the user is now online.
+
+    Returns:
+        None
+    """
+    participants = list(
+        ConversationParticipant.objects
+        .filter(conversation__participants__user_id=user_id)
+        .values_list("conversation_id", "user_id")
+    )
+    conversation_ids = {conversation_id for conversation_id, _ in participants}
+    # Presence lives in Redis, so there is nothing for a replica to catch up on
+    bump_versions(user_ids={contact_id for _, contact_id in participants if contact_id != user_id}, pin=False)
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    last_seen = get_presence([user_id])[user_id]["last_seen"]
+    for conversation_id in conversation_ids:
+        async_to_sync(channel_layer.group_send)(
+            conversation_group_name(conversation_id),
+            {
+                "type": "chat.presence",
+                "conversation_id": str(conversation_id),
+                "user_id": user_id,
+                "online": online,
+                "last_seen": last_seen.isoformat() if last_seen else None,
+            },
+        )
+
+
+def sweep_expired_presence(batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """
+    Announce users whose sockets died without a clean disconnect as offline.
+
+    Their online key simply expires, which tells no one: contacts would go
+    on seeing them online, and chat lists would keep answering 304. Every
+    user past the deadline of their latest socket is taken offline here and
+    broadcast like a regular disconnect, which also bumps the chat list
+    ETags of their contacts.
+
+    Args:
+        batch_size (int): Users checked per round trip.
+
+    Returns:
+        int: The number of users taken offline.
+    """
+    redis = get_redis_connection("default")
+    expired = 0
+    while True:
+        now = int(time.time() * 1000)
+        user_ids = redis.zrangebyscore(DEADLINES_KEY, "-inf", now, start=0, num=batch_size)
+        if not user_ids:
+            return expired
+
+        keys = [key for user_id in user_ids for key in (online_key(user_id.decode()), sockets_key(user_id.decode()))]
+        for user_id in redis.eval(SWEEP_SCRIPT, len(keys) + 1, DEADLINES_KEY, *keys, now, *user_ids):
+            broadcast_presence(int(user_id), False)
+            expired += 1
+        if len(user_ids) < batch_size:
+            return expired
+
+
+def contact_ids(user, user_ids) -> set:
+    """
+    Keep the users that share a conversation with `user`.
+
+    Args:
+        user (User): The asking user.
+        user_ids (Iterable[int]): Candidate user IDs.
+
+    Returns:
+        set: The IDs of `user`'s contacts among `user_ids`.
+    """
+    return set(
+        ConversationParticipant.objects
+        .filter(conversation__participants__user=user, user_id__in=user_ids)
+        .exclude(user=user)
+        .values_list("user_id", flat=True)
+    )
+
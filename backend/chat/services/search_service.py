@@ -0,0 +1,102 @@
+import re
+from django.db import connection
+from ..models import Message
+
+# Limits
+MAX_QUERY_LENGTH = 200
+MAX_QUERY_TERMS = 10
+
+SQLITE_SEARCH = """
+    SELECT message_id, rank FROM (
+        SELECT m.id AS message_id, bm25(chat_message_fts) AS rank
+        FROM chat_message_fts f
+        JOIN chat_message m ON m.id = f.message_id
+        JOIN chat_conversationparticipant p ON p.conversation_id = m.conversation_id AND p.user_id = %s
+        WHERE chat_message_fts MATCH %s
+    )
+    {where}
+    ORDER BY rank, message_id
+    LIMIT %s
+"""
+
+# ts_rank grows with relevance; it is negated so that, as with bm25, lower ranks first
+POSTGRES_SEARCH = """
+    SELECT message_id, rank FROM (
+        SELECT m.id AS message_id, -ts_rank(m.search_vector, query)::float8 AS rank
+        FROM chat_message m
+        JOIN chat_conversationparticipant p ON p.conversation_id = m.conversation_id AND p.user_id = %s,
+        plainto_tsquery('simple', %s) query
+        WHERE m.search_vector @@ query
+    ) ranked
+    {where}
+    ORDER BY rank, message_id
+    LIMIT %s
+"""
+
+AFTER_CURSOR = "WHERE rank > %s OR (rank = %s AND message_id > %s)"
+
+
+class UnsupportedSearchBackend(Exception):
+    """ Raised when the database has no full-text index for messages. """
+
+
+def search_terms(query: str) -> list:
+    """
+    Split a user query into plain search terms.
+
+    Operators and punctuation are dropped so that any input is a valid
+    full-text query; every remaining term must match.
+
+    Args:
+        query (str): The raw user query.
+
+    Returns:
+        list: Up to `MAX_QUERY_TERMS` terms.
+    """
+    return re.findall(r"\w+", query[:MAX_QUERY_LENGTH])[:MAX_QUERY_TERMS]
+
+
+def search_messages(user, query: str, after=None, limit: int = 20):
+    """
+    Full-text search the messages of the conversations `user` takes part in.
+
+    Args:
+        user (User): The searching user.
+        query (str): The raw user query.
+        after (tuple | None): A decoded (rank, id) cursor to continue from.
+        limit (int): Maximum number of results.
+
+    Returns:
+        list: (message, rank) pairs, best match first. Messages come with
+        their sender loaded.
+
+    Raises:
+        UnsupportedSearchBackend: On databases other than SQLite and PostgreSQL.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == "sqlite":
+        sql = SQLITE_SEARCH
+        match = " ".join(f'"{term}"' for term in terms)
+    elif connection.vendor == "postgresql":
+        sql = POSTGRES_SEARCH
+        match = " ".join(terms)
+    else:
+        raise UnsupportedSearchBackend(connection.vendor)
+
+    params = [user.id, match]
+    if after is not None:
+        rank, message_id = after
+        params += [rank, rank, Message._meta.pk.get_db_prep_value(message_id, connection)]
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(where=AFTER_CURSOR if after is not None else ""), params)
+        rows = cursor.fetchall()
+
+    pk_field = Message._meta.pk
+    ranked = [(pk_field.to_python(message_id), rank) for message_id, rank in rows]
+    messages = Message.objects.select_related("sender").in_bulk([message_id for message_id, _ in ranked])
+    return [(messages[message_id], rank) for message_id, rank in ranked if message_id in messages]
@@ -0,0 +1,262 @@
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from accounts.models import User
+from ..fast_serializers import datetime_formatter, latest_message_mapper, message_rows, user_mapper, user_rows
+from ..models import ChangeLogEntry, ConversationParticipant, Message, UserSyncState
+
+# Limits
+MAX_SYNC_CHANGES = 500        # Changes returned per sync call
+COMPACTION_BATCH_SIZE = 5000  # Entries deleted per compaction transaction
+
+# Time windows
+CHANGE_LOG_RETENTION = timedelta(days=14)
+
+
+def lock_sync_states(user_ids) -> dict:
+    """
+    Create any missing sync states and lock them for the surrounding transaction.
+
+    Locks are taken in user id order, so concurrent writers cannot deadlock.
+
+    Args:
+        user_ids (Iterable[int]): Users whose logs are about to grow.
+
+    Returns:
+        dict: UserSyncState by user ID.
+    """
+    user_ids = sorted(set(user_ids))
+    UserSyncState.objects.bulk_create(
+        [UserSyncState(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+    return {
+        state.user_id: state
+        for state in UserSyncState.objects.select_for_update().filter(user_id__in=user_ids).order_by("user_id")
+    }
+
+
+def record_changes(changes, created_at=None) -> None:
+    """
+    Append changes to the logs of the users they concern.
+
+    Sequence numbers are handed out under a row lock on each user's sync
+    state. Call this inside the transaction that makes the change, so the
+    log never runs ahead of, or behind, the data.
+
+    Args:
+        changes (list): (user_id, kind, conversation_id, message_id, actor_id)
+            tuples, in the order they happened.
+        created_at (datetime | None): When the changes happened. Defaults
+            to now.
+
+    Returns:
+        None
+    """
+    if not changes:
+        return
+
+    with transaction.atomic():
+        states = lock_sync_states(change[0] for change in changes)
+
+        now = created_at or timezone.now()
+        entries = []
+        for user_id, kind, conversation_id, message_id, actor_id in changes:
+            state = states[user_id]
+            state.last_seq += 1
+            entries.append(ChangeLogEntry(
+                user_id=user_id,
+                seq=state.last_seq,
+                kind=kind,
+                conversation_id=conversation_id,
+                message_id=message_id,
+                actor_id=actor_id,
+                created_at=now,
+            ))
+
+        UserSyncState.objects.bulk_update(states.values(), ["last_seq"])
+        ChangeLogEntry.objects.bulk_create(entries)
+
+
+def record_message_changes(messages) -> None:
+    """
+    Log new messages for their senders and receivers.
+
+    The entries are built by the database from the message rows with one
+    INSERT ... SELECT, numbering each user's entries after their locked
+    `last_seq`, and the states are moved to the new maxima with one UPDATE.
+    A batch of any size is a fixed number of statements: a row per sender
+    and receiver would otherwise exceed SQLite's parameter limit and be
+    split into several INSERTs.
+
+    Args:
+        messages (list): Messages already saved in the current transaction.
+
+    Returns:
+        None
+    """
+    if not messages:
+        return
+
+    user_ids = {user_id for message in messages for user_id in (message.sender_id, message.receiver_id)}
+    message_id = Message._meta.pk
+    created_at = ChangeLogEntry._meta.get_field("created_at")
+    quote = connection.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(messages))
+    sql = f"""
+        INSERT INTO {quote(ChangeLogEntry._meta.db_table)}
+            (user_id, seq, kind, conversation_id, message_id, actor_id, created_at)
+        SELECT
+            state.user_id,
+            state.last_seq + ROW_NUMBER() OVER (
+                PARTITION BY state.user_id ORDER BY message.timestamp, message.seq, message.id
+            ),
+            %s, message.conversation_id, message.id, message.sender_id, %s
+        FROM {quote(Message._meta.db_table)} message
+        CROSS JOIN (SELECT 0 AS side UNION ALL SELECT 1 AS side) sides
+        JOIN {quote(UserSyncState._meta.db_table)} state
+            ON state.user_id = CASE sides.side WHEN 0 THEN message.sender_id ELSE message.receiver_id END
+        WHERE message.id IN ({placeholders})
+    """
+    params = [
+        ChangeLogEntry.MESSAGE,
+        created_at.get_db_prep_value(timezone.now(), connection),
+        *[message_id.get_db_prep_value(message.id, connection) for message in messages],
+    ]
+
+    with transaction.atomic():
+        lock_sync_states(user_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        latest_seq = ChangeLogEntry.objects.filter(user_id=OuterRef("user_id")).order_by("-seq").values("seq")[:1]
+        UserSyncState.objects.filter(user_id__in=user_ids).update(last_seq=Subquery(latest_seq))
+
+
+def record_read_change(participant) -> None:
+    """ Log a moved read watermark for every participant of the conversation. """
+    user_ids = (
+        ConversationParticipant.objects
+        .filter(conversation_id=participant.conversation_id)
+        .values_list("user_id", flat=True)
+    )
+    record_changes([
+        (user_id, ChangeLogEntry.READ, participant.conversation_id, participant.last_read_message_id, participant.user_id)
+        for user_id in user_ids
+    ], created_at=participant.last_read_at)
+
+
+def record_conversation_change(conversation, user, other_user) -> None:
+    """ Log a new one-on-one conversation for both of its participants. """
+    record_changes([
+        (user.id, ChangeLogEntry.CONVERSATION, conversation.id, None, other_user.id),
+        (other_user.id, ChangeLogEntry.CONVERSATION, conversation.id, None, user.id),
+    ])
+
+
+def get_changes(user, since: int, limit: int = MAX_SYNC_CHANGES) -> dict:
+    """
+    Return the changes of `user` after sequence number `since`.
+
+    The page is one range scan on the (user, seq) index plus one bulk read
+    each for the referenced messages and users. Several read changes of
+    one reader in one conversation collapse into the latest.
+
+    Args:
+        user (User): The syncing user.
+        since (int): The last sequence number the client has applied.
+        limit (int): Maximum number of log entries to read.
+
+    Returns:
+        dict: {"resync": True, "seq": int} when the client must reload
+        everything, else {"resync": False, "seq", "has_more", "changes"}.
+    """
+    state = UserSyncState.objects.filter(user=user).first()
+    last_seq = state.last_seq if state else 0
+    if (state and since < state.compacted_seq) or since > last_seq:
+        return {"resync": True, "seq": last_seq}
+
+    entries = list(ChangeLogEntry.objects.filter(user=user, seq__gt=since).order_by("seq")[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    message_ids = {entry.message_id for entry in entries if entry.kind == ChangeLogEntry.MESSAGE}
+    messages = {row.id: row for row in message_rows(Message.objects.filter(id__in=message_ids))}
+    user_ids = {entry.actor_id for entry in entries if entry.kind == ChangeLogEntry.CONVERSATION}
+    users = {row.id: row for row in user_rows(User.objects.filter(id__in=user_ids))}
+
+    # Keep only the latest read change per (conversation, reader)
+    latest_reads = {}
+    for entry in entries:
+        if entry.kind == ChangeLogEntry.READ:
+            latest_reads[(entry.conversation_id, entry.actor_id)] = entry.seq
+
+    message_to_dict = latest_message_mapper()
+    user_to_dict = user_mapper()
+    format_datetime = datetime_formatter()
+    changes = []
+    for entry in entries:
+        change = {"seq": entry.seq, "type": entry.kind, "conversation_id": str(entry.conversation_id)}
+
+        if entry.kind == ChangeLogEntry.MESSAGE:
+            message = messages.get(entry.message_id)
+            if message is None:
+                continue
+            change["message"] = message_to_dict(message)
+
+        elif entry.kind == ChangeLogEntry.READ:
+            if latest_reads[(entry.conversation_id, entry.actor_id)] != entry.seq:
+                continue
+            change["user_id"] = entry.actor_id
+            change["last_read_message_id"] = str(entry.message_id) if entry.message_id else None
+            change["last_read_at"] = format_datetime(entry.created_at)
+
+        elif entry.kind == ChangeLogEntry.CONVERSATION:
+            other_user = users.get(entry.actor_id)
+            change["user"] = user_to_dict(other_user) if other_user else None
+
+        changes.append(change)
+
+    return {
+        "resync": False,
+        "seq": entries[-1].seq if entries else since,
+        "has_more": has_more,
+        "changes": changes,
+    }
+
+
+def compact_change_log(retention: timedelta = CHANGE_LOG_RETENTION) -> int:
+    """
+    Delete log entries older than `retention`, oldest first, in batches.
+
+    Each user's `compacted_seq` is raised to the newest entry deleted for
+    them, so a client asking for anything older is told to resync.
+
+    Args:
+        retention (timedelta): How long entries are kept.
+
+    Returns:
+        int: The number of entries deleted.
+    """
+    cutoff = timezone.now() - retention
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                ChangeLogEntry.objects
+                .filter(created_at__lt=cutoff)
+                .order_by("created_at", "id")
+                .values_list("id", "user_id", "seq")[:COMPACTION_BATCH_SIZE]
+            )
+            if not batch:
+                return deleted
+
+            compacted = {}
+            for _, user_id, seq in batch:
+                compacted[user_id] = max(seq, compacted.get(user_id, 0))
+            states = list(UserSyncState.objects.select_for_update().filter(user_id__in=compacted))
+            for state in states:
+                state.compacted_seq = max(state.compacted_seq, compacted[state.user_id])
+            UserSyncState.objects.bulk_update(states, ["compacted_seq"])
+
+            ChangeLogEntry.objects.filter(id__in=[entry_id for entry_id, _, _ in batch]).delete()
+            deleted += len(batch)
@@ -0,0 +1,126 @@
+import asyncio
+import uuid
+from livechat.async_redis import get_async_redis_connection
+
+# Time windows
+TYPING_THROTTLE = 3.0    # seconds between "typing" events of one user in one conversation
+TYPING_TIMEOUT = 5.0     # seconds without keystrokes before "stopped typing" is sent
+
+
+# KEYS: typing slot  ARGV: releasing socket's token
+# Deletes the slot only if that socket holds it; returns 1 if the socket may
+# announce "stopped typing": it holds the slot, or the slot expired unclaimed.
+RELEASE_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if holder == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+if not holder then
+    return 1
+end
+return 0
+"""
+
+
+def typing_key(conversation_id, user_id) -> str:
+    return f"typing:{conversation_id}:{user_id}"
+
+
+async def aclaim_typing_slot(conversation_id, user_id, token: str, throttle: float = TYPING_THROTTLE) -> bool:
+    """
+    Claim the right to publish a "typing" event for the next `throttle` seconds.
+
+    The claim is shared by every socket of the user, in every process, so
+    several open tabs still produce a single event per window. It runs on
+    the asyncio Redis client, so a keystroke never takes a worker thread. The slot
+    holds the claiming socket's `token`, so only that socket releases it.
+
+    Args:
+        conversation_id (UUID): The conversation being typed in.
+        user_id (int): The typing user's ID.
+        token (str): Identifies the claiming socket.
+        throttle (float): The window in seconds.
+
+    Returns:
+        bool: True if the caller should publish.
+    """
+    return bool(await get_async_redis_connection().set(
+        typing_key(conversation_id, user_id), token, nx=True, px=int(throttle * 1000)
+    ))
+
+
+async def arelease_typing_slot(conversation_id, user_id, token: str) -> bool:
+    """
+    Let the next keystroke publish right away once the user stopped typing.
+
+    A compare-and-delete: a slot claimed since by another socket of the
+    user is left alone, since that socket is still typing.
+
+    Returns:
+        bool: True if the caller may publish "stopped typing".
+    """
+    return bool(await get_async_redis_connection().eval(
+        RELEASE_SCRIPT, 1, typing_key(conversation_id, user_id), token
+    ))
+
+
+class TypingIndicator:
+    """
+    Coalesces one socket's keystroke events into "typing" / "stopped typing".
+
+    Keystrokes inside the throttle window are absorbed locally without
+    touching Redis, and a timer publishes "stopped typing" once no
+    keystroke arrived for `timeout` seconds. Only a socket that published
+    "typing" publishes "stopped typing", and not while another socket of
+    the user holds the slot. Nothing is persisted.
+    """
+
+    def __init__(self, conversation_id, user_id, publish, throttle=TYPING_THROTTLE, timeout=TYPING_TIMEOUT):
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        self.publish = publish
+        self.throttle = throttle
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+        self.deadline = None
+        self.published_at = None
+        self.announced = False
+        self.timer = None
+
+    async def keystroke(self) -> None:
+        """ Record a keystroke, publishing "typing" at most once per throttle window. """
+        now = asyncio.get_running_loop().time()
+        self.deadline = now + self.timeout
+        if self.timer is None:
+            self.timer = asyncio.create_task(self._expire())
+
+        if self.published_at is not None and now - self.published_at < self.throttle:
+            return
+
+        self.published_at = now
+        if await aclaim_typing_slot(self.conversation_id, self.user_id, self.token, self.throttle):
+            self.announced = True
+            await self.publish(True)
+
+    async def stop(self) -> None:
+        """ Publish "stopped typing" if this socket is currently typing and announced it. """
+        if self.timer is None:
+            return
+
+        if self.timer is not asyncio.current_task():
+            self.timer.cancel()
+        self.timer = None
+        self.deadline = None
+        self.published_at = None
+        announced, self.announced = self.announced, False
+        if not announced:
+            return
+        if await arelease_typing_slot(self.conversation_id, self.user_id, self.token):
+            await self.publish(False)
+
+    async def _expire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self.deadline is not None and self.deadline > loop.time():
+            await asyncio.sleep(self.deadline - loop.time())
+        await self.stop()
@@ -0,0 +1,154 @@
+import time
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+from django_redis import get_redis_connection
+from livechat.async_redis import get_async_redis_connection
+from livechat.db_router import pin_key
+
+# Time windows
+VERSION_TTL = 7 * 24 * 60 * 60    # seconds a version is kept after its last change
+
+# KEYS: versions to bump, then read pins to set
+# ARGV: seed for missing versions, ttl, number of versions, pin seconds
+# A missing version is re-seeded rather than counted up from zero, so it can
+# never repeat a value an earlier ETag was built from.
+BUMP_SCRIPT = """
+local versions = tonumber(ARGV[3])
+for index, key in ipairs(KEYS) do
+    if index > versions then
+        redis.call('SET', key, 1, 'EX', ARGV[4])
+    else
+        if redis.call('EXISTS', key) == 1 then
+            redis.call('INCR', key)
+        else
+            redis.call('SET', key, ARGV[1])
+        end
+        redis.call('EXPIRE', key, ARGV[2])
+    end
+end
+return versions
+"""
+
+# KEYS: version, members hash  ARGV: seed for a missing version, ttl, member
+# Returns {version, 1 | 0}, or {version, -1} when the members are not cached.
+MEMBER_VERSION_SCRIPT = """
+local version = redis.call('GET', KEYS[1])
+if not version then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    version = ARGV[1]
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    return {version, -1}
+end
+return {version, redis.call('HEXISTS', KEYS[2], ARGV[3])}
+"""
+
+
+def user_version_key(user_id) -> str:
+    return f"chat:version:user:{user_id}"
+
+
+def conversation_version_key(conversation_id) -> str:
+    return f"chat:version:conversation:{conversation_id}"
+
+
+def get_version(key: str) -> str:
+    """
+    Read a version counter, seeding it on first use.
+
+    Args:
+        key (str): A user or conversation version key.
+
+    Returns:
+        str: The current version.
+    """
+    redis = get_redis_connection("default")
+    version = redis.get(key)
+    if version is None:
+        redis.set(key, time.time_ns(), nx=True, ex=VERSION_TTL)
+        version = redis.get(key)
+    return version.decode()
+
+
+async def aget_version(key: str) -> str:
+    """ Async version of `get_version`, on the asyncio Redis client. """
+    redis = get_async_redis_connection()
+    version = await redis.get(key)
+    if version is None:
+        await redis.set(key, time.time_ns(), nx=True, ex=VERSION_TTL)
+        version = await redis.get(key)
+    return version.decode()
+
+
+def get_member_version(key: str, members_key: str, member) -> tuple:
+    """
+    Read a version counter and check a membership in one round trip.
+
+    Args:
+        key (str): A version key, seeded on first use.
+        members_key (str): A Redis hash whose fields are the members.
+        member: The field to look for.
+
+    Returns:
+        tuple: (version, is_member), where `is_member` is None when the
+        members hash is not cached and the caller must check elsewhere.
+    """
+    version, is_member = get_redis_connection("default").eval(
+        MEMBER_VERSION_SCRIPT, 2, key, members_key, time.time_ns(), VERSION_TTL, member,
+    )
+    return _member_version(version, is_member)
+
+
+async def aget_member_version(key: str, members_key: str, member) -> tuple:
+    """ Async version of `get_member_version`, on the asyncio Redis client. """
+    version, is_member = await get_async_redis_connection().eval(
+        MEMBER_VERSION_SCRIPT, 2, key, members_key, time.time_ns(), VERSION_TTL, member,
+    )
+    return _member_version(version, is_member)
+
+
+def _member_version(version, is_member) -> tuple:
+    version = version.decode() if isinstance(version, bytes) else str(version)
+    return version, None if is_member == -1 else bool(is_member)
+
+
+def bump_versions(conversation_ids=(), user_ids=(), pin: bool = True) -> None:
+    """
+    Invalidate the ETags of the given conversations and users in one round trip.
+
+    User versions cover the chat list; conversation versions cover
+    message history. With read replicas the users are also pinned to the
+    primary for a moment, so a new ETag is never paired with a response
+    from a replica that has not seen the change yet.
+
+    Args:
+        conversation_ids (Iterable[UUID]): Conversations whose history changed.
+        user_ids (Iterable[int]): Users whose chat list changed.
+        pin (bool): False when the change is not in the database.
+
+    Returns:
+        None
+    """
+    keys = [conversation_version_key(conversation_id) for conversation_id in set(conversation_ids)]
+    keys += [user_version_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+
+    pins = [pin_key(user_id) for user_id in set(user_ids)] if pin and settings.DATABASE_REPLICAS else []
+    get_redis_connection("default").eval(
+        BUMP_SCRIPT, len(keys) + len(pins), *keys, *pins,
+        time.time_ns(), VERSION_TTL, len(keys), settings.DATABASE_PIN_SECONDS,
+    )
+
+
+def make_etag(*parts) -> str:
+    """
+    Build an opaque ETag from a version and whatever else shapes the response.
+
+    Args:
+        *parts: The version, the requesting user's ID, request parameters...
+
+    Returns:
+        str: An unquoted ETag value.
+    """
+    return salted_hmac("chat.etag", ":".join(str(part) for part in parts)).hexdigest()[:32]
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Message
+from .services.message_cache_service import invalidate_tail
+from .services.version_service import bump_versions
+
+
+@receiver(post_delete, sender=Message)
+def drop_cached_tail(sender, instance, **kwargs):
+    """ Keep deleted messages out of the conversation's cached tail and ETags. """
+    conversation_id = instance.conversation_id
+    user_ids = [instance.sender_id, instance.receiver_id]
+    transaction.on_commit(lambda: invalidate_tail(conversation_id))
+    transaction.on_commit(lambda: bump_versions([conversation_id], user_ids))
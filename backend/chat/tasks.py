@@ -0,0 +1,88 @@
+# chat/tasks.py
+import os
+import socket
+from celery import shared_task
+from .services.archive_service import archive_messages
+from .services.ingestion_service import drain_stream, recover_pending
+from .services.presence_service import sweep_expired_presence
+from .services.sync_service import compact_change_log
+
+
+def consumer_name() -> str:
+    """ Name of this worker process within the ingestion consumer group. """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@shared_task(ignore_result=True)
+def drain_message_stream():
+    """
+    Persist messages accepted through the Redis ingestion stream, then
+    push them to their conversations' subscribers.
+
+    Scheduled every second by Celery beat in stream mode. Each worker process reads as its
+    own group consumer, so several workers drain the stream in parallel
+    without handing out the same entry twice.
+
+    Returns:
+        None
+    """
+    drain_stream(consumer_name())
+
+
+@shared_task(ignore_result=True)
+def recover_message_stream():
+    """
+    Take over stream entries left pending by a crashed worker.
+
+    Entries that were read but never acknowledged for `CLAIM_IDLE_MS` are
+    claimed by this worker and persisted; inserts are idempotent, so an entry
+    that was written before the crash is not duplicated.
+
+    Returns:
+        None
+    """
+    recover_pending(consumer_name())
+
+
+@shared_task(ignore_result=True)
+def compact_sync_log():
+    """
+    Drop delta sync log entries past their retention.
+
+    Scheduled hourly by Celery beat. Clients that last synced before the
+    dropped entries are told to do a full resync.
+
+    Returns:
+        None
+    """
+    compact_change_log()
+
+
+@shared_task(ignore_result=True)
+def archive_cold_messages():
+    """
+    Move messages older than `CHAT_ARCHIVE_AFTER_DAYS` to the archive.
+
+    Scheduled every five minutes by Celery beat. Each run moves a bounded
+    number of small batches, so a large backlog drains over several runs
+    without long locks on the hot table.
+
+    Returns:
+        None
+    """
+    archive_messages()
+
+
+@shared_task(ignore_result=True)
+def sweep_presence():
+    """
+    Take users whose sockets stopped sending heartbeats offline.
+
+    Scheduled every ten seconds by Celery beat. A socket that dies without
+    a clean disconnect is only noticed here, so contacts see the user go
+    offline at most this long after the presence TTL runs out.
+
+    Returns:
+        None
+    """
+    sweep_expired_presence()
@@ -1,3 +1,1818 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django_redis import get_redis_connection
+from django.db.models import Count, QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+from accounts.models import User
+from accounts.services.user_cache_service import invalidate_user
+from accounts.tests import AsyncURLConf, clear_rate_limits
+from accounts.throttles import RedisScopedThrottle
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.renderers import JSONRenderer
+from livechat.async_redis import get_async_redis_connection
+from livechat.db_router import (
+    ReplicaRouter, RoutingState, _routing, is_pinned, pin_key, pin_to_primary, read_from_primary
+)
+from .fast_serializers import (
+    latest_message_mapper, message_mapper, message_row, message_rows, user_mapper, user_rows
+)
+from .models import ArchivedMessage, ChangeLogEntry, Conversation, ConversationParticipant, Message, UserSyncState
+from .renderers import ORJSONRenderer
+from .serializers import ChatUserSerializer, LatestMessageSerializer, MessageListSerializer
+from .routing import websocket_urlpatterns
+from .services.ingestion_service import (
+    CONSUMER_GROUP, dead_letter_key, drain_stream, ensure_consumer_group, recover_pending, stream_key
+)
+from .pagination import encode_cursor
+from .services.archive_service import ARCHIVE_KEEP_RECENT, archive_messages
+from .services.conversation_service import get_or_create_direct_conversation
+from .services.message_cache_service import (
+    TAIL_SIZE, fill_tail, invalidate_tail, push_to_tail, read_tail, tail_cache_stats, tail_key
+)
+from .services.message_service import advance_read_watermark, conversation_group_name, create_message
+from .services.sync_service import compact_change_log
+from .services.typing_service import TypingIndicator, typing_key
+from .services.version_service import (
+    bump_versions, conversation_version_key, get_version, make_etag, user_version_key
+)
+from .services.presence_service import (
+    DEADLINES_KEY, PRESENCE_TTL, broadcast_presence, get_presence, last_seen_key, mark_offline, mark_online,
+    online_key, sockets_key, sweep_expired_presence
+)
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+def create_conversation(user, other_user):
+    """ Create a one-on-one conversation between two users. """
+    conversation = Conversation.objects.create()
+    ConversationParticipant.objects.create(conversation=conversation, user=user)
+    ConversationParticipant.objects.create(conversation=conversation, user=other_user)
+    return conversation
+
+
+def clear_presence(*users):
+    """ Forget any presence left in Redis for these users by earlier tests. """
+    keys = [key(user.id) for user in users for key in (online_key, sockets_key, last_seen_key)]
+    get_redis_connection("default").delete(*keys)
+    get_redis_connection("default").zrem(DEADLINES_KEY, *[user.id for user in users])
+
+
+class GetAllChatsViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_chat(self, index):
+        other_user = User.objects.create_user(email=f"user{index}@example.com", name=f"User {index}")
+        conversation = create_conversation(self.user, other_user)
+        Message.objects.create(conversation=conversation, sender=other_user, receiver=self.user, content="hi")
+        Message.objects.create(conversation=conversation, sender=self.user, receiver=other_user, content="hello")
+        Message.objects.create(conversation=conversation, sender=other_user, receiver=self.user, content="how are you?")
+        return conversation, other_user
+
+    def fetch_query_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/v1/chat/list/all/")
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_payload(self):
+        conversation, other_user = self.add_chat(1)
+
+        response = self.client.get("/api/v1/chat/list/all/")
+
+        self.assertEqual(len(response.data), 1)
+        chat = response.data[0]
+        self.assertEqual(chat["conversation_id"], str(conversation.id))
+        self.assertEqual(chat["user"], {"id": other_user.id, "name": "User 1", "email": "user1@example.com"})
+        self.assertEqual(chat["conversation"]["unread_count"], 2)
+        self.assertEqual(chat["conversation"]["latest_message"]["content"], "how are you?")
+        self.assertEqual(chat["conversation"]["latest_message"]["sender"]["id"], other_user.id)
+
+    def test_empty_conversation(self):
+        other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        create_conversation(self.user, other_user)
+
+        response = self.client.get("/api/v1/chat/list/all/")
+
+        self.assertIsNone(response.data[0]["conversation"]["latest_message"])
+        self.assertEqual(response.data[0]["conversation"]["unread_count"], 0)
+
+    def test_query_count_is_constant(self):
+        self.add_chat(1)
+        self.add_chat(2)
+        baseline = self.fetch_query_count()
+
+        for index in range(3, 13):
+            self.add_chat(index)
+
+        self.assertEqual(self.fetch_query_count(), baseline)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class SendMessageBatchViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.bob = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.carol = User.objects.create_user(email="carol@example.com", name="Carol")
+        self.with_bob = create_conversation(self.user, self.bob)
+        self.with_carol = create_conversation(self.user, self.carol)
+        self.not_mine = create_conversation(self.bob, self.carol)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        clear_rate_limits()
+        self.addCleanup(clear_rate_limits)
+        self.set_rates("1000/min")
+
+    def set_rates(self, rate):
+        patcher = mock.patch.object(
+            RedisScopedThrottle, "THROTTLE_RATES", {"send_message.user": rate, "send_message.ip": "1000/min"}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, messages):
+        return self.client.post("/api/v1/chat/message/send/batch/", {"messages": messages}, format="json")
+
+    def test_messages_across_conversations(self):
+        response = self.send([
+            {"conversation_id": str(self.with_bob.id), "content": "hi bob"},
+            {"conversation_id": str(self.with_carol.id), "content": "hi carol"},
+            {"conversation_id": str(self.with_bob.id), "content": "again bob"},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result["status"] for result in response.data["results"]], [201, 201, 201])
+        self.assertEqual(response.data["results"][1]["message"]["content"], "hi carol")
+        self.assertIsNotNone(response.data["results"][1]["message"]["timestamp"])
+        self.assertEqual(Message.objects.filter(receiver=self.bob).count(), 2)
+        self.assertEqual(Message.objects.get(content="hi carol").receiver, self.carol)
+
+    def test_per_item_errors(self):
+        response = self.send([
+            {"conversation_id": str(self.not_mine.id), "content": "sneaky"},
+            {"conversation_id": str(self.with_bob.id), "content": ""},
+            {"conversation_id": str(self.with_bob.id), "content": "valid"},
+        ])
+
+        results = response.data["results"]
+        self.assertEqual([result["index"] for result in results], [0, 1, 2])
+        self.assertEqual([result["status"] for result in results], [403, 400, 201])
+        self.assertEqual(list(Message.objects.values_list("content", flat=True)), ["valid"])
+
+    def test_query_count_is_constant(self):
+        def send_batch(size):
+            messages = [
+                {"conversation_id": str(conversation.id), "content": f"message {index}"}
+                for index in range(size)
+                for conversation in (self.with_bob, self.with_carol)
+            ]
+            with CaptureQueriesContext(connection) as context:
+                self.send(messages)
+            return len(context.captured_queries)
+
+        self.assertEqual(send_batch(2), send_batch(50))
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite parameter limit")
+    def test_query_count_is_constant_under_old_sqlite_parameter_limit(self):
+        # SQLite before 3.32 allows 999 parameters per statement
+        connection.ensure_connection()
+        limit = connection.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        self.addCleanup(connection.connection.setlimit, sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+        self.test_query_count_is_constant()
+
+    def test_batch_size_is_bounded(self):
+        messages = [{"conversation_id": str(self.with_bob.id), "content": "x"}] * 501
+        self.assertEqual(self.send(messages).status_code, 400)
+
+    def test_throttle_is_charged_per_item(self):
+        self.set_rates("3/min")
+        messages = [{"conversation_id": str(self.with_bob.id), "content": f"message {index}"} for index in range(5)]
+        # Invalid items are not charged
+        response = self.send([{"conversation_id": str(self.with_bob.id), "content": ""}] + messages)
+
+        results = response.data["results"]
+        self.assertEqual([result["status"] for result in results], [400, 201, 201, 201, 429, 429])
+        self.assertGreater(results[-1]["retry_after"], 0)
+        self.assertEqual(Message.objects.count(), 3)
+
+        # Nothing left: the whole batch is throttled
+        response = self.send(messages[:1])
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    def test_single_sends_and_batches_share_the_limit(self):
+        self.set_rates("3/min")
+        for _ in range(2):
+            self.client.post(
+                "/api/v1/chat/message/send/", {"conversation_id": str(self.with_bob.id), "content": "single"}
+            )
+
+        response = self.send([{"conversation_id": str(self.with_bob.id), "content": "batched"}] * 2)
+        self.assertEqual([result["status"] for result in response.data["results"]], [201, 429])
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    CHAT_INGESTION_MODE="stream",
+    CHAT_INGESTION_STREAM=f"test:chat:ingest:{uuid.uuid4()}",
+)
+class StreamIngestionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.redis = get_redis_connection("default")
+        self.addCleanup(self.redis.delete, stream_key())
+
+    def send(self, content):
+        return self.client.post(
+            "/api/v1/chat/message/send/",
+            {"conversation_id": str(self.conversation.id), "content": content},
+        )
+
+    def test_send_is_accepted_then_drained(self):
+        response = self.send("hello")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Message.objects.exists())
+
+        self.assertEqual(drain_stream("worker-1"), 1)
+
+        message = Message.objects.get()
+        self.assertEqual(str(message.id), response.data["id"])
+        self.assertEqual(message.receiver, self.other_user)
+        self.assertEqual(message.timestamp, parse_datetime(response.data["timestamp"]))
+        self.assertEqual(self.redis.xpending(stream_key(), CONSUMER_GROUP)["pending"], 0)
+        self.assertEqual(self.redis.xlen(stream_key()), 0)
+
+    def test_entry_of_deleted_conversation_is_dead_lettered_alone(self):
+        self.addCleanup(self.redis.delete, dead_letter_key())
+        other = User.objects.create_user(email="carol@example.com", name="Carol")
+        doomed = create_conversation(self.user, other)
+        self.send("kept")
+        self.client.post("/api/v1/chat/message/send/", {"conversation_id": str(doomed.id), "content": "lost"})
+        self.send("also kept")
+        doomed.delete()
+
+        self.assertEqual(drain_stream("worker-1"), 2)
+
+        self.assertEqual(list(Message.objects.order_by("seq").values_list("content", flat=True)), ["kept", "also kept"])
+        self.assertEqual(self.redis.xpending(stream_key(), CONSUMER_GROUP)["pending"], 0)
+        self.assertEqual(self.redis.xlen(stream_key()), 0)
+        [(_, fields)] = self.redis.xrange(dead_letter_key())
+        self.assertEqual(fields[b"content"], b"lost")
+        self.assertEqual(fields[b"reason"], b"not a participant")
+
+    def test_dead_lettered_entries_are_never_broadcast(self):
+        self.addCleanup(self.redis.delete, dead_letter_key())
+        other = User.objects.create_user(email="carol@example.com", name="Carol")
+        doomed = create_conversation(self.user, other)
+        self.client.post("/api/v1/chat/message/send/", {"conversation_id": str(doomed.id), "content": "lost"})
+        self.send("kept")
+        doomed.delete()
+
+        with mock.patch("chat.services.ingestion_service.broadcast_messages") as broadcast:
+            drain_stream("worker-1")
+
+        [messages], _ = broadcast.call_args
+        self.assertEqual([message.content for message in messages], ["kept"])
+
+    def test_non_participant_is_rejected(self):
+        outsider = User.objects.create_user(email="eve@example.com", name="Eve")
+        self.client.force_authenticate(outsider)
+
+        self.assertEqual(self.send("sneaky").status_code, 403)
+        self.assertEqual(self.redis.exists(stream_key()), 0)
+
+    def test_pending_entries_of_a_crashed_worker_are_recovered(self):
+        for index in range(3):
+            self.send(f"message {index}")
+
+        # A worker reads the entries, persists one of them and dies before XACK
+        ensure_consumer_group(self.redis)
+        entries = self.redis.xreadgroup(CONSUMER_GROUP, "crashed", {stream_key(): ">"}, count=10)[0][1]
+        fields = {key.decode(): value.decode() for key, value in entries[0][1].items()}
+        Message.objects.create(
+            id=fields["id"],
+            conversation=self.conversation,
+            sender=self.user,
+            receiver=self.other_user,
+            content=fields["content"],
+        )
+
+        self.assertEqual(drain_stream("worker-1"), 0)
+        # The message the crashed worker persisted is not counted again
+        self.assertEqual(recover_pending("worker-1", min_idle_ms=0), 2)
+
+        self.assertEqual(Message.objects.count(), 3)
+        self.assertEqual(self.redis.xpending(stream_key(), CONSUMER_GROUP)["pending"], 0)
+
+
+class GetMessagesViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.other_user,
+                receiver=self.user,
+                content=f"message {index}",
+            )
+            for index in range(7)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fetch(self, **params):
+        response = self.client.get(
+            "/api/v1/chat/message/list/",
+            {"conversation_id": str(self.conversation.id), **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def contents(self, data):
+        return [message["content"] for message in data["messages"]]
+
+    def test_default_page_is_newest_messages(self):
+        data = self.fetch(limit=3)
+
+        self.assertEqual(self.contents(data), ["message 4", "message 5", "message 6"])
+        self.assertIsNotNone(data["prev_cursor"])
+        self.assertIsNotNone(data["next_cursor"])
+
+    def test_scroll_back_to_the_beginning(self):
+        data = self.fetch(limit=3)
+        data = self.fetch(limit=3, before=data["prev_cursor"])
+        self.assertEqual(self.contents(data), ["message 1", "message 2", "message 3"])
+
+        data = self.fetch(limit=3, before=data["prev_cursor"])
+        self.assertEqual(self.contents(data), ["message 0"])
+        self.assertIsNone(data["prev_cursor"])
+
+    def test_after_returns_newer_messages(self):
+        data = self.fetch(limit=3)
+        older = self.fetch(limit=3, before=data["prev_cursor"])
+
+        newer = self.fetch(limit=2, after=older["next_cursor"])
+        self.assertEqual(self.contents(newer), ["message 4", "message 5"])
+
+    def test_after_newest_message_is_empty(self):
+        data = self.fetch()
+        polled = self.fetch(after=data["next_cursor"])
+
+        self.assertEqual(polled["messages"], [])
+        self.assertEqual(polled["next_cursor"], data["next_cursor"])
+
+    def test_is_read_follows_the_receivers_watermark(self):
+        participant = ConversationParticipant.objects.get(conversation=self.conversation, user=self.user)
+        advance_read_watermark(participant, self.messages[4])
+
+        data = self.fetch()
+
+        self.assertEqual([message["is_read"] for message in data["messages"]], [True] * 5 + [False] * 2)
+
+    def test_listing_does_not_write(self):
+        with CaptureQueriesContext(connection) as context:
+            self.fetch()
+        self.assertFalse(any(query["sql"].startswith("UPDATE") for query in context.captured_queries))
+
+    def test_same_timestamp_messages_are_not_skipped(self):
+        Message.objects.filter(conversation=self.conversation).update(timestamp=self.messages[0].timestamp)
+        seen = []
+        data = self.fetch(limit=2)
+        seen.extend(data["messages"])
+        while data["prev_cursor"]:
+            data = self.fetch(limit=2, before=data["prev_cursor"])
+            seen.extend(data["messages"])
+
+        self.assertEqual(len({message["id"] for message in seen}), 7)
+
+    def test_order_follows_seq_not_clock(self):
+        # A message stamped by a server whose clock lags behind
+        late = Message.objects.create(
+            conversation=self.conversation,
+            sender=self.other_user,
+            receiver=self.user,
+            content="late",
+            timestamp=self.messages[0].timestamp.replace(year=2000),
+        )
+
+        data = self.fetch(limit=2)
+
+        self.assertEqual(late.seq, 8)
+        self.assertEqual(self.contents(data), ["message 6", "late"])
+        self.assertEqual(self.contents(self.fetch(after=data["prev_cursor"])), ["late"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            "/api/v1/chat/message/list/",
+            {"conversation_id": str(self.conversation.id), "before": "garbage"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class MessageTailCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.other_user,
+                receiver=self.user,
+                content=f"message {index}",
+            )
+            for index in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fetch(self, **params):
+        response = self.client.get(
+            "/api/v1/chat/message/list/",
+            {"conversation_id": str(self.conversation.id), **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def fetch_cached(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            data = self.fetch(**params)
+        self.assertEqual(len(context.captured_queries), 0)
+        return data
+
+    def test_hit_matches_the_database_page(self):
+        self.assertEqual(self.fetch(limit=3), self.fetch_cached(limit=3))
+        self.assertEqual(self.fetch(), self.fetch_cached())
+
+    def test_hit_and_miss_counters(self):
+        before = tail_cache_stats()
+        self.fetch()
+        self.fetch()
+
+        after = tail_cache_stats()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_new_messages_are_appended(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            message = create_message(self.conversation, self.user, "fresh")
+
+        data = self.fetch_cached()
+
+        self.assertEqual(data["messages"][-1]["id"], str(message.id))
+        self.assertEqual(len(data["messages"]), 6)
+
+    def test_tail_is_bounded(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(TAIL_SIZE + 5):
+                create_message(self.conversation, self.user, f"burst {index}")
+
+        self.assertEqual(get_redis_connection("default").llen(tail_key(self.conversation.id)), TAIL_SIZE + 1)
+        data = self.fetch_cached(limit=TAIL_SIZE)
+        self.assertEqual(data["messages"][-1]["content"], f"burst {TAIL_SIZE + 4}")
+        self.assertIsNotNone(data["prev_cursor"])
+
+    def test_out_of_order_push_drops_the_tail(self):
+        self.fetch()
+        # Two writers committed 6 then 7, but their on_commit pushes ran 7 then 6
+        newer = [
+            Message.objects.create(
+                conversation=self.conversation, sender=self.user, receiver=self.other_user, content=content
+            )
+            for content in ("sixth", "seventh")
+        ]
+        push_to_tail([newer[1]])
+        push_to_tail([newer[0]])
+
+        self.assertFalse(get_redis_connection("default").exists(tail_key(self.conversation.id)))
+        self.assertEqual([message["content"] for message in self.fetch()["messages"][-2:]], ["sixth", "seventh"])
+
+    def test_push_refreshes_the_ttl(self):
+        self.fetch()
+        redis = get_redis_connection("default")
+        redis.expire(tail_key(self.conversation.id), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_message(self.conversation, self.user, "fresh")
+
+        self.assertGreater(redis.ttl(tail_key(self.conversation.id)), 5)
+
+    def test_read_state_change_is_reflected(self):
+        self.fetch()
+        participant = ConversationParticipant.objects.get(conversation=self.conversation, user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            advance_read_watermark(participant, self.messages[2])
+
+        data = self.fetch_cached()
+
+        self.assertEqual([message["is_read"] for message in data["messages"]], [True] * 3 + [False] * 2)
+
+    def test_delete_invalidates_the_tail(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.messages[-1].delete()
+
+        data = self.fetch()
+
+        self.assertNotIn(str(self.messages[-1].id), [message["id"] for message in data["messages"]])
+
+    def test_fill_is_skipped_after_a_concurrent_write(self):
+        _, generation = read_tail(self.conversation.id, self.user.id, 50)
+        push_to_tail([self.messages[-1]])
+
+        participants = list(ConversationParticipant.objects.filter(conversation=self.conversation))
+        rows = [message_row(message) for message in self.messages]
+        self.assertFalse(fill_tail(self.conversation.id, rows, participants, generation))
+
+    def test_non_participant_is_not_served_from_the_tail(self):
+        self.fetch()
+        outsider = User.objects.create_user(email="eve@example.com", name="Eve")
+        self.client.force_authenticate(outsider)
+
+        response = self.client.get("/api/v1/chat/message/list/", {"conversation_id": str(self.conversation.id)})
+
+        self.assertEqual(response.status_code, 403)
+
+
+class FastSerializationTests(TestCase):
+    """ The row mappers must produce exactly what the DRF serializers produce. """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name=None)
+        self.conversation = create_conversation(self.user, self.other_user)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation, sender=sender, receiver=receiver, content=f"message {index}"
+            )
+            for index, (sender, receiver) in enumerate([(self.user, self.other_user), (self.other_user, self.user)] * 3)
+        ]
+        self.messages[0].timestamp = self.messages[0].timestamp.replace(microsecond=0)
+        self.messages[0].save()
+
+    def rows(self):
+        return list(message_rows(Message.objects.order_by("seq")))
+
+    def reference(self):
+        return list(Message.objects.select_related("sender").order_by("seq"))
+
+    def assertSameOutput(self):
+        watermarks = {self.user.id: self.messages[3].seq, self.other_user.id: None}
+        to_dict = message_mapper(watermarks)
+        self.assertEqual(
+            [to_dict(row) for row in self.rows()],
+            MessageListSerializer(self.reference(), many=True, context={"read_watermarks": watermarks}).data,
+        )
+        to_dict = latest_message_mapper()
+        self.assertEqual([to_dict(row) for row in self.rows()], LatestMessageSerializer(self.reference(), many=True).data)
+        to_dict = user_mapper()
+        self.assertEqual(
+            [to_dict(row) for row in user_rows(User.objects.order_by("id"))],
+            ChatUserSerializer(User.objects.order_by("id"), many=True).data,
+        )
+
+    def test_mappers_match_serializers(self):
+        self.assertSameOutput()
+
+    @override_settings(TIME_ZONE="UTC")
+    def test_mappers_match_serializers_in_utc(self):
+        self.assertSameOutput()
+
+    def test_message_row_of_a_loaded_message(self):
+        self.assertEqual(message_row(self.reference()[1]), self.rows()[1])
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        to_dict = message_mapper()
+        data = {"messages": [to_dict(row) for row in self.rows()], "next_cursor": None, "when": self.messages[0].timestamp}
+
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        self.message = Message.objects.create(
+            conversation=self.conversation, sender=self.other_user, receiver=self.user, content="hi"
+        )
+        bump_versions([self.conversation.id], [self.user.id, self.other_user.id])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def chat_list(self, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get("/api/v1/chat/list/all/", headers=headers)
+
+    def messages(self, etag=None, **params):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(
+            "/api/v1/chat/message/list/", {"conversation_id": str(self.conversation.id), **params}, headers=headers
+        )
+
+    def assertNotModified(self, fetch, etag):
+        redis_class = get_redis_connection("default").__class__
+        with CaptureQueriesContext(connection) as context, mock.patch.object(
+            redis_class, "execute_command", autospec=True, side_effect=redis_class.execute_command
+        ) as execute:
+            response = fetch(etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(execute.call_count, 1)
+
+    def test_unchanged_chat_list_is_not_modified(self):
+        response = self.chat_list()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("private", response["Cache-Control"])
+
+        self.assertNotModified(self.chat_list, response["ETag"])
+
+    def test_unchanged_history_is_not_modified(self):
+        response = self.messages()
+        self.assertEqual(response.status_code, 200)
+
+        self.assertNotModified(self.messages, response["ETag"])
+
+    def test_new_message_changes_both_etags(self):
+        list_etag = self.chat_list()["ETag"]
+        history_etag = self.messages()["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_message(self.conversation, self.other_user, "again")
+
+        self.assertEqual(self.chat_list(list_etag).status_code, 200)
+        self.assertEqual(self.messages(history_etag).status_code, 200)
+
+    def test_read_state_change_changes_the_history_etag(self):
+        history_etag = self.messages()["ETag"]
+        participant = ConversationParticipant.objects.get(conversation=self.conversation, user=self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            advance_read_watermark(participant, self.message)
+
+        self.assertEqual(self.messages(history_etag).status_code, 200)
+
+    def test_etag_depends_on_page_and_user(self):
+        etag = self.messages()["ETag"]
+        self.assertNotEqual(self.messages(limit=1)["ETag"], etag)
+
+        self.client.force_authenticate(self.other_user)
+        self.assertNotEqual(self.messages()["ETag"], etag)
+
+    def test_non_participant_gets_no_etag_and_no_304(self):
+        outsider = User.objects.create_user(email="eve@example.com", name="Eve")
+        self.messages()    # a participant caches the tail and its readers
+        self.client.force_authenticate(outsider)
+        version = get_version(conversation_version_key(self.conversation.id))
+        params = {"conversation_id": str(self.conversation.id)}
+        guessed = f'"{make_etag("messages", outsider.id, version, sorted(params.items()))}"'
+
+        for _ in range(2):
+            response = self.messages(guessed)
+            self.assertEqual(response.status_code, 403)
+            self.assertNotIn("ETag", response)
+            invalidate_tail(self.conversation.id)    # and again without cached readers
+
+    def test_presence_change_changes_contacts_chat_list(self):
+        etag = self.chat_list()["ETag"]
+        clear_presence(self.other_user)
+
+        mark_online(self.other_user.id, "socket-1")
+        broadcast_presence(self.other_user.id, True)
+
+        self.assertEqual(self.chat_list(etag).status_code, 200)
+
+
+class SearchMessagesViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.outsider = User.objects.create_user(email="eve@example.com", name="Eve")
+        self.conversation = create_conversation(self.user, self.other_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, content, conversation=None, sender=None):
+        return Message.objects.create(
+            conversation=conversation or self.conversation,
+            sender=sender or self.other_user,
+            receiver=self.user,
+            content=content,
+        )
+
+    def search(self, q, **params):
+        response = self.client.get("/api/v1/chat/message/search/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, data):
+        return [result["id"] for result in data["results"]]
+
+    def test_results_are_scoped_to_own_conversations(self):
+        mine = self.post("lunch at noon?")
+        other_conversation = create_conversation(self.outsider, self.other_user)
+        self.post("lunch tomorrow", conversation=other_conversation, sender=self.outsider)
+
+        data = self.search("lunch")
+
+        self.assertEqual(self.ids(data), [str(mine.id)])
+        self.assertEqual(data["results"][0]["conversation_id"], str(self.conversation.id))
+
+    def test_results_are_ranked(self):
+        weak = self.post("pizza is one option among burgers, tacos, salads and many other dishes")
+        strong = self.post("pizza pizza pizza")
+
+        self.assertEqual(self.ids(self.search("pizza")), [str(strong.id), str(weak.id)])
+
+    def test_all_terms_must_match(self):
+        both = self.post("meet at the station")
+        self.post("meet at the park")
+
+        self.assertEqual(self.ids(self.search("station meet")), [str(both.id)])
+
+    def test_pages_follow_the_cursor(self):
+        messages = [self.post(f"standup notes {index}") for index in range(5)]
+        seen = []
+        data = self.search("standup", limit=2)
+        seen += self.ids(data)
+        while data["next_cursor"]:
+            data = self.search("standup", limit=2, cursor=data["next_cursor"])
+            seen += self.ids(data)
+
+        self.assertEqual(sorted(seen), sorted(str(message.id) for message in messages))
+
+    def test_index_follows_edits_and_deletes(self):
+        message = self.post("draft version")
+        Message.objects.filter(pk=message.pk).update(content="final version")
+
+        self.assertEqual(self.search("draft")["results"], [])
+        self.assertEqual(self.ids(self.search("final")), [str(message.id)])
+
+        message.delete()
+        self.assertEqual(self.search("final")["results"], [])
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite full-text triggers")
+    def test_index_survives_renumbered_rowids(self):
+        message = self.post("vacuumed words")
+        # What VACUUM or a table rebuild may do to the implicit rowids
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE chat_message SET rowid = rowid + 1000")
+
+        Message.objects.filter(pk=message.pk).update(content="edited words")
+        self.assertEqual(self.search("vacuumed")["results"], [])
+        message.delete()
+        self.assertEqual(self.search("words")["results"], [])
+
+    def test_crafted_cursor_is_rejected(self):
+        for payload in ([1.0, 5], ["1", "x"], [float("inf"), str(uuid.uuid4())], {"a": 1}):
+            cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = self.client.get("/api/v1/chat/message/search/", {"q": "x", "cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.post("quotes and stars")
+        data = self.search('quotes AND "stars* (')
+        self.assertEqual(len(data["results"]), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/v1/chat/message/search/", {"q": "x", "cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_is_required(self):
+        response = self.client.get("/api/v1/chat/message/search/")
+        self.assertEqual(response.status_code, 400)
+
+
+class HotQueryIndexTests(TestCase):
+    """ EXPLAIN the hot chat queries and make sure each one is served by an index. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        cls.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        cls.conversation = create_conversation(cls.user, cls.other_user)
+        cls.message = Message.objects.create(
+            conversation=cls.conversation, sender=cls.other_user, receiver=cls.user, content="hi"
+        )
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            # Tiny test tables always favour a seq scan, so only check the index is usable
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        if connection.vendor == "sqlite":
+            self.assertNotRegex(plan, r"SCAN chat_message\b", plan)
+            self.assertIn("USING", plan)
+        elif connection.vendor == "postgresql":
+            self.assertNotIn("Seq Scan", plan)
+            self.assertIn("Index", plan)
+        else:
+            self.skipTest(f"No plan check for {connection.vendor}")
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def assertUsesSeqIndex(self, queryset):
+        # SQLite backs unique constraints with an unnamed autoindex
+        if connection.vendor == "sqlite":
+            self.assertUsesIndex(queryset, "sqlite_autoindex_chat_message")
+            self.assertIn("conversation_id=?", queryset.explain())
+        else:
+            self.assertUsesIndex(queryset, "chat_msg_conv_seq_uniq")
+
+    def test_latest_message_lookup(self):
+        queryset = Message.objects.filter(conversation=self.conversation).order_by("-seq").values("id")[:1]
+        self.assertUsesSeqIndex(queryset)
+
+    def test_history_page(self):
+        queryset = (
+            Message.objects
+            .filter(conversation=self.conversation, seq__lt=self.message.seq)
+            .order_by("-seq")[:50]
+        )
+        self.assertUsesSeqIndex(queryset)
+
+    def test_unread_count(self):
+        queryset = (
+            Message.objects
+            .filter(conversation=self.conversation, receiver=self.user, seq__gt=self.message.seq)
+            .order_by()
+            .values("conversation")
+            .annotate(count=Count("id"))
+        )
+        self.assertUsesSeqIndex(queryset)
+
+    def test_participant_lookup(self):
+        queryset = ConversationParticipant.objects.filter(conversation=self.conversation, user=self.user)
+        self.assertUsesIndex(queryset)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ChatConsumerTests(TransactionTestCase):
+    """ Runs outside a wrapping transaction so on_commit broadcasts fire. """
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.outsider = User.objects.create_user(email="eve@example.com", name="Eve")
+        self.conversation = create_conversation(self.user, self.other_user)
+        clear_presence(self.user, self.other_user, self.outsider)
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/chat/{self.conversation.id}/"
+        )
+        communicator.scope["user"] = user
+        return communicator
+
+    async def test_non_participant_is_rejected(self):
+        connected, _ = await self.communicator(self.outsider).connect()
+        self.assertFalse(connected)
+
+    async def test_message_is_pushed_to_every_participant(self):
+        alice = self.communicator(self.user)
+        bob = self.communicator(self.other_user)
+        self.assertTrue((await alice.connect())[0])
+        self.assertTrue((await bob.connect())[0])
+        self.assertEqual((await alice.receive_json_from())["type"], "presence")
+
+        await alice.send_json_to({"type": "message.send", "content": "hello bob"})
+
+        for communicator in (alice, bob):
+            event = await communicator.receive_json_from()
+            self.assertEqual(event["type"], "message")
+            self.assertEqual(event["conversation_id"], str(self.conversation.id))
+            self.assertEqual(event["message"]["content"], "hello bob")
+            self.assertEqual(event["message"]["sender"]["id"], self.user.id)
+
+        self.assertTrue(await Message.objects.filter(content="hello bob", receiver=self.other_user).aexists())
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_presence_is_pushed_to_contacts(self):
+        alice = self.communicator(self.user)
+        await alice.connect()
+        bob = self.communicator(self.other_user)
+        await bob.connect()
+
+        event = await alice.receive_json_from()
+        self.assertEqual(event["type"], "presence")
+        self.assertEqual(event["user_id"], self.other_user.id)
+        self.assertTrue(event["online"])
+
+        # A second socket of an online user is not a presence change
+        bob_again = self.communicator(self.other_user)
+        await bob_again.connect()
+        await bob_again.disconnect()
+        self.assertTrue(await alice.receive_nothing())
+
+        await bob.disconnect()
+        event = await alice.receive_json_from()
+        self.assertFalse(event["online"])
+        self.assertIsNotNone(event["last_seen"])
+        self.assertTrue(await bob.receive_nothing())
+        await alice.disconnect()
+
+    async def test_typing_is_coalesced_and_not_persisted(self):
+        alice = self.communicator(self.user)
+        await alice.connect()
+        bob = self.communicator(self.other_user)
+        await bob.connect()
+        await alice.receive_json_from()  # Bob's presence
+
+        for _ in range(20):
+            await bob.send_json_to({"type": "typing"})
+        event = await alice.receive_json_from()
+        self.assertEqual(event["type"], "typing")
+        self.assertEqual(event["user_id"], self.other_user.id)
+        self.assertTrue(event["typing"])
+        self.assertTrue(await alice.receive_nothing())
+
+        await bob.send_json_to({"type": "typing.stop"})
+        self.assertFalse((await alice.receive_json_from())["typing"])
+        self.assertFalse(await Message.objects.aexists())
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_invalid_message_returns_error(self):
+        alice = self.communicator(self.user)
+        await alice.connect()
+
+        await alice.send_json_to({"type": "message.send", "content": ""})
+
+        event = await alice.receive_json_from()
+        self.assertEqual(event["type"], "error")
+        await alice.disconnect()
+
+
+class TypingIndicatorTests(TestCase):
+
+    def setUp(self):
+        self.conversation_id = uuid.uuid4()
+        self.events = []
+
+    async def publish(self, typing):
+        self.events.append(typing)
+
+    def indicator(self, **kwargs):
+        return TypingIndicator(self.conversation_id, 1, self.publish, **kwargs)
+
+    async def test_keystrokes_are_coalesced(self):
+        indicator = self.indicator(throttle=0.2, timeout=1)
+        for _ in range(100):
+            await indicator.keystroke()
+
+        self.assertEqual(self.events, [True])
+        await indicator.stop()
+        self.assertEqual(self.events, [True, False])
+
+    async def test_stopped_typing_after_timeout(self):
+        indicator = self.indicator(timeout=0.05)
+        await indicator.keystroke()
+        await asyncio.sleep(0.03)
+        await indicator.keystroke()
+        await asyncio.sleep(0.03)
+        self.assertEqual(self.events, [True])
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.events, [True, False])
+
+    async def test_sockets_of_one_user_share_the_throttle(self):
+        first, second = self.indicator(), self.indicator()
+        await first.keystroke()
+        await second.keystroke()
+
+        self.assertEqual(self.events, [True])
+        await first.stop()
+        await second.stop()
+
+    async def test_only_the_slot_holder_announces_stopped(self):
+        first, second = self.indicator(), self.indicator()
+        await first.keystroke()
+        await second.keystroke()
+
+        # The second socket never announced typing, nor holds the slot
+        await second.stop()
+        self.assertEqual(self.events, [True])
+        self.assertTrue(await get_async_redis_connection().exists(typing_key(self.conversation_id, 1)))
+
+        await first.stop()
+        self.assertEqual(self.events, [True, False])
+        self.assertFalse(await get_async_redis_connection().exists(typing_key(self.conversation_id, 1)))
+
+    async def test_stop_leaves_a_slot_claimed_by_another_socket(self):
+        first, second = self.indicator(throttle=0.05), self.indicator(throttle=0.05)
+        await first.keystroke()
+        await asyncio.sleep(0.06)
+        # The first socket's slot expired and the second one took it over
+        await second.keystroke()
+        self.assertEqual(self.events, [True, True])
+
+        await first.stop()
+        self.assertEqual(self.events, [True, True])
+
+        await second.stop()
+        self.assertEqual(self.events, [True, True, False])
+
+
+class PresenceTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        clear_presence(self.user, self.other_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_last_socket_leaving_goes_offline(self):
+        self.assertTrue(mark_online(self.other_user.id, "socket-1"))
+        self.assertFalse(mark_online(self.other_user.id, "socket-2"))
+        self.assertFalse(mark_offline(self.other_user.id, "socket-1"))
+        self.assertTrue(get_presence([self.other_user.id])[self.other_user.id]["online"])
+
+        self.assertTrue(mark_offline(self.other_user.id, "socket-2"))
+        presence = get_presence([self.other_user.id])[self.other_user.id]
+        self.assertFalse(presence["online"])
+        self.assertIsNotNone(presence["last_seen"])
+
+    def test_batch_query_is_one_round_trip(self):
+        create_conversation(self.user, self.other_user)
+        mark_online(self.other_user.id, "socket-1")
+        user_ids = [self.other_user.id] + list(range(10_000, 10_499))
+
+        with mock.patch("redis.client.Redis.execute_command", autospec=True,
+                        side_effect=get_redis_connection("default").__class__.execute_command) as execute:
+            response = self.client.post("/api/v1/chat/presence/", {"user_ids": user_ids}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(execute.call_count, 1)
+        presence = {entry["user_id"]: entry for entry in response.data["presence"]}
+        self.assertEqual(list(presence), [self.other_user.id])
+        self.assertTrue(presence[self.other_user.id]["online"])
+
+    def test_presence_of_non_contacts_is_not_disclosed(self):
+        mark_online(self.other_user.id, "socket-1")
+        response = self.client.post("/api/v1/chat/presence/", {"user_ids": [self.other_user.id]}, format="json")
+        self.assertEqual(response.data["presence"], [])
+
+    def test_sockets_that_stop_heartbeating_are_swept_offline(self):
+        create_conversation(self.user, self.other_user)
+        version = get_version(user_version_key(self.user.id))
+        with mock.patch("chat.services.presence_service.time.time", return_value=time.time() - PRESENCE_TTL - 1):
+            mark_online(self.other_user.id, "socket-1")
+        get_redis_connection("default").delete(online_key(self.other_user.id))    # as if it expired
+
+        self.assertEqual(sweep_expired_presence(), 1)
+
+        self.assertFalse(get_presence([self.other_user.id])[self.other_user.id]["online"])
+        self.assertNotEqual(get_version(user_version_key(self.user.id)), version)
+        self.assertEqual(sweep_expired_presence(), 0)
+
+    def test_live_sockets_are_not_swept(self):
+        mark_online(self.other_user.id, "socket-1")
+        self.assertEqual(sweep_expired_presence(), 0)
+        self.assertTrue(get_presence([self.other_user.id])[self.other_user.id]["online"])
+
+    def test_batch_size_is_bounded(self):
+        response = self.client.post("/api/v1/chat/presence/", {"user_ids": list(range(1, 502))}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_id_is_rejected(self):
+        response = self.client.post("/api/v1/chat/presence/", {"user_ids": [10**30]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_chat_list_includes_presence(self):
+        create_conversation(self.user, self.other_user)
+        mark_online(self.other_user.id, "socket-1")
+
+        response = self.client.get("/api/v1/chat/list/all/")
+
+        self.assertTrue(response.data[0]["presence"]["online"])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class SendMessageViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        clear_rate_limits()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_send_publishes_to_conversation_group(self):
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(conversation_group_name(self.conversation.id), channel_name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/v1/chat/message/send/",
+                {"conversation_id": str(self.conversation.id), "content": "hello"},
+            )
+
+        self.assertEqual(response.status_code, 201)
+        event = async_to_sync(channel_layer.receive)(channel_name)
+        self.assertEqual(event["type"], "chat.message")
+        self.assertEqual(event["message"]["id"], response.data["id"])
+        self.assertEqual(Message.objects.get().receiver, self.other_user)
+
+
+class SyncViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation, _ = get_or_create_direct_conversation(self.user, self.other_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since):
+        response = self.client.get("/api/v1/chat/sync/", {"since": since})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_changes_since_sequence(self):
+        data = self.sync(0)
+        self.assertFalse(data["resync"])
+        self.assertEqual([change["type"] for change in data["changes"]], ["conversation"])
+        self.assertEqual(data["changes"][0]["user"]["id"], self.other_user.id)
+
+        message = create_message(self.conversation, self.other_user, "hello")
+        data = self.sync(data["seq"])
+
+        self.assertEqual(len(data["changes"]), 1)
+        change = data["changes"][0]
+        self.assertEqual(change["type"], "message")
+        self.assertEqual(change["conversation_id"], str(self.conversation.id))
+        self.assertEqual(change["message"]["id"], str(message.id))
+        self.assertEqual(change["message"]["sender"]["id"], self.other_user.id)
+        self.assertEqual(self.sync(data["seq"])["changes"], [])
+
+    def test_reads_are_coalesced(self):
+        start = self.sync(0)["seq"]
+        messages = [create_message(self.conversation, self.other_user, f"message {index}") for index in range(3)]
+        participant = ConversationParticipant.objects.get(conversation=self.conversation, user=self.user)
+        for message in messages:
+            advance_read_watermark(participant, message)
+
+        changes = self.sync(start)["changes"]
+
+        self.assertEqual([change["type"] for change in changes], ["message"] * 3 + ["read"])
+        self.assertEqual(changes[-1]["user_id"], self.user.id)
+        self.assertEqual(changes[-1]["last_read_message_id"], str(messages[-1].id))
+
+    def test_other_users_changes_are_not_visible(self):
+        outsider = User.objects.create_user(email="eve@example.com", name="Eve")
+        conversation, _ = get_or_create_direct_conversation(outsider, self.other_user)
+        create_message(conversation, outsider, "private")
+
+        self.assertEqual(len(self.sync(0)["changes"]), 1)
+
+    def test_resync_after_compaction(self):
+        create_message(self.conversation, self.other_user, "old")
+        ChangeLogEntry.objects.update(created_at=parse_datetime("2020-01-01T00:00:00Z"))
+        create_message(self.conversation, self.other_user, "new")
+
+        compact_change_log()
+
+        state = UserSyncState.objects.get(user=self.user)
+        self.assertEqual(state.compacted_seq, 2)
+        self.assertTrue(self.sync(0)["resync"])
+        changes = self.sync(state.compacted_seq)["changes"]
+        self.assertEqual([change["message"]["content"] for change in changes], ["new"])
+
+    def test_sequence_ahead_of_log_requires_resync(self):
+        self.assertTrue(self.sync(100)["resync"])
+
+    def test_query_count_is_constant(self):
+        start = self.sync(0)["seq"]
+        create_message(self.conversation, self.other_user, "first")
+        with CaptureQueriesContext(connection) as small:
+            self.sync(start)
+
+        for index in range(20):
+            create_message(self.conversation, self.other_user, f"message {index}")
+        with CaptureQueriesContext(connection) as large:
+            data = self.sync(start)
+
+        self.assertEqual(len(data["changes"]), 21)
+        self.assertEqual(len(small), len(large))
+
+    def test_since_is_required(self):
+        response = self.client.get("/api/v1/chat/sync/")
+        self.assertEqual(response.status_code, 400)
+
+
+class ReadMessagesViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        self.messages = [
+            Message.objects.create(
+                conversation=self.conversation,
+                sender=self.other_user,
+                receiver=self.user,
+                content=f"message {index}",
+            )
+            for index in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def unread_count(self):
+        response = self.client.get("/api/v1/chat/list/all/")
+        return response.data[0]["conversation"]["unread_count"]
+
+    def test_ack_latest_message_is_a_single_row_write(self):
+        self.assertEqual(self.unread_count(), 5)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post("/api/v1/chat/message/read/", {"conversation_id": str(self.conversation.id)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["last_read_message_id"], str(self.messages[-1].id))
+        # The change log bumps sync sequences too; the watermark itself is one UPDATE
+        updates = [
+            query for query in context.captured_queries
+            if query["sql"].startswith('UPDATE "chat_conversationparticipant"')
+        ]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_ack_specific_message(self):
+        self.client.post(
+            "/api/v1/chat/message/read/",
+            {"conversation_id": str(self.conversation.id), "message_id": str(self.messages[1].id)},
+        )
+        self.assertEqual(self.unread_count(), 3)
+
+    def test_read_time_is_when_the_read_happened(self):
+        Message.objects.filter(conversation=self.conversation).update(timestamp=parse_datetime("2020-01-01T00:00:00Z"))
+        before = timezone.now()
+
+        response = self.client.post("/api/v1/chat/message/read/", {"conversation_id": str(self.conversation.id)})
+
+        participant = ConversationParticipant.objects.get(conversation=self.conversation, user=self.user)
+        self.assertGreaterEqual(participant.last_read_at, before)
+        self.assertEqual(parse_datetime(response.data["last_read_at"]), participant.last_read_at)
+        change = self.client.get("/api/v1/chat/sync/", {"since": 0}).json()["changes"][-1]
+        self.assertEqual(change["type"], "read")
+        self.assertEqual(parse_datetime(change["last_read_at"]), participant.last_read_at)
+
+    def test_watermark_never_moves_backwards(self):
+        self.client.post("/api/v1/chat/message/read/", {"conversation_id": str(self.conversation.id)})
+        response = self.client.post(
+            "/api/v1/chat/message/read/",
+            {"conversation_id": str(self.conversation.id), "message_id": str(self.messages[0].id)},
+        )
+
+        self.assertEqual(response.data["last_read_message_id"], str(self.messages[-1].id))
+        self.assertEqual(self.unread_count(), 0)
+
+    def test_non_participant_is_rejected(self):
+        outsider = User.objects.create_user(email="eve@example.com", name="Eve")
+        self.client.force_authenticate(outsider)
+
+        response = self.client.post("/api/v1/chat/message/read/", {"conversation_id": str(self.conversation.id)})
+
+        self.assertEqual(response.status_code, 403)
+
+
+class CreateOrGetChatViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        clear_rate_limits()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_create_then_get(self):
+        created = self.client.post("/api/v1/chat/create/", {"user_id": self.other_user.id})
+        self.assertEqual(created.status_code, 201)
+
+        self.client.force_authenticate(self.other_user)
+        fetched = self.client.post("/api/v1/chat/create/", {"user_id": self.user.id})
+
+        self.assertEqual(fetched.status_code, 200)
+        self.assertEqual(fetched.data["id"], created.data["id"])
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.direct_key, f"{self.user.id}:{self.other_user.id}")
+        self.assertEqual(conversation.participants.count(), 2)
+
+    def test_lookup_is_a_single_query(self):
+        get_or_create_direct_conversation(self.user, self.other_user)
+
+        with self.assertNumQueries(1):
+            _, created = get_or_create_direct_conversation(self.other_user, self.user)
+        self.assertFalse(created)
+
+    def test_lost_race_returns_the_winner(self):
+        winner = Conversation.objects.create(direct_key=Conversation.build_direct_key(self.user.id, self.other_user.id))
+        lookups = Conversation.objects.filter(direct_key=winner.direct_key)
+
+        # Simulate the winner committing between our lookup and our insert
+        with mock.patch.object(QuerySet, "first", return_value=None):
+            conversation, created = get_or_create_direct_conversation(self.user, self.other_user)
+
+        self.assertFalse(created)
+        self.assertEqual(conversation, winner)
+        self.assertEqual(lookups.count(), 1)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+
+class MessageArchiveTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        Conversation.objects.filter(pk=self.conversation.pk).update(created_at=parse_datetime("2020-01-01T00:00:00Z"))
+        self.old_messages = 10
+        total = self.old_messages + ARCHIVE_KEEP_RECENT + 5
+        Message.objects.bulk_create([
+            Message(
+                conversation=self.conversation,
+                sender=self.other_user,
+                receiver=self.user,
+                content=f"message {index}",
+            )
+            for index in range(total)
+        ])
+        # All but the newest five are old, yet archiving stops at the first
+        # fresh one, right after the first ten
+        Message.objects.filter(conversation=self.conversation, seq__lte=total - 5).update(
+            timestamp=parse_datetime("2020-01-01T00:00:00Z")
+        )
+        Message.objects.filter(conversation=self.conversation, seq=self.old_messages + 1).update(timestamp=timezone.now())
+        self.total = total
+        self.read_up_to(self.user, total)
+        self.read_up_to(self.other_user, total)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def read_up_to(self, user, seq):
+        ConversationParticipant.objects.filter(conversation=self.conversation, user=user).update(last_read_seq=seq)
+
+    def test_moves_old_messages_in_batches(self):
+        self.assertEqual(archive_messages(batch_size=4), self.old_messages)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.archived_seq, self.old_messages)
+        self.assertEqual(ArchivedMessage.objects.count(), self.old_messages)
+        self.assertFalse(Message.objects.filter(seq__lte=self.old_messages).exists())
+        self.assertEqual(ArchivedMessage.objects.get(seq=3).content, "message 2")
+        self.assertEqual(archive_messages(), 0)
+
+    def test_content_is_stored_compressed(self):
+        content = "lorem ipsum " * 100
+        Message.objects.filter(seq=1).update(content=content)
+        archive_messages()
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT content FROM chat_archivedmessage")
+            stored = bytes(cursor.fetchone()[0])
+
+        self.assertLess(len(stored), len(content) // 10)
+        self.assertEqual(ArchivedMessage.objects.get(seq=1).content, content)
+
+    def test_keeps_the_newest_messages_hot(self):
+        Message.objects.filter(conversation=self.conversation).update(timestamp=parse_datetime("2020-01-01T00:00:00Z"))
+        archive_messages()
+
+        self.assertEqual(Message.objects.filter(conversation=self.conversation).count(), ARCHIVE_KEEP_RECENT)
+
+    def test_history_falls_through_to_the_archive(self):
+        archive_messages()
+        response = self.client.get(
+            "/api/v1/chat/message/list/", {"conversation_id": str(self.conversation.id), "limit": 20},
+        )
+        seen = response.data["messages"]
+        while response.data["prev_cursor"]:
+            response = self.client.get(
+                "/api/v1/chat/message/list/",
+                {"conversation_id": str(self.conversation.id), "limit": 20, "before": response.data["prev_cursor"]},
+            )
+            seen = response.data["messages"] + seen
+
+        total = Conversation.objects.get(pk=self.conversation.pk).last_seq
+        self.assertEqual([message["content"] for message in seen], [f"message {index}" for index in range(total)])
+
+    def test_unread_messages_stay_hot(self):
+        self.read_up_to(self.user, 4)
+        archive_messages()
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.archived_seq, 4)
+        response = self.client.get("/api/v1/chat/list/all/")
+        self.assertEqual(response.data[0]["conversation"]["unread_count"], self.total - 4)
+
+        # A sender's unread watermark holds messages back as well
+        self.read_up_to(self.user, self.total)
+        self.read_up_to(self.other_user, 0)
+        self.assertEqual(archive_messages(), 0)
+
+    def test_after_cursor_reads_out_of_the_archive(self):
+        self.read_up_to(self.user, 0)
+        participant = ConversationParticipant.objects.get(conversation=self.conversation, user=self.user)
+        advance_read_watermark(participant, Message.objects.get(seq=9))
+        archive_messages()
+
+        cursor = encode_cursor(ArchivedMessage.objects.get(seq=8))
+        response = self.client.get(
+            "/api/v1/chat/message/list/",
+            {"conversation_id": str(self.conversation.id), "limit": 4, "after": cursor},
+        )
+
+        self.assertEqual([message["content"] for message in response.data["messages"]], [
+            "message 8", "message 9", "message 10", "message 11",
+        ])
+        participant.refresh_from_db()
+        self.assertEqual(participant.last_read_seq, 9)
+        self.assertTrue(ArchivedMessage.objects.filter(id=participant.last_read_message_id).exists())
+
+
+class MessageSeqTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+
+    def post(self, content):
+        return Message(conversation=self.conversation, sender=self.user, receiver=self.other_user, content=content)
+
+    def test_seqs_are_gap_free_per_conversation(self):
+        other_conversation = create_conversation(self.user, self.other_user)
+        first = create_message(self.conversation, self.user, "first")
+        Message.objects.bulk_create([
+            self.post("second"),
+            Message(conversation=other_conversation, sender=self.user, receiver=self.other_user, content="elsewhere"),
+            self.post("third"),
+        ])
+
+        self.assertEqual(first.seq, 1)
+        self.assertEqual(
+            list(Message.objects.filter(conversation=self.conversation).order_by("seq").values_list("seq", "content")),
+            [(1, "first"), (2, "second"), (3, "third")],
+        )
+        self.assertEqual(Message.objects.get(content="elsewhere").seq, 1)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_seq, 3)
+
+    def test_rolled_back_insert_leaves_no_gap(self):
+        create_message(self.conversation, self.user, "first")
+        try:
+            with transaction.atomic():
+                create_message(self.conversation, self.user, "rolled back")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(create_message(self.conversation, self.user, "second").seq, 2)
+
+
+class MessageSeqConcurrencyTests(TransactionTestCase):
+
+    def test_parallel_inserts_get_distinct_consecutive_seqs(self):
+        user = User.objects.create_user(email="alice@example.com", name="Alice")
+        other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        conversation = create_conversation(user, other_user)
+        workers, per_worker = 8, 5
+        barrier = threading.Barrier(workers)
+
+        def send(index):
+            barrier.wait()
+            try:
+                sent = 0
+                while sent < per_worker:
+                    try:
+                        create_message(conversation, user if index % 2 else other_user, f"{index}-{sent}")
+                    except OperationalError as exc:
+                        # The shared in-memory SQLite test database fails fast on
+                        # table locks instead of waiting, so retry like a client would
+                        if connection.vendor != "sqlite" or "locked" not in str(exc):
+                            raise
+                        time.sleep(0.01)
+                        continue
+                    sent += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send, args=(index,)) for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        seqs = sorted(Message.objects.filter(conversation=conversation).values_list("seq", flat=True))
+        self.assertEqual(seqs, list(range(1, workers * per_worker + 1)))
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_seq, workers * per_worker)
+
+
+class CreateOrGetChatConcurrencyTests(TransactionTestCase):
+
+    def test_parallel_requests_create_one_conversation(self):
+        user = User.objects.create_user(email="alice@example.com", name="Alice")
+        other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        clear_rate_limits()
+        workers = 8
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def request_chat(index):
+            client = APIClient()
+            client.force_authenticate(user if index % 2 else other_user)
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        response = client.post("/api/v1/chat/create/", {"user_id": (other_user if index % 2 else user).id})
+                    except OperationalError as exc:
+                        # The shared in-memory SQLite test database fails fast on
+                        # table locks instead of waiting, so retry like a client would
+                        if connection.vendor != "sqlite" or "locked" not in str(exc):
+                            raise
+                        time.sleep(0.01)
+                        continue
+                    results.append(response)
+                    return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request_chat, args=(index,)) for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), workers)
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(ConversationParticipant.objects.count(), 2)
+        self.assertEqual(len({response.data["id"] for response in results}), 1)
+        status_codes = [response.status_code for response in results]
+        self.assertTrue(set(status_codes) <= {200, 201})
+        self.assertLessEqual(status_codes.count(201), 1)
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class AsyncChatViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        for content in ("hi", "hello"):
+            Message.objects.create(conversation=self.conversation, sender=self.other_user, receiver=self.user, content=content)
+        clear_presence(self.user, self.other_user)
+        clear_rate_limits()
+        self.addCleanup(clear_rate_limits)
+        for user in (self.user, self.other_user):
+            invalidate_user(user.id)
+            self.addCleanup(invalidate_user, user.id)
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def get(self, path, params=None, **headers):
+        return self.async_client.get(path, params or {}, headers={**self.headers, **headers})
+
+    def post(self, path, data):
+        return self.async_client.post(path, data, content_type="application/json", headers=self.headers)
+
+    async def test_responses_match_the_sync_views(self):
+        mark_online(self.other_user.id, "socket-1")
+        sync_client = APIClient()
+        sync_client.force_authenticate(self.user)
+        requests = [
+            ("/api/v1/chat/list/all/", {}),
+            ("/api/v1/chat/message/list/", {"conversation_id": str(self.conversation.id)}),
+            ("/api/v1/chat/message/list/", {"conversation_id": str(self.conversation.id), "limit": 1}),
+            ("/api/v1/chat/sync/", {"since": 0}),
+        ]
+
+        for path, params in requests:
+            response = await self.get(path, params)
+            with override_settings(ROOT_URLCONF="livechat.urls"):
+                expected = await sync_to_async(sync_client.get)(path, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected.json())
+
+    async def test_unchanged_history_is_not_modified(self):
+        params = {"conversation_id": str(self.conversation.id)}
+        response = await self.get("/api/v1/chat/message/list/", params)
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.get("/api/v1/chat/message/list/", params, **{"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_send_then_read(self):
+        response = await self.post(
+            "/api/v1/chat/message/send/", {"conversation_id": str(self.conversation.id), "content": "hey"}
+        )
+        self.assertEqual(response.status_code, 201)
+        sent_id = response.json()["id"]
+        self.assertTrue(await Message.objects.filter(id=sent_id, receiver=self.other_user).aexists())
+
+        response = await self.post("/api/v1/chat/message/read/", {"conversation_id": str(self.conversation.id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["last_read_message_id"], sent_id)
+
+    async def test_stream_mode_broadcasts_once_persisted(self):
+        stream = f"test:chat:ingest:{uuid.uuid4().hex}"
+        self.addCleanup(get_redis_connection("default").delete, stream)
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(conversation_group_name(self.conversation.id), channel_name)
+
+        with override_settings(CHAT_INGESTION_MODE="stream", CHAT_INGESTION_STREAM=stream):
+            response = await self.post(
+                "/api/v1/chat/message/send/", {"conversation_id": str(self.conversation.id), "content": "hey"}
+            )
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(get_redis_connection("default").xlen(stream), 1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(channel_layer.receive(channel_name), 0.05)
+
+            self.assertEqual(await sync_to_async(drain_stream)("worker-1"), 1)
+
+        event = await channel_layer.receive(channel_name)
+        self.assertEqual(event["message"]["id"], response.json()["id"])
+        self.assertEqual(event["message"]["sender"]["id"], self.user.id)
+
+    async def test_throttles_are_enforced(self):
+        rates = {"create_chat.user": "1/min", "create_chat.ip": "100/min"}
+        with mock.patch.object(RedisScopedThrottle, "THROTTLE_RATES", rates):
+            first = await self.post("/api/v1/chat/create/", {"user_id": self.other_user.id})
+            second = await self.post("/api/v1/chat/create/", {"user_id": self.other_user.id})
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 429)
+        self.assertGreater(int(second["Retry-After"]), 0)
+
+    async def test_invalid_token_is_rejected(self):
+        response = await self.get("/api/v1/chat/list/all/", Authorization="Bearer not-a-token")
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        get_redis_connection("default").delete(pin_key(1))
+
+    def serve(self, state):
+        token = _routing.set(state)
+        self.addCleanup(_routing.reset, token)
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertIsNone(self.router.db_for_read(Message))
+
+    def test_opted_in_reads_use_replica(self):
+        state = RoutingState()
+        state.reader_id = 1
+        self.serve(state)
+        self.assertEqual(self.router.db_for_read(Message), "replica1")
+
+    def test_reads_after_a_write_use_primary(self):
+        state = RoutingState()
+        state.reader_id = 1
+        self.serve(state)
+        self.assertEqual(self.router.db_for_write(Message), "default")
+        self.assertIsNone(self.router.db_for_read(Message))
+
+    def test_reads_after_read_from_primary_use_primary(self):
+        state = RoutingState()
+        state.reader_id = 1
+        self.serve(state)
+        read_from_primary()
+        self.assertIsNone(self.router.db_for_read(Message))
+
+    def test_pinned_user_reads_primary(self):
+        pin_to_primary([1])
+        state = RoutingState()
+        state.reader_id = 1
+        self.serve(state)
+        self.assertIsNone(self.router.db_for_read(Message))
+        self.assertLessEqual(get_redis_connection("default").ttl(pin_key(1)), settings.DATABASE_PIN_SECONDS)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReadYourWritesTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        get_redis_connection("default").delete(pin_key(self.user.id), pin_key(self.other_user.id))
+        clear_rate_limits()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sending_pins_sender_and_receiver(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/v1/chat/message/send/",
+                {"conversation_id": str(self.conversation.id), "content": "hello"},
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(is_pinned(self.user.id))
+        self.assertTrue(is_pinned(self.other_user.id))
+
+    def test_failed_write_does_not_pin(self):
+        response = self.client.post("/api/v1/chat/message/send/", {"conversation_id": str(uuid.uuid4())})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(is_pinned(self.user.id))
+
+    def test_presence_change_does_not_pin(self):
+        broadcast_presence(self.user.id, True)
+        self.assertFalse(is_pinned(self.other_user.id))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "set DATABASE_REPLICAS to run against a replica")
+class ReplicaReadTests(TransactionTestCase):
+    """ Needs committed data: the replica is its own connection. """
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="alice@example.com", name="Alice")
+        self.other_user = User.objects.create_user(email="bob@example.com", name="Bob")
+        self.conversation = create_conversation(self.user, self.other_user)
+        get_redis_connection("default").delete(pin_key(self.user.id), pin_key(self.other_user.id))
+        clear_rate_limits()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def replica_queries(self, path, table=None):
+        with override_settings(DATABASE_REPLICAS=settings.DATABASE_REPLICAS[:1]):
+            with CaptureQueriesContext(connections[settings.DATABASE_REPLICAS[0]]) as queries:
+                response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len([query for query in queries if table is None or f'"{table}"' in query["sql"]])
+
+    def test_chat_list_reads_replica_until_the_user_writes(self):
+        self.assertGreater(self.replica_queries("/api/v1/chat/list/all/"), 0)
+
+        response = self.client.post(
+            "/api/v1/chat/message/send/", {"conversation_id": str(self.conversation.id), "content": "hello"}
+        )
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.replica_queries("/api/v1/chat/list/all/"), 0)
+
+    def test_message_tail_is_filled_from_the_primary(self):
+        Message.objects.create(conversation=self.conversation, sender=self.other_user, receiver=self.user, content="hi")
+        invalidate_tail(self.conversation.id)
+        path = f"/api/v1/chat/message/list/?conversation_id={self.conversation.id}"
+
+        # The ETag's membership check may read a replica; the tail itself may not
+        self.assertEqual(self.replica_queries(path, table="chat_message"), 0)
+        # Older pages do not touch the tail cache and may come from a replica
+        self.assertGreater(self.replica_queries(path + "&before=" + encode_cursor(Message.objects.get())), 0)
 
-# Create your tests here.
@@ -1,9 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from .views import CreateOrGetChatView, GetAllChatsView, GetMessagesView, SendMessageView
-
-urlpatterns = [
-    path("create/", CreateOrGetChatView.as_view()),
-    path("list/all/", GetAllChatsView.as_view()),
-    path("message/send/", SendMessageView.as_view()),
-    path("message/list/", GetMessagesView.as_view()),
-]
+from . import async_views, views
+
+
+def api_urlpatterns(api):
+    """ The chat endpoints, served by the views of module `api`. """
+    return [
+        path("create/", api.CreateOrGetChatView.as_view()),
+        path("list/all/", api.GetAllChatsView.as_view()),
+        path("message/send/", api.SendMessageView.as_view()),
+        path("message/send/batch/", api.SendMessageBatchView.as_view()),
+        path("message/list/", api.GetMessagesView.as_view()),
+        path("message/read/", api.ReadMessagesView.as_view()),
+        path("message/search/", api.SearchMessagesView.as_view()),
+        path("presence/", api.PresenceView.as_view()),
+        path("sync/", api.SyncView.as_view()),
+    ]
+
+
+urlpatterns = api_urlpatterns(async_views if settings.API_ASYNC_VIEWS else views)
@@ -1,133 +1,464 @@
 # chat/views.py
+import uuid
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Conversation, ConversationParticipant, Message
+from .models import ArchivedMessage, Conversation, ConversationParticipant, Message
+from .fast_serializers import (
+    datetime_formatter, latest_message_mapper, message_mapper, message_rows, user_mapper, user_rows
+)
+from .renderers import ORJSONRenderer
 from .serializers import (
     ConversationSerializer, 
-    ChatListSerializer, 
-    LatestMessageSerializer,
     ChatUserSerializer, 
     SendMessageSerializer, 
+    SendMessageBatchSerializer,
     MessageSerializer,
-    ConversationMessagesSerializer,
+    ReadMessagesSerializer,
+    ReadReceiptSerializer,
+    PresenceQuerySerializer,
+    UserPresenceSerializer,
+    SearchMessagesSerializer,
+    SearchResultsSerializer,
+    SyncQuerySerializer,
+)
+from .services.conversation_service import get_or_create_direct_conversation
+from .services.message_cache_service import TAIL_SIZE, fill_tail, read_tail, readers_key
+from .services.presence_service import contact_ids, get_presence
+from .services.search_service import search_messages
+from .services.sync_service import get_changes
+from .services.version_service import (
+    conversation_version_key, get_member_version, get_version, make_etag, user_version_key
+)
+from .services.ingestion_service import enqueue_message, is_stream_mode
+from .services.message_service import advance_read_watermark, create_message, create_messages
+from .pagination import (
+    InvalidCursor, decode_rank_cursor, encode_cursor, encode_rank_cursor, paginate_messages, parse_limit
 )
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from accounts.throttles import IPRateThrottle, PerItemThrottleMixin, UserBurstThrottle
+from livechat.conditional import etag
+from livechat.errors import RequestError
+from livechat.db_router import ReplicaReadsMixin, read_from_primary
 
 User = get_user_model()
 
+def chat_list_etag(request):
+    """ ETag of the caller's chat list: one Redis read, no database access. """
+    return make_etag("chat-list", request.user.id, get_version(user_version_key(request.user.id)))
+
+
+def message_list_etag(request):
+    """
+    ETag of one page of a conversation's history, for participants only.
+
+    One Redis read checks the participant against the cached tail readers
+    as well; only a conversation without a cached tail costs a query.
+    """
+    conversation_id = etag_conversation_id(request)
+    if conversation_id is None:
+        return None
+
+    version, is_participant = get_member_version(
+        conversation_version_key(conversation_id), readers_key(conversation_id), request.user.id
+    )
+    if is_participant is None:
+        is_participant = ConversationParticipant.objects.filter(
+            conversation_id=conversation_id, user=request.user
+        ).exists()
+    if not is_participant:
+        return None
+
+    return message_list_etag_for(request, version)
+
+
+def etag_conversation_id(request):
+    try:
+        return uuid.UUID(request.GET.get("conversation_id", ""))
+    except ValueError:
+        return None
+
+
+def message_list_etag_for(request, version):
+    return make_etag("messages", request.user.id, version, sorted(request.GET.items()))
+
+
+def chat_list_queryset(user):
+    """ The caller's conversations with counterpart, latest message and unread count, in one query. """
+    other_participants = (
+        ConversationParticipant.objects
+        .filter(conversation=OuterRef("conversation"))
+        .exclude(user=user)
+        .order_by("id")
+        .values("user_id")[:1]
+    )
+    latest_messages = (
+        Message.objects
+        .filter(conversation=OuterRef("conversation"))
+        .order_by("-seq")
+        .values("id")[:1]
+    )
+    unread_counts = (
+        Message.objects
+        .filter(
+            conversation=OuterRef("conversation"),
+            receiver=user,
+            seq__gt=OuterRef("last_read_seq"),
+        )
+        .order_by()
+        .values("conversation")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+
+    return (
+        ConversationParticipant.objects
+        .filter(user=user)
+        .annotate(
+            other_user_id=Subquery(other_participants),
+            latest_message_id=Subquery(latest_messages),
+            unread_count=Coalesce(Subquery(unread_counts), 0),
+        )
+        .values("conversation_id", "other_user_id", "latest_message_id", "unread_count")
+    )
+
+
+def build_chat_list(conversations, users, latest_messages, presence):
+    """ Build the `ChatListSerializer` shape directly from plain rows. """
+    offline = {"online": False, "last_seen": None}
+    user_to_dict = user_mapper()
+    message_to_dict = latest_message_mapper()
+    format_datetime = datetime_formatter()
+    chat_list = []
+
+    for convo in conversations:
+        other_user = users.get(convo["other_user_id"])
+        latest_message = latest_messages.get(convo["latest_message_id"])
+        other_presence = presence.get(convo["other_user_id"], offline)
+
+        chat_list.append({
+            "conversation_id": str(convo["conversation_id"]),
+            "user": user_to_dict(other_user) if other_user else ChatUserSerializer(None).data,
+            "presence": {
+                "online": other_presence["online"],
+                "last_seen": format_datetime(other_presence["last_seen"]),
+            },
+            "conversation": {
+                "latest_message": message_to_dict(latest_message) if latest_message else None,
+                "unread_count": convo["unread_count"],
+            },
+        })
+    return chat_list
+
+
+NOT_A_PARTICIPANT = "You are not a participant of this conversation"
+
+
+# Request parsing and response building, shared with chat/async_views.py;
+# the views themselves only do the I/O in between.
+
+def parse_chat_partner(request):
+    """ The id of the user the caller asked to chat with. """
+    other_user_id = request.data.get("user_id")
+
+    if not other_user_id:
+        raise RequestError("user_id is required")
+
+    if str(request.user.id) == str(other_user_id):
+        raise RequestError("You cannot chat with yourself")
+
+    return other_user_id
+
+
+def conversation_response(conversation, created):
+    serializer = ConversationSerializer(conversation)
+    return Response(
+        serializer.data,
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+    )
+
+
+def parse_message(data):
+    """ The conversation id and content of one message to send. """
+    serializer = SendMessageSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data["conversation_id"], serializer.validated_data["content"]
+
+
+def message_response(message, status_code):
+    response_serializer = MessageSerializer(message)
+    return Response(response_serializer.data, status=status_code)
+
+
+def stream_receiver_id(user_ids, sender):
+    """ The receiver of a message accepted to the stream, given the conversation's participants. """
+    if not user_ids:
+        raise RequestError("Conversation not found", status.HTTP_404_NOT_FOUND)
+    if sender.id not in user_ids:
+        raise RequestError(NOT_A_PARTICIPANT, status.HTTP_403_FORBIDDEN)
+
+    return next(user_id for user_id in user_ids if user_id != sender.id)
+
+
+def parse_message_batch(data):
+    """
+    Validate a batch item by item.
+
+    Returns the per-item results, filled in for invalid items only, and the
+    `(index, conversation_id, content)` drafts of the valid ones.
+    """
+    serializer = SendMessageBatchSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+
+    results = []
+    drafts = []
+    for index, item in enumerate(serializer.validated_data["messages"]):
+        item_serializer = SendMessageSerializer(data=item)
+        if item_serializer.is_valid():
+            drafts.append((index, item_serializer.validated_data["conversation_id"], item_serializer.validated_data["content"]))
+            results.append(None)
+        else:
+            results.append({
+                "index": index,
+                "status": status.HTTP_400_BAD_REQUEST,
+                "errors": item_serializer.errors,
+            })
+    return results, drafts
+
+
+def drop_throttled_drafts(results, drafts, granted, retry_after):
+    """ Keep the first `granted` drafts; the rest are answered with a 429 of their own. """
+    for index, _, _ in drafts[granted:]:
+        results[index] = {
+            "index": index,
+            "status": status.HTTP_429_TOO_MANY_REQUESTS,
+            "error": "Request was throttled",
+            "retry_after": retry_after,
+        }
+    return drafts[:granted]
+
+
+def create_message_batch(sender, drafts):
+    """ Check membership and insert every draft in one go. """
+    with transaction.atomic():
+        return create_messages(sender, [(conversation_id, content) for _, conversation_id, content in drafts])
+
+
+def message_batch_response(results, drafts, messages):
+    for (index, _, _), message in zip(drafts, messages):
+        if message is None:
+            results[index] = {
+                "index": index,
+                "status": status.HTTP_403_FORBIDDEN,
+                "error": NOT_A_PARTICIPANT,
+            }
+        else:
+            results[index] = {
+                "index": index,
+                "status": status.HTTP_201_CREATED,
+                "message": MessageSerializer(message).data,
+            }
+
+    return Response({"results": results}, status=status.HTTP_207_MULTI_STATUS)
+
+
+def parse_message_page(request):
+    """ The conversation id, cursors and limit of the page of messages asked for. """
+    conversation_id = request.query_params.get("conversation_id")
+
+    if not conversation_id:
+        raise RequestError("conversation_id is required")
+
+    before = request.query_params.get("before")
+    after = request.query_params.get("after")
+    limit = parse_limit(request.query_params.get("limit"))
+    return conversation_id, before, after, limit
+
+
+def is_tail_page(before, after, limit) -> bool:
+    """ Whether the page is the newest one, served from the tail cache. """
+    return not before and not after and limit <= TAIL_SIZE
+
+
+def check_participant(participants, user):
+    if not any(participant.user_id == user.id for participant in participants):
+        raise RequestError(NOT_A_PARTICIPANT, status.HTTP_403_FORBIDDEN)
+
+
+def message_querysets(conversation):
+    """ A conversation's hot messages, and its archive when it has one. """
+    messages_queryset = message_rows(Message.objects.filter(conversation=conversation))
+    # Scrolling past the hot messages falls through to the archive
+    archive_queryset = None
+    if conversation.archived_seq:
+        archive_queryset = message_rows(ArchivedMessage.objects.filter(conversation=conversation))
+    return messages_queryset, archive_queryset
+
+
+def tail_page(tail, limit, archive_queryset):
+    """
+    Serve the newest page from a freshly loaded tail of `TAIL_SIZE + 1` rows.
+
+    Returns the page and its cursors, and whether the tail may be cached.
+    """
+    has_older = len(tail) > limit or archive_queryset is not None
+    messages = tail[-limit:]
+    prev_cursor = encode_cursor(messages[0]) if messages and has_older else None
+    next_cursor = encode_cursor(messages[-1]) if messages else None
+    # A tail cut short by the archive could not tell the cache where history continues
+    cacheable = len(tail) > TAIL_SIZE or archive_queryset is None
+    return (messages, prev_cursor, next_cursor), cacheable
+
+
+def message_page(messages_queryset, archive_queryset, before, after, limit):
+    """ Fetch one page of messages, and its cursors. """
+    try:
+        return paginate_messages(
+            messages_queryset, before=before, after=after, limit=limit, archive=archive_queryset,
+        )
+    except InvalidCursor:
+        raise RequestError("Invalid cursor")
+
+
+def message_page_response(conversation, participants, page):
+    """ Serialize a page into the `ConversationMessagesSerializer` shape. """
+    messages, prev_cursor, next_cursor = page
+    read_watermarks = {participant.user_id: participant.last_read_seq for participant in participants}
+    to_dict = message_mapper(read_watermarks)
+
+    return Response({
+        "conversation_id": str(conversation.id),
+        "messages": [to_dict(message) for message in messages],
+        "prev_cursor": prev_cursor,
+        "next_cursor": next_cursor,
+    }, status=status.HTTP_200_OK)
+
+
+def parse_search(request):
+    """ The query, rank cursor and limit of a search. """
+    serializer = SearchMessagesSerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+
+    cursor = serializer.validated_data.get("cursor")
+    limit = parse_limit(request.query_params.get("limit"))
+    try:
+        after = decode_rank_cursor(cursor) if cursor else None
+    except InvalidCursor:
+        raise RequestError("Invalid cursor")
+
+    return serializer.validated_data["q"], after, limit
+
+
+def search_response(results, limit):
+    """ One page of `limit` results, out of `limit + 1` fetched to know whether another page exists. """
+    page = results[:limit]
+    next_cursor = encode_rank_cursor(page[-1][1], page[-1][0].id) if len(results) > limit else None
+
+    serializer = SearchResultsSerializer({
+        "results": [message for message, _ in page],
+        "next_cursor": next_cursor,
+    })
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+def parse_sync(request):
+    """ The sequence number to fetch changes since. """
+    serializer = SyncQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data["since"]
+
+
+def parse_read(request):
+    """ The conversation id, and the message to mark as read if the caller named one. """
+    serializer = ReadMessagesSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data["conversation_id"], serializer.validated_data.get("message_id")
+
+
+def read_receipt_response(conversation_id, participant):
+    response_serializer = ReadReceiptSerializer({
+        "conversation_id": conversation_id,
+        "last_read_message_id": participant.last_read_message_id,
+        "last_read_at": participant.last_read_at,
+    })
+    return Response(response_serializer.data, status=status.HTTP_200_OK)
+
+
+def parse_presence_query(request):
+    """ The user ids whose presence the caller asked for. """
+    serializer = PresenceQuerySerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data["user_ids"]
+
+
+def presence_response(presence):
+    return Response(
+        {"presence": UserPresenceSerializer(
+            [{"user_id": user_id, **state} for user_id, state in presence.items()], many=True
+        ).data},
+        status=status.HTTP_200_OK
+    )
+
+
 class CreateOrGetChatView(APIView):
     """ View to create or get a one-on-one chat conversation between two users. """
-    
+
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserBurstThrottle, IPRateThrottle]
+    throttle_scope = "create_chat"
 
     def post(self, request):
-        other_user_id = request.data.get("user_id")
-
-        if not other_user_id:
-            return Response(
-                {"error": "user_id is required"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        if str(request.user.id) == str(other_user_id):
-            return Response(
-                {"error": "You cannot chat with yourself"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        other_user_id = parse_chat_partner(request)
 
         try:
             other_user = User.objects.get(id=other_user_id)
         except User.DoesNotExist:
-            return Response(
-                {"error": "User not found"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        # Find existing conversation
-        conversations = Conversation.objects.filter(
-            participants__user=request.user
-        ).filter(
-            participants__user=other_user
-        ).distinct()
-
-        if conversations.exists():
-            conversation = conversations.first()
-            serializer = ConversationSerializer(conversation)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        # Create new conversation
-        conversation = Conversation.objects.create()
-
-        ConversationParticipant.objects.create(
-            conversation=conversation,
-            user=request.user,
-        )
-        ConversationParticipant.objects.create(
-            conversation=conversation,
-            user=other_user,
-        )
+            raise RequestError("User not found", status.HTTP_404_NOT_FOUND)
 
-        serializer = ConversationSerializer(conversation)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        conversation, created = get_or_create_direct_conversation(request.user, other_user)
+        return conversation_response(conversation, created)
 
 
-class GetAllChatsView(APIView):
+class GetAllChatsView(ReplicaReadsMixin, APIView):
     """ View to get all chat conversations for the authenticated user."""
-    
+
     permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(etag(chat_list_etag))
     def get(self, request):
-        user = request.user
+        conversations = list(chat_list_queryset(request.user))
 
-        conversations = Conversation.objects.filter(
-            participants__user=user
-        ).distinct()
-
-        chat_list = []
-
-        for convo in conversations:
-            # Get other participant
-            other_participant = convo.participants.exclude(user=user).first()
-            other_user = other_participant.user if other_participant else None
-
-            # Latest message
-            latest_message = convo.messages.order_by("-timestamp").first()
-
-            # Unread count
-            unread_count = convo.messages.filter(
-                receiver=user,
-                is_read=False
-            ).count()
-
-            chat_list.append({
-                "conversation_id": convo.id,
-                "user": ChatUserSerializer(other_user).data,
-                "conversation": {
-                    "latest_message": (
-                        LatestMessageSerializer(latest_message).data
-                        if latest_message else None
-                    ),
-                    "unread_count": unread_count,
-                },
-            })
+        # Bulk load the related users and messages as plain rows
+        user_ids = {convo["other_user_id"] for convo in conversations if convo["other_user_id"]}
+        message_ids = {convo["latest_message_id"] for convo in conversations if convo["latest_message_id"]}
+        users = {row.id: row for row in user_rows(User.objects.filter(id__in=user_ids))}
+        latest_messages = {row.id: row for row in message_rows(Message.objects.filter(id__in=message_ids))}
 
-        serializer = ChatListSerializer(chat_list, many=True)
-        return Response(serializer.data)
+        presence = get_presence(users.keys())
+        return Response(build_chat_list(conversations, users, latest_messages, presence))
 
 class SendMessageView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserBurstThrottle, IPRateThrottle]
+    throttle_scope = "send_message"
 
     def post(self, request):
-        serializer = SendMessageSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-
-        conversation_id = serializer.validated_data["conversation_id"]
-        content = serializer.validated_data["content"]
+        conversation_id, content = parse_message(request.data)
         sender = request.user
 
+        if is_stream_mode():
+            return self.accept_to_stream(conversation_id, sender, content)
+
         # Get conversation
         conversation = get_object_or_404(Conversation, id=conversation_id)
 
@@ -136,84 +467,139 @@ class SendMessageView(APIView):
             conversation=conversation,
             user=sender
         ).exists():
-            return Response(
-                {"error": "You are not a participant of this conversation"},
-                status=status.HTTP_403_FORBIDDEN
-            )
+            raise RequestError(NOT_A_PARTICIPANT, status.HTTP_403_FORBIDDEN)
 
-        # Find receiver (other participant)
-        receiver = (
-            ConversationParticipant.objects
-            .filter(conversation=conversation)
-            .exclude(user=sender)
-            .first()
-            .user
-        )
+        # Create message and push it to the conversation's subscribers
+        message = create_message(conversation, sender, content)
+        return message_response(message, status.HTTP_201_CREATED)
 
-        # Create message
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=sender,
-            receiver=receiver,
-            content=content,
-            is_read=False,
+    def accept_to_stream(self, conversation_id, sender, content):
+        """ Write-behind path: one membership read and one XADD, persisted and broadcast later by Celery. """
+        user_ids = list(
+            ConversationParticipant.objects
+            .filter(conversation_id=conversation_id)
+            .values_list("user_id", flat=True)
         )
+        receiver_id = stream_receiver_id(user_ids, sender)
 
-        # Serialize response
-        response_serializer = MessageSerializer(message)
+        message = enqueue_message(conversation_id, sender, receiver_id, content)
+        return message_response(message, status.HTTP_202_ACCEPTED)
 
-        return Response(
-            response_serializer.data,
-            status=status.HTTP_201_CREATED
-        )
 
+class SendMessageBatchView(PerItemThrottleMixin, APIView):
+    """ View to send many messages at once, e.g. when replaying an offline queue. """
 
-class GetMessagesView(APIView):
     permission_classes = [IsAuthenticated]
+    # Each message is charged like a single send
+    throttle_classes = [UserBurstThrottle, IPRateThrottle]
+    throttle_scope = "send_message"
 
-    def get(self, request):
-        conversation_id = request.query_params.get("conversation_id")
+    def post(self, request):
+        results, drafts = parse_message_batch(request.data)
+        granted, retry_after = self.throttle_items(request, len(drafts))
+        drafts = drop_throttled_drafts(results, drafts, granted, retry_after)
+        messages = create_message_batch(request.user, drafts)
+        return message_batch_response(results, drafts, messages)
 
-        if not conversation_id:
-            return Response(
-                {"error": "conversation_id is required"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
 
+class GetMessagesView(ReplicaReadsMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(etag(message_list_etag))
+    def get(self, request):
+        conversation_id, before, after, limit = parse_message_page(request)
         user = request.user
 
+        # The newest page of an active conversation is served from the tail cache
+        generation = None
+        if is_tail_page(before, after, limit):
+            cached, generation = read_tail(conversation_id, user.id, limit)
+            if cached is not None:
+                return Response(cached, status=status.HTTP_200_OK)
+            # A replica may be behind the generation just read, and the
+            # tail it fills would be served with a gap until it expires
+            read_from_primary()
+
         # Get conversation
         conversation = get_object_or_404(Conversation, id=conversation_id)
 
+        # Check participation and collect read watermarks
+        participants = list(ConversationParticipant.objects.filter(conversation=conversation))
+        check_participant(participants, user)
+
+        messages_queryset, archive_queryset = message_querysets(conversation)
+        if generation is not None:
+            # Cache miss: load the whole tail once, serve the page from it
+            tail = list(messages_queryset.order_by("-seq")[:TAIL_SIZE + 1])[::-1]
+            page, cacheable = tail_page(tail, limit, archive_queryset)
+            if cacheable:
+                fill_tail(conversation.id, tail, participants, generation)
+        else:
+            page = message_page(messages_queryset, archive_queryset, before, after, limit)
+
+        return message_page_response(conversation, participants, page)
+
+
+class SearchMessagesView(APIView):
+    """ View to full-text search the messages of the authenticated user's conversations. """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query, after, limit = parse_search(request)
+        results = search_messages(request.user, query, after=after, limit=limit + 1)
+        return search_response(results, limit)
+
+
+class SyncView(APIView):
+    """ View to fetch the authenticated user's changes since a sequence number. """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        changes = get_changes(request.user, parse_sync(request))
+        return Response(changes, status=status.HTTP_200_OK)
+
+
+class ReadMessagesView(APIView):
+    """ View to advance the authenticated user's read watermark in a conversation. """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        conversation_id, message_id = parse_read(request)
+
         # Check participation
-        if not ConversationParticipant.objects.filter(
-            conversation=conversation,
-            user=user
-        ).exists():
-            return Response(
-                {"error": "You are not a participant of this conversation"},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        # Fetch messages
-        messages = (
-            Message.objects
-            .filter(conversation=conversation)
-            .select_related("sender")
-            .order_by("timestamp")
+        participant = (
+            ConversationParticipant.objects
+            .filter(conversation_id=conversation_id, user=request.user)
+            .first()
         )
-        
-        # Mark unread messages as read
-        Message.objects.filter(
-            conversation=conversation,
-            receiver=user,
-            is_read=False
-        ).update(is_read=True)
+        if participant is None:
+            raise RequestError(NOT_A_PARTICIPANT, status.HTTP_403_FORBIDDEN)
 
-        # Serialize
-        serializer = ConversationMessagesSerializer({
-            "conversation_id": conversation.id,
-            "messages": messages
-        })
+        # Defaults to the latest message of the conversation
+        messages = Message.objects.filter(conversation_id=conversation_id)
+        if message_id:
+            message = get_object_or_404(messages, id=message_id)
+        else:
+            message = messages.order_by("-seq").first()
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if message:
+            advance_read_watermark(participant, message)
+
+        return read_receipt_response(conversation_id, participant)
+
+
+class PresenceView(APIView):
+    """ View to look up the presence of many of the caller's contacts at once. """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        # Users the caller shares no conversation with are left out
+        presence = get_presence(contact_ids(request.user, parse_presence_query(request)))
+        return presence_response(presence)
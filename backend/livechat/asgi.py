@@ -10,14 +10,21 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 import os
 
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-import chat.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'livechat.settings')
 
+# Initialize Django before importing consumers that touch the ORM
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from accounts.middleware import JWTAuthMiddleware
+import chat.routing
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": URLRouter(
-        chat.routing.websocket_urlpatterns
-    ),  
+    "http": django_asgi_app,
+    "websocket": JWTAuthMiddleware(
+        URLRouter(
+            chat.routing.websocket_urlpatterns
+        )
+    ),
 })
\ No newline at end of file
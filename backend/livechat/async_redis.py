@@ -0,0 +1,24 @@
+import asyncio
+import weakref
+from django.conf import settings
+from redis.asyncio import Redis
+
+# One client per event loop: a connection belongs to the loop that opened it
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis_connection() -> Redis:
+    """
+    Return an asyncio Redis client for the running event loop.
+
+    The asyncio counterpart of `django_redis.get_redis_connection("default")`:
+    same server and database as the default cache, raw keys, bytes replies.
+
+    Returns:
+        redis.asyncio.Redis: A client whose pool is bound to the running loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = Redis.from_url(settings.CACHES["default"]["LOCATION"])
+    return client
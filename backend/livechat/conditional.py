@@ -0,0 +1,55 @@
+from functools import wraps
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+SUCCESS = 200
+
+
+def _conditional(request, res_etag):
+    """ Answer 304/412 early when the client's copy matches `res_etag`. """
+    res_etag = quote_etag(res_etag) if res_etag is not None else None
+    return res_etag, get_conditional_response(request, etag=res_etag)
+
+
+def _tag(request, response, res_etag):
+    # Errors never carry a validator, so they cannot be replayed as a 304 later
+    if request.method in ("GET", "HEAD") and res_etag and response.status_code == SUCCESS:
+        response.headers.setdefault("ETag", res_etag)
+    return response
+
+
+def etag(etag_func):
+    """
+    `django.views.decorators.http.etag` that only tags 200 responses.
+
+    `etag_func` returns None when it cannot vouch for the caller, e.g. a
+    user who may not read the resource; the view then runs unconditionally
+    and answers with its own error.
+    """
+    def decorator(func):
+        @wraps(func)
+        def inner(request, *args, **kwargs):
+            res_etag, response = _conditional(request, etag_func(request, *args, **kwargs))
+            if response is None:
+                response = func(request, *args, **kwargs)
+            return _tag(request, response, res_etag)
+        return inner
+    return decorator
+
+
+def async_etag(etag_func):
+    """
+    `etag` for async handlers.
+
+    `etag_func` is a coroutine too, so computing the ETag never blocks the
+    event loop.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            res_etag, response = _conditional(request, await etag_func(request, *args, **kwargs))
+            if response is None:
+                response = await func(request, *args, **kwargs)
+            return _tag(request, response, res_etag)
+        return inner
+    return decorator
@@ -0,0 +1,124 @@
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django_redis import get_redis_connection
+from rest_framework.permissions import SAFE_METHODS
+from livechat.async_redis import get_async_redis_connection
+
+PRIMARY = "default"
+
+# Routing state of the request being served; None outside of requests, so
+# Celery tasks, consumers and management commands always use the primary
+_routing = ContextVar("db_routing", default=None)
+
+
+class RoutingState:
+    """ What the router may do for one request. Mutated in place, so worker threads share it. """
+
+    def __init__(self):
+        self.reader_id = None    # user whose reads may go to a replica
+        self.pinned = None       # looked up on the first read only
+        self.wrote = False
+
+
+def pin_key(user_id) -> str:
+    return f"db:pin:{user_id}"
+
+
+def pin_to_primary(user_ids) -> None:
+    """
+    Keep the given users' reads on the primary for `DATABASE_PIN_SECONDS`.
+
+    Called after a user's own write, and for everyone whose data a write
+    changed, so nobody reads a replica that has not caught up with it yet.
+
+    Args:
+        user_ids (Iterable[int]): Users to pin.
+
+    Returns:
+        None
+    """
+    if not settings.DATABASE_REPLICAS:
+        return
+
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    for user_id in set(user_ids):
+        pipe.set(pin_key(user_id), 1, ex=settings.DATABASE_PIN_SECONDS)
+    pipe.execute()
+
+
+async def apin_to_primary(user_ids) -> None:
+    """ Async version of `pin_to_primary`, on the asyncio Redis client. """
+    if not settings.DATABASE_REPLICAS:
+        return
+
+    async with get_async_redis_connection().pipeline(transaction=False) as pipe:
+        for user_id in set(user_ids):
+            pipe.set(pin_key(user_id), 1, ex=settings.DATABASE_PIN_SECONDS)
+        await pipe.execute()
+
+
+def is_pinned(user_id) -> bool:
+    return bool(get_redis_connection("default").exists(pin_key(user_id)))
+
+
+def read_from_primary() -> None:
+    """ Send the remaining reads of the current request to the primary. """
+    state = _routing.get()
+    if state is not None:
+        state.reader_id = None
+
+
+class ReplicaRouter:
+    """
+    Send the reads of opted-in views to a replica, everything else to the primary.
+
+    A request reads from a replica only when its view uses `ReplicaReadsMixin`,
+    the method is safe and the user is not pinned. Once a request writes,
+    or inside a transaction on the primary, reads go to the primary too.
+    The pin is looked up on the first read, so requests answered from Redis
+    alone (304s, the message tail cache) pay nothing for it.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state.reader_id is None or state.wrote or not settings.DATABASE_REPLICAS:
+            return None
+        if connections[PRIMARY].in_atomic_block:
+            return None
+        if state.pinned is None:
+            state.pinned = is_pinned(state.reader_id)
+        return None if state.pinned else random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReadsMixin:
+    """
+    Opt a read-heavy API view into replica reads.
+
+    Decided after authentication, since a user who just wrote is pinned to
+    the primary. Works for both `APIView` and `AsyncAPIView`.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.allow_replica_reads(request)
+
+    async def ainitial(self, request, *args, **kwargs):
+        await super().ainitial(request, *args, **kwargs)
+        self.allow_replica_reads(request)
+
+    def allow_replica_reads(self, request):
+        state = _routing.get()
+        if state is not None and request.method in SAFE_METHODS and request.user.is_authenticated:
+            state.reader_id = request.user.id
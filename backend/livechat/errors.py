@@ -0,0 +1,18 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class RequestError(APIException):
+    """
+    An API error answered with the usual `{"error": ...}` body.
+
+    Lets the request parsing shared by a sync view and its async twin stop
+    the request from a plain function.
+    """
+
+    status_code = status.HTTP_400_BAD_REQUEST
+
+    def __init__(self, error, status_code=None):
+        super().__init__({"error": error})
+        if status_code is not None:
+            self.status_code = status_code
@@ -0,0 +1,56 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from rest_framework.permissions import SAFE_METHODS
+from .db_router import RoutingState, _routing, apin_to_primary, pin_to_primary
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Give each request its own database routing state, and pin writers.
+
+    After a successful unsafe request the user reads from the primary for a
+    while, so they see their own write even when it was queued (stream
+    ingestion) or a replica is behind.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = _routing.set(RoutingState())
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if self.wrote(request, response):
+            pin_to_primary([request.user.id])
+        return response
+
+    async def __acall__(self, request):
+        token = _routing.set(RoutingState())
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if self.wrote(request, response):
+            await apin_to_primary([request.user.id])
+        return response
+
+    def wrote(self, request, response) -> bool:
+        # DRF copies the authenticated user onto the Django request
+        user = getattr(request, "user", None)
+        return (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        )
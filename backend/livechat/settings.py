@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from datetime import timedelta
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -62,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'livechat.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -97,6 +98,16 @@ DATABASES = {
     }
 }
 
+# Read replicas of `default`, e.g. DATABASE_REPLICAS=replica.sqlite3 locally.
+# Views with ReplicaReadsMixin read from them; writes, and a user's reads for
+# DATABASE_PIN_SECONDS after a change that concerns them, stay on `default`
+DATABASE_REPLICAS = []
+for index, name in enumerate(config('DATABASE_REPLICAS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'NAME': BASE_DIR / name, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{index}')
+DATABASE_PIN_SECONDS = config('DATABASE_PIN_SECONDS', default=5, cast=int)
+DATABASE_ROUTERS = ['livechat.db_router.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -140,10 +151,21 @@ AUTH_USER_MODEL = "accounts.User"
 # JWT Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'accounts.authentication.CachedJWTAuthentication',
+    ),
+    # "<throttle_scope>.<user|ip>" rates for accounts.throttles
+    'DEFAULT_THROTTLE_RATES': {
+        'send_message.user': '60/min',
+        'send_message.ip': '600/min',
+        'create_chat.user': '20/min',
+        'create_chat.ip': '200/min',
+    },
 }
 
+# Serve the chat and accounts APIs with the coroutine views in
+# <app>/async_views.py instead of the thread-pool views in <app>/views.py
+API_ASYNC_VIEWS = config('API_ASYNC_VIEWS', default=False, cast=bool)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=7),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
@@ -168,9 +190,58 @@ CACHES = {
     }
 }
 
+# Channels configuration
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": [config('REDIS_URL')],
+        },
+    }
+}
+
 # Celery configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND')
+CELERY_BEAT_SCHEDULE = {
+    "recover-message-stream": {
+        "task": "chat.tasks.recover_message_stream",
+        "schedule": 60.0,
+    },
+    "compact-sync-log": {
+        "task": "chat.tasks.compact_sync_log",
+        "schedule": 3600.0,
+    },
+    "archive-cold-messages": {
+        "task": "chat.tasks.archive_cold_messages",
+        "schedule": 300.0,
+    },
+    "sweep-presence": {
+        "task": "chat.tasks.sweep_presence",
+        "schedule": 10.0,
+    },
+    "deliver-otp-emails": {
+        "task": "accounts.tasks.deliver_otp_emails",
+        "schedule": 5.0,
+    },
+}
+# OTP mail has its own workers, so logins never wait behind batch jobs
+CELERY_TASK_ROUTES = {
+    "accounts.tasks.deliver_otp_emails": {"queue": "otp"},
+}
+
+# Message ingestion: "sync" writes messages in the request, "stream" appends
+# them to a Redis Stream that Celery drains into the database in batches
+CHAT_INGESTION_MODE = config('CHAT_INGESTION_MODE', default='sync')
+CHAT_INGESTION_STREAM = config('CHAT_INGESTION_STREAM', default='chat:ingest')
+if CHAT_INGESTION_MODE == 'stream':
+    CELERY_BEAT_SCHEDULE["drain-message-stream"] = {
+        "task": "chat.tasks.drain_message_stream",
+        "schedule": 1.0,
+    }
+
+# Messages older than this many days move to the compressed archive table
+CHAT_ARCHIVE_AFTER_DAYS = config('CHAT_ARCHIVE_AFTER_DAYS', default=180, cast=int)
 
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [